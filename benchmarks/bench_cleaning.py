@@ -0,0 +1,84 @@
+"""Rows/second of the text cleaning paths.
+
+Compares the original per-row `Series.apply` loop against the vectorized and
+multi-process paths in cleaning.py, plus re-cleaning an already clean column.
+
+    python -m benchmarks.bench_cleaning --rows 2000000 --workers 8
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+
+import pandas as pd
+
+from cleaning import clean_series, clean_series_parallel
+
+WORDS = ["stocks", "rally", "as", "oil", "prices", "fall", "Reuters", "AP", "the", "league", "wins",
+         "final", "NASA", "launches", "new", "satellite", "quarter", "profit", "rises", "Microsoft"]
+NOISE = ["--", "(AFP)", "$12.5", "&amp;", "#39;s", "2004", "  ", "\t", "...", "U.S."]
+
+
+# The per-row implementation the script used before cleaning.py
+def legacy_clean_text(text):
+    text = re.sub(r"[^a-zA-Z\s]", "", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.lower()
+
+
+def synthetic_descriptions(rows, seed=0):
+    rng = random.Random(seed)
+    # Build a pool of distinct rows and tile it, generating millions of strings in Python is slow
+    pool = []
+    for _ in range(min(rows, 50_000)):
+        tokens = [rng.choice(WORDS) if rng.random() > 0.2 else rng.choice(NOISE) for _ in range(rng.randint(10, 40))]
+        pool.append(" ".join(tokens))
+    return pd.Series((pool * (rows // len(pool) + 1))[:rows])
+
+
+def measure(name, fn, series):
+    start = time.perf_counter()
+    result = fn(series)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {len(series) / elapsed:>14,.0f} rows/s  ({elapsed:.2f}s)")
+    return result, {'name': name, 'rows': len(series), 'seconds': elapsed, 'rows_per_second': len(series) / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--output', default=None, help="optional JSON file for the results")
+    args = parser.parse_args()
+
+    series = synthetic_descriptions(args.rows)
+    print(f"Cleaning {len(series):,} rows")
+
+    results = []
+    expected, result = measure("apply (legacy)", lambda s: s.apply(legacy_clean_text), series)
+    results.append(result)
+    vectorized, result = measure("vectorized", clean_series, series)
+    results.append(result)
+    parallel, result = measure("vectorized + processes",
+                               lambda s: clean_series_parallel(s, workers=args.workers, chunksize=args.chunksize),
+                               series)
+    results.append(result)
+    _, result = measure("re-clean (skipped)", clean_series, vectorized)
+    results.append(result)
+
+    assert vectorized.equals(expected) and parallel.equals(expected), "cleaning paths disagree"
+
+    baseline = results[0]['rows_per_second']
+    for result in results[1:]:
+        print(f"{result['name']:<24} {result['rows_per_second'] / baseline:>8.1f}x vs apply")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Data-parallel training throughput vs. number of processes.
+
+Trains a tiny randomly initialized HybridClassifier on synthetic data with
+1, 2, 4, ... gloo processes (cores split evenly between them) and reports
+samples/sec, speedup and scaling efficiency. The batch size is per process,
+so the global batch grows with the process count.
+
+    python -m benchmarks.bench_distributed --rows 8000 --processes 1 2 4 --output distributed_scaling.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from benchmarks.synthetic import tiny_bert_config, tiny_tokenizer, write_synthetic_csv
+from cleaning import clean_series
+from data import TextDataset
+from distributed import available_cpus, launch, train_worker
+from tokenization import tokenize_texts
+
+
+def synthetic_datasets(workdir, rows, max_length, seed=0, val_fraction=0.1):
+    frame = pd.read_csv(write_synthetic_csv(os.path.join(workdir, 'synthetic.csv'), rows, seed=seed))
+    tokenizer = tiny_tokenizer(os.path.join(workdir, 'tokenizer'))
+    inputs = tokenize_texts(tokenizer, clean_series(frame['Description']).tolist(), max_length=max_length)
+    # Synthetic labels are 1..4, the model predicts 0..3
+    labels = (frame['Class Index'] - 1).tolist()
+    split = int(rows * (1 - val_fraction))
+    train = TextDataset({key: value[:split] for key, value in inputs.items()}, labels[:split])
+    val = TextDataset({key: value[split:] for key, value in inputs.items()}, labels[split:])
+    return train, val, tokenizer.vocab_size
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        train, val, vocab_size = synthetic_datasets(workdir, args.rows, args.max_length, seed=args.seed)
+    config = tiny_bert_config(vocab_size, hidden_size=args.hidden_size, num_layers=args.layers,
+                              max_length=args.max_length)
+
+    results = []
+    for processes in args.processes:
+        history = launch(train_worker, processes, args=(train, val, 4),
+                         kwargs={'config': config, 'epochs': args.epochs, 'batch_size': args.batch_size,
+                                 'seed': args.seed})
+        report = history[-1]
+        results.append({
+            'processes': processes,
+            'threads_per_rank': report['threads_per_rank'],
+            'samples_per_second': report['samples_per_second'],
+            'epoch_seconds': report['seconds'],
+            'loss': report['loss'],
+            'val_accuracy': report['val_accuracy'],
+        })
+        print(json.dumps(results[-1]))
+
+    base = results[0]['samples_per_second'] / results[0]['processes']
+    for result in results:
+        result['speedup'] = result['samples_per_second'] / results[0]['samples_per_second']
+        result['efficiency'] = result['samples_per_second'] / (base * result['processes'])
+    return {'cpus': available_cpus(), 'config': vars(args), 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=8_000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=16, help="per process")
+    parser.add_argument('--max-length', type=int, default=64)
+    parser.add_argument('--hidden-size', type=int, default=64)
+    parser.add_argument('--layers', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    report = run(args)
+    print(f"\n{'processes':>9} {'threads':>7} {'samples/s':>10} {'speedup':>8} {'efficiency':>10}")
+    for result in report['results']:
+        print(f"{result['processes']:>9} {result['threads_per_rank']:>7} {result['samples_per_second']:>10.1f} "
+              f"{result['speedup']:>7.2f}x {result['efficiency']:>9.0%}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Cold start and steady-state throughput: eager HybridClassifier vs TorchScript artifact.
+
+Cold start is the wall time of a fresh Python process that loads the model and
+returns its first prediction. Steady state is rows/second over repeated batches.
+
+    python export.py --checkpoint hybrid_classifier_model.pt --output-dir hybrid_classifier_ts
+    python -m benchmarks.bench_export --checkpoint hybrid_classifier_model.pt --artifact hybrid_classifier_ts
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import torch
+
+from benchmarks.loadgen import SAMPLE_TEXTS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EAGER_STARTUP = """
+import time
+start = time.perf_counter()
+import torch
+from transformers import AutoTokenizer
+from model import load_hybrid_classifier
+model = load_hybrid_classifier({checkpoint!r}, {num_classes}, bert_model_name={bert_model!r})
+tokenizer = AutoTokenizer.from_pretrained({bert_model!r})
+inputs = tokenizer(["first prediction"], return_tensors='pt')
+with torch.inference_mode():
+    model(input_ids=inputs['input_ids'], attention_mask=inputs['attention_mask'])
+print(time.perf_counter() - start)
+"""
+
+COMPILED_STARTUP = """
+import time
+start = time.perf_counter()
+from compiled import CompiledClassifier
+model = CompiledClassifier({artifact!r})
+model.predict_proba(["first prediction"])
+print(time.perf_counter() - start)
+"""
+
+
+# Wall time of a fresh interpreter running `script`, including the interpreter start
+def cold_start(script, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', script], cwd=REPO_ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        timings.append({'process_seconds': time.perf_counter() - start,
+                        'load_and_first_prediction_seconds': float(output.strip().splitlines()[-1])})
+    return min(timings, key=lambda timing: timing['process_seconds'])
+
+
+def steady_state(predict, batch_size, batches):
+    texts = (SAMPLE_TEXTS * (batch_size // len(SAMPLE_TEXTS) + 1))[:batch_size]
+    predict(texts)  # warm-up
+    start = time.perf_counter()
+    for _ in range(batches):
+        predict(texts)
+    return batch_size * batches / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='hybrid_classifier_model.pt')
+    parser.add_argument('--artifact', default='hybrid_classifier_ts')
+    parser.add_argument('--num-classes', type=int, default=4)
+    parser.add_argument('--bert-model', default='bert-base-uncased')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--startup-repeats', type=int, default=3)
+    parser.add_argument('--output', default=None, help="optional JSON file for the results")
+    args = parser.parse_args()
+
+    checkpoint, artifact = os.path.abspath(args.checkpoint), os.path.abspath(args.artifact)
+    report = {
+        'eager_cold_start': cold_start(EAGER_STARTUP.format(checkpoint=checkpoint, num_classes=args.num_classes,
+                                                            bert_model=args.bert_model), args.startup_repeats),
+        'compiled_cold_start': cold_start(COMPILED_STARTUP.format(artifact=artifact), args.startup_repeats),
+    }
+
+    from transformers import AutoTokenizer
+    from text_cleaning import clean_text
+    from compiled import CompiledClassifier
+    from model import load_hybrid_classifier
+
+    eager_model = load_hybrid_classifier(checkpoint, args.num_classes, bert_model_name=args.bert_model)
+    tokenizer = AutoTokenizer.from_pretrained(args.bert_model)
+    compiled_model = CompiledClassifier(artifact)
+
+    def eager_predict(texts):
+        # Same padding as the compiled artifact so both see identical shapes
+        inputs = tokenizer([clean_text(text) for text in texts], padding='max_length', truncation=True,
+                           max_length=compiled_model.max_length, return_tensors='pt')
+        with torch.inference_mode():
+            return eager_model(input_ids=inputs['input_ids'], attention_mask=inputs['attention_mask'])
+
+    report['eager_rows_per_second'] = steady_state(eager_predict, args.batch_size, args.batches)
+    report['compiled_rows_per_second'] = steady_state(compiled_model.predict_logits, args.batch_size, args.batches)
+    report['cold_start_speedup'] = (report['eager_cold_start']['process_seconds']
+                                    / report['compiled_cold_start']['process_seconds'])
+    report['throughput_speedup'] = report['compiled_rows_per_second'] / report['eager_rows_per_second']
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Peak memory and step time of HybridClassifier training per configuration.
+
+Every (batch size, configuration) pair runs a few training steps in a fresh
+process, so the peak resident set size on CPU belongs to that pair alone.
+Configurations are full fine-tuning, activation checkpointing, training only
+the top `--trainable-layers` encoder layers, and both together. With
+`--budget-mb` the largest batch size within the budget is printed for each
+configuration.
+
+    python -m benchmarks.bench_memory --bert-model bert-base-uncased --batch-sizes 16 32 64 128 --budget-mb 12000
+    python -m benchmarks.bench_memory --batch-sizes 32 64 --steps 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+CONFIGURATIONS = {
+    'full': {'activation_checkpointing': False, 'freeze': False},
+    'checkpointing': {'activation_checkpointing': True, 'freeze': False},
+    'frozen': {'activation_checkpointing': False, 'freeze': True},
+    'checkpointing+frozen': {'activation_checkpointing': True, 'freeze': True},
+}
+
+
+# Runs in its own process: build the model and data, then time `steps` optimizer steps
+def measure(name, batch_size, args):
+    import torch
+
+    from benchmarks.synthetic import synthetic_frame, tiny_bert_config, tiny_tokenizer
+    from freezing import FreezeSchedule, set_activation_checkpointing, trainable_parameter_count
+    from model import HybridClassifier
+    from tokenization import tokenize_texts
+    from training import peak_memory_mb, reset_peak_memory
+
+    torch.manual_seed(0)
+    if args['threads']:
+        torch.set_num_threads(args['threads'])
+    device = torch.device('cuda' if torch.cuda.is_available() and not args['cpu'] else 'cpu')
+    if args['bert_model']:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args['bert_model'])
+        model = HybridClassifier(4, bert_model_name=args['bert_model'])
+    else:
+        tokenizer = tiny_tokenizer(tempfile.mkdtemp(prefix='bench-tokenizer-'))
+        model = HybridClassifier(4, config=tiny_bert_config(tokenizer.vocab_size, hidden_size=args['hidden_size'],
+                                                            num_layers=args['layers'],
+                                                            max_length=args['max_length']))
+    model.to(device).train()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=5e-5)
+    configuration = CONFIGURATIONS[name]
+    set_activation_checkpointing(model, configuration['activation_checkpointing'])
+    if configuration['freeze']:
+        FreezeSchedule({0: args['trainable_layers']}).apply(model, optimizer, 0)
+
+    # Padded to max_length so every step sees the same shapes
+    frame = synthetic_frame(batch_size, seed=0, min_words=args['max_length'], max_words=args['max_length'])
+    inputs = tokenize_texts(tokenizer, frame['Description'].tolist(), max_length=args['max_length'])
+    input_ids, attention_mask = inputs['input_ids'].to(device), inputs['attention_mask'].to(device)
+    labels = torch.as_tensor((frame['Class Index'] - 1).tolist(), device=device)
+    criterion = torch.nn.CrossEntropyLoss()
+
+    reset_peak_memory(device)
+    setup_mb = peak_memory_mb(device)
+    timings = []
+    for index in range(args['steps'] + args['warmup']):
+        start = time.perf_counter()
+        loss = criterion(model(input_ids=input_ids, attention_mask=attention_mask), labels)
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        if index >= args['warmup']:
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        'configuration': name,
+        'batch_size': batch_size,
+        'trainable_parameters': trainable_parameter_count(model),
+        'setup_memory_mb': setup_mb,
+        'peak_memory_mb': peak_memory_mb(device),
+        'step_ms_p50': timings[len(timings) // 2] * 1000,
+        'samples_per_second': batch_size / (sum(timings) / len(timings)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[16, 32, 64])
+    parser.add_argument('--configurations', nargs='+', choices=list(CONFIGURATIONS), default=list(CONFIGURATIONS))
+    parser.add_argument('--trainable-layers', type=int, default=4, help="top encoder layers trained when frozen")
+    parser.add_argument('--bert-model', default=None, help="pretrained model; default: tiny random BERT (offline)")
+    parser.add_argument('--hidden-size', type=int, default=256)
+    parser.add_argument('--layers', type=int, default=6)
+    parser.add_argument('--max-length', type=int, default=128)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--cpu', action='store_true', help="run on CPU even if CUDA is available")
+    parser.add_argument('--budget-mb', type=float, default=None, help="print the largest batch within this peak")
+    parser.add_argument('--output', default=None, help="optional JSON file for the results")
+    args = parser.parse_args()
+
+    # A spawned process per measurement, so CPU peak RSS does not carry over between runs
+    context = multiprocessing.get_context('spawn')
+    worker_args = {key: value for key, value in vars(args).items() if key != 'output'}
+    results = []
+    print(f"{'configuration':<22} {'batch':>6} {'peak MB':>9} {'step ms':>9} {'samples/s':>10} {'trainable':>10}")
+    for name in args.configurations:
+        for batch_size in args.batch_sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                try:
+                    result = pool.submit(measure, name, batch_size, worker_args).result()
+                except Exception as error:
+                    # Out of memory (or killed by the OOM killer): larger batches will not fit either
+                    print(f"{name:<22} {batch_size:>6} failed: {error!r}")
+                    break
+            results.append(result)
+            print(f"{name:<22} {batch_size:>6} {result['peak_memory_mb']:>9.0f} {result['step_ms_p50']:>9.1f} "
+                  f"{result['samples_per_second']:>10.1f} {result['trainable_parameters'] / 1e6:>9.1f}M")
+
+    if args.budget_mb is not None:
+        for name in args.configurations:
+            fitting = [result['batch_size'] for result in results
+                       if result['configuration'] == name and result['peak_memory_mb'] <= args.budget_mb]
+            print(f"{name:<22} largest batch within {args.budget_mb:.0f} MB: {max(fitting) if fitting else 'none'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
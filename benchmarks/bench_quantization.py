@@ -0,0 +1,116 @@
+"""fp32 vs dynamic int8 HybridClassifier on CPU.
+
+Reports throughput, per-batch latency and the accuracy/precision/recall/F1
+delta on the test CSV, and optionally saves the quantized artifact.
+
+    python -m benchmarks.bench_quantization --checkpoint hybrid_classifier_model.pt \
+        --test-csv "/content/test (1).csv" --save-quantized hybrid_classifier_int8.pt
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from transformers import AutoTokenizer
+
+from data import DynamicPaddingCollator, LengthBucketSampler, load_csv_dataset, sequence_lengths
+from evaluation import compute_metrics
+from model import get_logits, load_hybrid_classifier
+from quantize import load_quantized, quantize_model, save_quantized
+
+
+def model_size_mb(model):
+    path = f".size_probe_{os.getpid()}.pt"
+    torch.save(model.state_dict(), path)
+    size = os.path.getsize(path) / 2 ** 20
+    os.remove(path)
+    return size
+
+
+# Predictions plus wall-clock latency of every batch
+def timed_predictions(model, loader, warmup_batches=2):
+    model.eval()
+    latencies, all_preds, all_labels, timed_rows = [], [], [], 0
+    with torch.inference_mode():
+        for index, batch in enumerate(loader):
+            start = time.perf_counter()
+            outputs = get_logits(model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask']))
+            preds = outputs.argmax(dim=1)
+            if index >= warmup_batches:
+                latencies.append(time.perf_counter() - start)
+                timed_rows += preds.size(0)
+            all_preds.append(preds)
+            all_labels.append(batch['labels'])
+    return torch.cat(all_labels).numpy(), torch.cat(all_preds).numpy(), latencies, timed_rows
+
+
+def benchmark(name, model, loader, num_classes):
+    labels, preds, latencies, timed_rows = timed_predictions(model, loader)
+    metrics = compute_metrics(labels, preds, num_classes=num_classes)
+    result = {
+        'name': name,
+        'size_mb': model_size_mb(model),
+        'rows_per_second': timed_rows / sum(latencies) if latencies else 0.0,
+        'batch_latency_p50_ms': float(np.percentile(latencies, 50) * 1000) if latencies else 0.0,
+        'batch_latency_p99_ms': float(np.percentile(latencies, 99) * 1000) if latencies else 0.0,
+        **{key: metrics[key] for key in ('accuracy', 'precision_weighted', 'recall_weighted', 'f1_weighted')},
+    }
+    print(f"{name:<6} {result['rows_per_second']:>9.1f} rows/s  p50 {result['batch_latency_p50_ms']:.1f} ms  "
+          f"p99 {result['batch_latency_p99_ms']:.1f} ms  acc {result['accuracy']:.4f}  "
+          f"f1 {result['f1_weighted']:.4f}  {result['size_mb']:.0f} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='hybrid_classifier_model.pt')
+    parser.add_argument('--test-csv', default='/content/test (1).csv')
+    parser.add_argument('--num-classes', type=int, default=4)
+    parser.add_argument('--bert-model', default='bert-base-uncased')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-length', type=int, default=128)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--save-quantized', default=None, help="write the int8 artifact to this path")
+    parser.add_argument('--output', default=None, help="optional JSON file for the results")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.bert_model)
+    # Class Index is 1..4, the model predicts 0..3
+    dataset = load_csv_dataset(args.test_csv, tokenizer, max_length=args.max_length, label_offset=1)
+    sampler = LengthBucketSampler(sequence_lengths(dataset.inputs), batch_size=args.batch_size, shuffle=False)
+    loader = DataLoader(dataset, batch_sampler=sampler,
+                        collate_fn=DynamicPaddingCollator(tokenizer.pad_token_id, args.max_length))
+
+    fp32_model = load_hybrid_classifier(args.checkpoint, args.num_classes, bert_model_name=args.bert_model)
+    fp32 = benchmark('fp32', fp32_model, loader, args.num_classes)
+
+    int8_model = quantize_model(fp32_model)
+    if args.save_quantized:
+        # Round-trip through the saved artifact so the numbers describe what gets deployed
+        save_quantized(int8_model, args.save_quantized)
+        int8_model = load_quantized(args.save_quantized)
+    int8 = benchmark('int8', int8_model, loader, args.num_classes)
+
+    report = {
+        'fp32': fp32,
+        'int8': int8,
+        'speedup': int8['rows_per_second'] / fp32['rows_per_second'] if fp32['rows_per_second'] else 0.0,
+        'accuracy_delta': int8['accuracy'] - fp32['accuracy'],
+        'f1_weighted_delta': int8['f1_weighted'] - fp32['f1_weighted'],
+    }
+    print(f"Speedup: {report['speedup']:.2f}x | Accuracy delta: {report['accuracy_delta']:+.4f} | "
+          f"F1 delta: {report['f1_weighted_delta']:+.4f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Tokens/second of the tokenization paths.
+
+Compares the previous `tokenize_data` (the slow Python BertTokenizer, one call
+returning int64 tensors) and a single fast-tokenizer call against
+`tokenize_sharded` with different numbers of worker processes. The slow
+baseline runs on the first `--baseline-rows` rows only; rates are per second,
+so they stay comparable.
+
+    python -m benchmarks.bench_tokenization --rows 1000000 --workers 1 4 8
+    python -m benchmarks.bench_tokenization --tokenizer bert-base-uncased --stride 32
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+from transformers import AutoTokenizer, BertTokenizer
+
+from benchmarks.synthetic import synthetic_frame, tiny_tokenizer
+from tokenization import tokenize_sharded, tokenize_texts
+
+
+def synthetic_texts(rows, seed=0):
+    # Tile a pool of distinct rows, generating millions of descriptions in Python is slow
+    pool = synthetic_frame(min(rows, 50_000), seed=seed)['Description'].tolist()
+    return pd.Series((pool * (rows // len(pool) + 1))[:rows]).tolist()
+
+
+def measure(name, fn, texts):
+    start = time.perf_counter()
+    inputs = fn(texts)
+    elapsed = time.perf_counter() - start
+    tokens = int(inputs['attention_mask'].sum())
+    nbytes = sum(tensor.numel() * tensor.element_size() for tensor in inputs.values())
+    print(f"{name:<28} {tokens / elapsed:>14,.0f} tokens/s {len(texts) / elapsed:>12,.0f} rows/s "
+          f"({elapsed:.2f}s, {nbytes / 2 ** 20:,.0f} MB)")
+    return {'name': name, 'rows': len(texts), 'output_rows': len(inputs['input_ids']), 'tokens': tokens,
+            'seconds': elapsed, 'tokens_per_second': tokens / elapsed, 'rows_per_second': len(texts) / elapsed,
+            'megabytes': nbytes / 2 ** 20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--baseline-rows', type=int, default=100_000, help="rows for the slow tokenizer baseline")
+    parser.add_argument('--tokenizer', default=None, help="model name; default: tiny offline WordPiece vocabulary")
+    parser.add_argument('--max-length', type=int, default=128)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--shard-size', type=int, default=20_000)
+    parser.add_argument('--stride', type=int, default=None, help="also measure overflow windows with this stride")
+    parser.add_argument('--output', default=None, help="optional JSON file for the results")
+    args = parser.parse_args()
+
+    if args.tokenizer:
+        fast = AutoTokenizer.from_pretrained(args.tokenizer, use_fast=True)
+        slow = AutoTokenizer.from_pretrained(args.tokenizer, use_fast=False)
+    else:
+        directory = tempfile.mkdtemp(prefix='bench-tokenizer-')
+        fast = tiny_tokenizer(directory)
+        slow = BertTokenizer(os.path.join(directory, 'vocab.txt'), do_lower_case=True)
+
+    texts = synthetic_texts(args.rows)
+    print(f"Tokenizing {len(texts):,} rows (max_length={args.max_length})")
+
+    results = [measure("tokenize_data (slow, int64)",
+                       lambda t: tokenize_texts(slow, t, max_length=args.max_length), texts[:args.baseline_rows])]
+    results.append(measure("fast, one call (int64)", lambda t: tokenize_texts(fast, t, max_length=args.max_length),
+                           texts))
+    for workers in args.workers:
+        results.append(measure(f"sharded, {workers} workers",
+                               lambda t: tokenize_sharded(fast, t, max_length=args.max_length, workers=workers,
+                                                          shard_size=args.shard_size), texts))
+    if args.stride is not None:
+        results.append(measure(f"sharded + stride {args.stride}, {max(args.workers)} workers",
+                               lambda t: tokenize_sharded(fast, t, max_length=args.max_length,
+                                                          workers=max(args.workers), shard_size=args.shard_size,
+                                                          stride=args.stride), texts))
+
+    baseline = results[0]['tokens_per_second']
+    for result in results[1:]:
+        print(f"{result['name']:<28} {result['tokens_per_second'] / baseline:>8.1f}x vs tokenize_data")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Load generator for serve.py.
+
+Opens `--concurrency` keep-alive connections that each send `--requests`
+POST /predict calls, then prints client-side latency percentiles, throughput
+and the server's own /metrics.
+
+Every text is unique by default, so the server's prediction cache cannot answer
+them and the numbers measure micro-batching and the model. To be safe, start the
+server with the cache off. `--repeat-texts` sends only the sample texts, which
+measures the cache instead.
+
+    python serve.py --checkpoint hybrid_classifier_model.pt --cache-size 0
+    python -m benchmarks.loadgen --port 8080 --concurrency 32 --requests 200 --texts-per-request 1
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+SAMPLE_TEXTS = [
+    "Stocks rallied on Wall Street as oil prices fell for a third straight session.",
+    "The home side clinched the league title with a late goal in the final minute.",
+    "NASA said the new satellite would launch next month to study the ozone layer.",
+    "The software maker reported quarterly profit above analyst expectations.",
+    "Officials met in Geneva to discuss the ceasefire proposal on Tuesday.",
+    "Shares of the chip maker jumped after it raised its full-year forecast.",
+]
+# Letters only, so the suffixes survive clean_text (which drops digits)
+SUFFIX_WORDS = sorted({word.strip('.,').lower() for text in SAMPLE_TEXTS for word in text.split()
+                       if word.strip('.,').isalpha()})
+
+
+# A sample text with a random suffix of words, distinct from every other text with near certainty
+def unique_text(rng, words=8):
+    return rng.choice(SAMPLE_TEXTS) + " " + " ".join(rng.choices(SUFFIX_WORDS, k=words))
+
+
+async def open_connection(host, port, unix_socket):
+    if unix_socket:
+        return await asyncio.open_unix_connection(unix_socket)
+    return await asyncio.open_connection(host, port)
+
+
+async def http_request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    data = await reader.readexactly(int(headers.get('content-length', 0)))
+    return int(status_line.split()[1]), json.loads(data)
+
+
+async def client(args, latencies, failures, seed):
+    rng = random.Random(seed)
+    reader, writer = await open_connection(args.host, args.port, args.unix_socket)
+    try:
+        for _ in range(args.requests):
+            if args.repeat_texts:
+                texts = [rng.choice(SAMPLE_TEXTS) for _ in range(args.texts_per_request)]
+            else:
+                texts = [unique_text(rng) for _ in range(args.texts_per_request)]
+            start = time.perf_counter()
+            status, _ = await http_request(reader, writer, 'POST', '/predict', {'texts': texts})
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                failures.append(status)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    latencies, failures = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args, latencies, failures, seed) for seed in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await open_connection(args.host, args.port, args.unix_socket)
+    _, server_metrics = await http_request(reader, writer, 'GET', '/metrics')
+    writer.close()
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+    report = {
+        'requests': len(latencies),
+        'failures': len(failures),
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed,
+        'texts_per_second': len(latencies) * args.texts_per_request / elapsed,
+        'client_latency_p50_ms': pick(0.50),
+        'client_latency_p99_ms': pick(0.99),
+        'server': server_metrics,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', default=None)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=100, help="requests per connection")
+    parser.add_argument('--texts-per-request', type=int, default=1)
+    parser.add_argument('--repeat-texts', action='store_true',
+                        help="send only the few sample texts, measuring the prediction cache")
+    parser.add_argument('--output', default=None, help="optional JSON file for the report")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Reproducible benchmark suite for the whole pipeline.
+
+Generates a synthetic AG-News-style CSV and times every stage separately:
+text cleaning, tokenization, a HybridClassifier training step, evaluation and
+pseudo-labeling. Runs offline on CPU with a tiny randomly initialized BERT.
+Results go to a JSON file; pass --compare with an earlier file to see ratios.
+
+    python -m benchmarks.suite --rows 10000 --output bench_results.json
+    python -m benchmarks.suite --rows 10000 --compare bench_results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader
+
+from benchmarks.synthetic import tiny_bert_config, tiny_tokenizer, write_synthetic_csv
+from cleaning import clean_series
+from data import TextDataset
+from evaluation import evaluate_model
+from model import HybridClassifier
+from pseudo_labels import pseudo_labeling
+from tokenization import tokenize_texts
+
+
+def timed(fn, repeats=1):
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_clean(frame, repeats):
+    descriptions = frame['Description']
+    cleaned, seconds = timed(lambda: clean_series(descriptions), repeats)
+    return cleaned, {'stage': 'clean_text', 'rows': len(frame), 'seconds': seconds,
+                     'rows_per_second': len(frame) / seconds}
+
+
+def bench_tokenize(texts, tokenizer, max_length, repeats):
+    inputs, seconds = timed(lambda: tokenize_texts(tokenizer, texts, max_length=max_length), repeats)
+    tokens = int(inputs['attention_mask'].sum())
+    return inputs, {'stage': 'tokenize_data', 'rows': len(texts), 'seconds': seconds,
+                    'rows_per_second': len(texts) / seconds, 'tokens_per_second': tokens / seconds}
+
+
+def bench_train_step(model, loader, steps, warmup=2):
+    model.train()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=5e-5)
+    criterion = torch.nn.CrossEntropyLoss()
+    timings, samples = [], 0
+    batches = iter(loader)
+    for index in range(steps + warmup):
+        try:
+            batch = next(batches)
+        except StopIteration:
+            batches = iter(loader)
+            batch = next(batches)
+        start = time.perf_counter()
+        optimizer.zero_grad()
+        outputs = model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask'])
+        loss = criterion(outputs, batch['labels'])
+        loss.backward()
+        optimizer.step()
+        if index >= warmup:
+            timings.append(time.perf_counter() - start)
+            samples += batch['labels'].size(0)
+    timings.sort()
+    return {'stage': 'train_step', 'steps': steps, 'seconds': sum(timings),
+            'step_ms_p50': timings[len(timings) // 2] * 1000, 'step_ms_min': timings[0] * 1000,
+            'samples_per_second': samples / sum(timings)}
+
+
+def bench_eval(model, loader, rows):
+    _, seconds = timed(lambda: evaluate_model(model, loader, 'cpu', verbose=False))
+    return {'stage': 'evaluate', 'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds}
+
+
+def bench_pseudo_label(model, loader, rows, max_length):
+    store, seconds = timed(lambda: pseudo_labeling(model, loader, 'cpu', confidence_threshold=0.0,
+                                                   max_length=max_length))
+    return {'stage': 'pseudo_labeling', 'rows': rows, 'selected': len(store), 'seconds': seconds,
+            'rows_per_second': rows / seconds}
+
+
+def run(args):
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.threads)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = write_synthetic_csv(os.path.join(workdir, 'synthetic.csv'), args.rows, seed=args.seed)
+        frame = pd.read_csv(csv_path)
+        tokenizer = tiny_tokenizer(os.path.join(workdir, 'tokenizer'))
+
+        cleaned, result = bench_clean(frame, args.repeats)
+        results.append(result)
+        inputs, result = bench_tokenize(cleaned.tolist(), tokenizer, args.max_length, args.repeats)
+        results.append(result)
+
+        # Synthetic labels are 1..4, the model predicts 0..3
+        labels = (frame['Class Index'] - 1).tolist()
+        loader = DataLoader(TextDataset(inputs, labels), batch_size=args.batch_size)
+        config = tiny_bert_config(tokenizer.vocab_size, hidden_size=args.hidden_size, num_layers=args.layers,
+                                  max_length=args.max_length)
+        model = HybridClassifier(4, config=config)
+
+        results.append(bench_train_step(model, loader, args.train_steps))
+        results.append(bench_eval(model, loader, len(labels)))
+        results.append(bench_pseudo_label(model, loader, len(labels), args.max_length))
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'threads': args.threads,
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'results': results,
+    }
+
+
+# Print current/baseline ratios for every throughput metric present in both runs
+def compare(report, baseline):
+    previous = {result['stage']: result for result in baseline['results']}
+    print(f"\n{'stage':<16} {'metric':<20} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for result in report['results']:
+        for metric, value in result.items():
+            if not metric.endswith('per_second') or metric not in previous.get(result['stage'], {}):
+                continue
+            old = previous[result['stage']][metric]
+            print(f"{result['stage']:<16} {metric:<20} {old:>12.1f} {value:>12.1f} {value / old:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=torch.get_num_threads())
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-length', type=int, default=128)
+    parser.add_argument('--hidden-size', type=int, default=64)
+    parser.add_argument('--layers', type=int, default=2)
+    parser.add_argument('--train-steps', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=3, help="repeats for the cheap stages, best time is kept")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', default=None, help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    # Read the baseline first, it may be the file this run overwrites
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = run(args)
+    for result in report['results']:
+        print(json.dumps(result))
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if baseline is not None:
+        compare(report, baseline)
+
+
+if __name__ == '__main__':
+    main()
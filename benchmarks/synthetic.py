@@ -0,0 +1,69 @@
+"""Synthetic AG-News-style data and a tiny BERT setup for offline benchmarks."""
+
+import os
+import random
+
+import pandas as pd
+from transformers import BertConfig, BertTokenizerFast
+
+# A few topic words per class so a model can actually learn something
+CLASS_WORDS = {
+    1: ["government", "minister", "election", "troops", "ceasefire", "talks", "president", "embassy", "capital"],
+    2: ["league", "coach", "season", "championship", "goal", "match", "tournament", "striker", "olympic"],
+    3: ["shares", "profit", "quarter", "market", "investors", "earnings", "oil", "prices", "economy"],
+    4: ["software", "internet", "satellite", "researchers", "chip", "wireless", "launch", "computer", "nasa"],
+}
+COMMON_WORDS = ["the", "a", "of", "to", "in", "and", "on", "for", "said", "new", "after", "with", "its", "at",
+                "reuters", "ap", "monday", "tuesday", "week", "year", "report", "officials", "company", "first"]
+NOISE = ["--", "(AFP)", "$12.5", "&lt;b&gt;", "#39;s", "2004", "...", "U.S.", '"quote"']
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+
+def synthetic_frame(rows, seed=0, min_words=8, max_words=60):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(rows):
+        label = rng.randint(1, 4)
+        words = []
+        for _ in range(rng.randint(min_words, max_words)):
+            roll = rng.random()
+            if roll < 0.3:
+                words.append(rng.choice(CLASS_WORDS[label]))
+            elif roll < 0.9:
+                words.append(rng.choice(COMMON_WORDS))
+            else:
+                words.append(rng.choice(NOISE))
+        title = " ".join(word.capitalize() for word in words[:rng.randint(3, 8)])
+        records.append({'Class Index': label, 'Title': title, 'Description': " ".join(words)})
+    return pd.DataFrame(records)
+
+
+# Write a Class Index/Title/Description CSV with `rows` rows
+def write_synthetic_csv(path, rows, seed=0):
+    synthetic_frame(rows, seed=seed).to_csv(path, index=False)
+    return path
+
+
+# WordPiece tokenizer over the synthetic vocabulary, built locally (no download)
+def tiny_tokenizer(directory):
+    os.makedirs(directory, exist_ok=True)
+    vocab = SPECIAL_TOKENS + sorted({word for words in CLASS_WORDS.values() for word in words} | set(COMMON_WORDS))
+    vocab += [chr(code) for code in range(ord('a'), ord('z') + 1)]
+    vocab += ["##" + chr(code) for code in range(ord('a'), ord('z') + 1)]
+    vocab = list(dict.fromkeys(vocab))
+    vocab_path = os.path.join(directory, 'vocab.txt')
+    with open(vocab_path, 'w') as f:
+        f.write("\n".join(vocab) + "\n")
+    return BertTokenizerFast(vocab_file=vocab_path, do_lower_case=True)
+
+
+# Small randomly initialized BERT configuration
+def tiny_bert_config(vocab_size, hidden_size=64, num_layers=2, num_heads=2, max_length=128):
+    return BertConfig(
+        vocab_size=vocab_size,
+        hidden_size=hidden_size,
+        num_hidden_layers=num_layers,
+        num_attention_heads=num_heads,
+        intermediate_size=hidden_size * 4,
+        max_position_embeddings=max(512, max_length),
+    )
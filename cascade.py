@@ -0,0 +1,158 @@
+"""Cheap-first cascade: a linear n-gram model in front of BERT.
+
+The first stage is a hashed word n-gram TF-IDF logistic model over the
+cleaned title and description. Rows it predicts with at least `threshold`
+confidence are answered directly; only the rest are escalated to the
+HybridClassifier. `calibrate_threshold` picks the threshold on the validation
+split from one pass of both stages, and `cascade_report` compares the cascade
+with running BERT on every row.
+
+    first_stage = FirstStageModel().fit(train_data['Cleaned Title'], train_data['Cleaned Description'],
+                                        train_data['Class Index'] - 1)
+    cascade = CascadeClassifier(first_stage, model, tokenizer, device)
+    calibrate_threshold(cascade, val_data['Cleaned Title'], val_data['Cleaned Description'], val_data['Class Index'] - 1)
+"""
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+import torch
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.linear_model import SGDClassifier
+
+from evaluation import compute_metrics
+from model import state_fingerprint
+from prediction_cache import predict_texts
+
+
+# Hashed 1-2 gram TF-IDF features of title and description (separate feature blocks) + logistic regression
+class FirstStageModel:
+    def __init__(self, num_classes=4, n_features=2 ** 20, ngram_range=(1, 2), alpha=1e-6, max_iter=20, seed=42):
+        self.num_classes = num_classes
+        # Hashing needs no vocabulary, so there is nothing to fit or store for the n-grams themselves
+        self.title_vectorizer = HashingVectorizer(n_features=n_features, ngram_range=ngram_range,
+                                                  alternate_sign=False, norm=None)
+        self.description_vectorizer = HashingVectorizer(n_features=n_features, ngram_range=ngram_range,
+                                                        alternate_sign=False, norm=None)
+        self.tfidf = TfidfTransformer(sublinear_tf=True)
+        self.classifier = SGDClassifier(loss='log_loss', alpha=alpha, max_iter=max_iter, tol=None, random_state=seed)
+
+    def _counts(self, titles, descriptions):
+        return sp.hstack([self.title_vectorizer.transform(list(titles)),
+                          self.description_vectorizer.transform(list(descriptions))]).tocsr()
+
+    # `labels` are class indices 0..num_classes-1, the same as the HybridClassifier's output columns
+    def fit(self, titles, descriptions, labels):
+        features = self.tfidf.fit_transform(self._counts(titles, descriptions))
+        self.classifier.fit(features, np.asarray(labels))
+        return self
+
+    def predict_proba(self, titles, descriptions):
+        features = self.tfidf.transform(self._counts(titles, descriptions))
+        probabilities = np.zeros((features.shape[0], self.num_classes), dtype=np.float32)
+        # Classes missing from the training labels keep probability 0
+        probabilities[:, self.classifier.classes_] = self.classifier.predict_proba(features)
+        return probabilities
+
+
+class CascadeClassifier:
+    def __init__(self, first_stage, model, tokenizer, device='cpu', threshold=0.9, max_length=128, batch_size=64,
+                 cache=None):
+        self.first_stage = first_stage
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.threshold = threshold
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.cache = cache
+        self.model_hash = state_fingerprint(model) if cache is not None else None
+
+    # BERT class probabilities for descriptions (duplicates collapsed, see prediction_cache.py)
+    def bert_proba(self, descriptions, use_cache=True):
+        self.model.eval()
+        logits = predict_texts(self.model, self.tokenizer, list(descriptions), self.device,
+                               cache=self.cache if use_cache else None,
+                               model_hash=self.model_hash, max_length=self.max_length, batch_size=self.batch_size)
+        return torch.softmax(logits.float(), dim=1).numpy()
+
+    # Probabilities for every row and the mask of rows that were escalated to BERT
+    def predict_proba(self, titles, descriptions, use_cache=True):
+        descriptions = np.asarray(list(descriptions), dtype=object)
+        probabilities = self.first_stage.predict_proba(titles, descriptions)
+        escalated = probabilities.max(axis=1) < self.threshold
+        if escalated.any():
+            probabilities[escalated] = self.bert_proba(descriptions[escalated], use_cache=use_cache)
+        return probabilities, escalated
+
+    def predict(self, titles, descriptions):
+        probabilities, _ = self.predict_proba(titles, descriptions)
+        return probabilities.argmax(axis=1)
+
+
+# Choose the threshold that escalates the fewest rows while staying within `max_accuracy_drop`
+# of BERT's accuracy on the validation rows. Both stages run once over all rows; every candidate
+# threshold is then scored from those predictions. Sets cascade.threshold and returns the table.
+def calibrate_threshold(cascade, titles, descriptions, labels, max_accuracy_drop=0.005,
+                        thresholds=np.round(np.arange(0.50, 1.0, 0.01), 2)):
+    labels = np.asarray(labels)
+    first_probabilities = cascade.first_stage.predict_proba(titles, descriptions)
+    bert_predictions = cascade.bert_proba(descriptions).argmax(axis=1)
+    confidence = first_probabilities.max(axis=1)
+    first_predictions = first_probabilities.argmax(axis=1)
+    bert_accuracy = float((bert_predictions == labels).mean())
+
+    table = []
+    for threshold in thresholds:
+        escalated = confidence < threshold
+        predictions = np.where(escalated, bert_predictions, first_predictions)
+        table.append({'threshold': float(threshold), 'escalated_fraction': float(escalated.mean()),
+                      'accuracy': float((predictions == labels).mean())})
+
+    eligible = [row for row in table if row['accuracy'] >= bert_accuracy - max_accuracy_drop]
+    # An infinite threshold escalates every row, even first-stage predictions saturated at 1.0,
+    # and always matches BERT
+    best = min(eligible, key=lambda row: row['escalated_fraction']) if eligible else {'threshold': np.inf}
+    cascade.threshold = best['threshold']
+    print(f"BERT accuracy on validation: {bert_accuracy:.4f} | first stage alone: "
+          f"{float((first_predictions == labels).mean()):.4f}")
+    print(f"Chosen threshold {cascade.threshold:.2f}: "
+          f"{best.get('escalated_fraction', 1.0):.1%} of rows escalated, accuracy {best.get('accuracy', bert_accuracy):.4f}")
+    return table
+
+
+# Fraction escalated, end-to-end throughput and accuracy of the cascade against BERT on every row
+def cascade_report(cascade, titles, descriptions, labels):
+    titles, descriptions, labels = list(titles), list(descriptions), np.asarray(labels)
+    num_classes = cascade.first_stage.num_classes
+
+    # Both runs skip the prediction cache: calibrate_threshold may already hold every row's BERT logits
+    start = time.perf_counter()
+    probabilities, escalated = cascade.predict_proba(titles, descriptions, use_cache=False)
+    cascade_seconds = time.perf_counter() - start
+    cascade_metrics = compute_metrics(labels, probabilities.argmax(axis=1), num_classes=num_classes)
+
+    start = time.perf_counter()
+    bert_predictions = cascade.bert_proba(descriptions, use_cache=False).argmax(axis=1)
+    bert_seconds = time.perf_counter() - start
+    bert_metrics = compute_metrics(labels, bert_predictions, num_classes=num_classes)
+
+    report = {
+        'rows': len(labels),
+        'threshold': cascade.threshold,
+        'escalated_fraction': float(escalated.mean()) if len(escalated) else 0.0,
+        'cascade_rows_per_second': len(labels) / cascade_seconds if cascade_seconds else 0.0,
+        'bert_rows_per_second': len(labels) / bert_seconds if bert_seconds else 0.0,
+        'cascade_accuracy': cascade_metrics['accuracy'],
+        'bert_accuracy': bert_metrics['accuracy'],
+        'cascade_f1_weighted': cascade_metrics['f1_weighted'],
+        'bert_f1_weighted': bert_metrics['f1_weighted'],
+    }
+    report['speedup'] = (report['cascade_rows_per_second'] / report['bert_rows_per_second']
+                         if report['bert_rows_per_second'] else 0.0)
+    report['accuracy_delta'] = report['cascade_accuracy'] - report['bert_accuracy']
+    print(f"Escalated: {report['escalated_fraction']:.1%} | Cascade: {report['cascade_rows_per_second']:.1f} rows/s, "
+          f"accuracy {report['cascade_accuracy']:.4f} | BERT only: {report['bert_rows_per_second']:.1f} rows/s, "
+          f"accuracy {report['bert_accuracy']:.4f} | Speedup: {report['speedup']:.2f}x")
+    return report
@@ -0,0 +1,164 @@
+"""Periodic, resumable training checkpoints.
+
+A checkpoint holds the model, optimizer and grad scaler state, the epoch and
+batch position, the RNG states and the sampler epoch, so a crashed run can
+continue from the exact batch it stopped at. The state is copied to CPU on the
+training thread and written to disk by a background thread, keeping only the
+last `keep_last` files. Checkpoints are loaded with `torch.load(mmap=True)`, so
+tensors are paged in from the file instead of read into memory up front.
+"""
+
+import glob
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from metrics import is_main_process
+
+
+def capture_rng_state():
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+# Deep copy of a (nested) state dict with every tensor copied to CPU
+def snapshot(state):
+    if isinstance(state, torch.Tensor):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return {key: snapshot(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(value) for value in state)
+    return state
+
+
+# The loader's sampler that owns the epoch (BatchIndexSampler, LengthBucketSampler, DistributedSampler, ...)
+def epoch_sampler(loader):
+    for sampler in (loader.batch_sampler, loader.sampler):
+        if hasattr(sampler, 'set_epoch'):
+            return sampler
+    return None
+
+
+# Everything needed to replay the batch order of the epoch that is about to start.
+# Call it right before iterating the loader.
+def epoch_start_state(loader):
+    sampler = epoch_sampler(loader)
+    return {'rng': capture_rng_state(), 'sampler_epoch': getattr(sampler, 'epoch', None)}
+
+
+# Iterator over `loader` that yields the epoch described by `epoch_state`, starting at batch `start_batch`.
+# Samplers with a `start_batch` (BatchIndexSampler, LengthBucketSampler) skip the batches without
+# loading them; for any other loader the skipped batches are drawn and discarded.
+def resume_iterator(loader, epoch_state, start_batch):
+    restore_rng_state(epoch_state['rng'])
+    sampler = epoch_sampler(loader)
+    if sampler is not None and epoch_state['sampler_epoch'] is not None:
+        if hasattr(sampler, 'start_batch'):
+            sampler.set_epoch(epoch_state['sampler_epoch'], start_batch=start_batch)
+            start_batch = 0
+        else:
+            sampler.set_epoch(epoch_state['sampler_epoch'])
+    iterator = iter(loader)
+    for _ in range(start_batch):
+        next(iterator, None)
+    return iterator
+
+
+class CheckpointManager:
+    def __init__(self, directory='checkpoints', every_steps=500, keep_last=3, prefix='checkpoint'):
+        self.directory = directory
+        self.every_steps = every_steps
+        self.keep_last = keep_last
+        self.prefix = prefix
+        # One writer thread: at most one snapshot is waiting to be written at any time
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def path_for(self, step):
+        return os.path.join(self.directory, f"{self.prefix}_step{step:09d}.pt")
+
+    def checkpoints(self):
+        return sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}_step*.pt")))
+
+    def latest(self):
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def due(self, step):
+        return bool(self.every_steps) and step > 0 and step % self.every_steps == 0
+
+    # Snapshot `state` now and write it in the background. Blocks only while the previous write is unfinished.
+    # Under torch.distributed only rank 0 writes; every rank loads the same file to resume.
+    def save(self, step, state):
+        if not is_main_process():
+            return
+        self.wait()
+        state = snapshot(state)
+        self._pending = self._executor.submit(self._write, self.path_for(step), state)
+
+    def _write(self, path, state):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, path)
+        for old in self.checkpoints()[:-self.keep_last] if self.keep_last else []:
+            os.remove(old)
+        return path
+
+    # Wait for the write in flight; errors from the writer thread are raised here
+    def wait(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            return pending.result()
+        return None
+
+    def load(self, path=None, map_location='cpu'):
+        path = path or self.latest()
+        if path is None:
+            return None
+        return torch.load(path, map_location=map_location, mmap=True, weights_only=False)
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+
+
+def training_state(model, optimizer, scaler, epoch, step_in_epoch, global_step, epoch_state, **extra):
+    return {
+        'model': model.state_dict(),
+        'optimizer': optimizer.state_dict(),
+        'scaler': scaler.state_dict(),
+        'epoch': epoch,
+        'step_in_epoch': step_in_epoch,
+        'global_step': global_step,
+        'epoch_state': epoch_state,
+        'rng': capture_rng_state(),
+        **extra,
+    }
+
+
+# Load model/optimizer/scaler from a checkpoint; the position and RNG are restored by the training loop
+def restore_training_state(state, model, optimizer, scaler):
+    model.load_state_dict(state['model'])
+    optimizer.load_state_dict(state['optimizer'])
+    scaler.load_state_dict(state['scaler'])
+    print(f"Resuming from epoch {state['epoch'] + 1}, batch {state['step_in_epoch']} "
+          f"(step {state['global_step']})")
@@ -0,0 +1,55 @@
+"""Text cleaning shared by the training, evaluation and inference code."""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from text_cleaning import CLEANED_PATTERN, NON_ALPHA_PATTERN, WHITESPACE_PATTERN, clean_text  # noqa: F401
+
+
+# True for rows that are already in clean_text's output form
+def is_clean(series):
+    return series.str.fullmatch(CLEANED_PATTERN, na=False)
+
+
+# Vectorized clean_text over a whole column. Rows that are already clean are left
+# untouched, so calling it again on a cleaned column costs a single match pass.
+# Missing values become empty strings.
+def clean_series(series, skip_clean=True):
+    series = series.fillna("").astype(str)
+    if skip_clean:
+        dirty = ~is_clean(series)
+        if not dirty.any():
+            return series
+        if not dirty.all():
+            series = series.copy()
+            series[dirty] = clean_series(series[dirty], skip_clean=False)
+            return series
+    return (
+        series.str.replace(NON_ALPHA_PATTERN, "", regex=True)
+        .str.replace(WHITESPACE_PATTERN, " ", regex=True)
+        .str.strip()
+        .str.lower()
+    )
+
+
+# Chunked multi-process version of clean_series for large frames
+def clean_series_parallel(series, workers=None, chunksize=200_000, skip_clean=True):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(series) <= chunksize:
+        return clean_series(series, skip_clean=skip_clean)
+    chunks = [series.iloc[start:start + chunksize] for start in range(0, len(series), chunksize)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        cleaned = list(pool.map(clean_series, chunks, [skip_clean] * len(chunks)))
+    return pd.concat(cleaned)
+
+
+# Adds a 'Cleaned <column>' column for each of `columns`
+def add_cleaned_columns(df, columns=('Title', 'Description'), workers=1, chunksize=200_000):
+    for column in columns:
+        if workers == 1:
+            df[f'Cleaned {column}'] = clean_series(df[column])
+        else:
+            df[f'Cleaned {column}'] = clean_series_parallel(df[column], workers=workers, chunksize=chunksize)
+    return df
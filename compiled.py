@@ -0,0 +1,49 @@
+"""Runtime for artifacts written by export.py.
+
+Only needs torch and the standalone `tokenizers` package; transformers is not
+imported, so worker processes start without building BERT from Python.
+"""
+
+import json
+import os
+
+import torch
+from tokenizers import Tokenizer
+
+from text_cleaning import clean_text
+
+
+class CompiledClassifier:
+    def __init__(self, artifact_dir, num_threads=None):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        with open(os.path.join(artifact_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.max_length = self.meta['max_length']
+        self.module = torch.jit.load(os.path.join(artifact_dir, 'model.ts'), map_location='cpu')
+        self.module.eval()
+
+        # The traced graph expects rows padded to max_length
+        self.tokenizer = Tokenizer.from_file(os.path.join(artifact_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding(length=self.max_length, pad_id=self.meta['pad_token_id'],
+                                      pad_token=self.meta['pad_token'])
+
+    def encode(self, texts, clean=True):
+        if clean:
+            texts = [clean_text(text) for text in texts]
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = torch.tensor([encoding.ids for encoding in encodings], dtype=torch.long)
+        attention_mask = torch.tensor([encoding.attention_mask for encoding in encodings], dtype=torch.long)
+        return input_ids, attention_mask
+
+    def predict_logits(self, texts, clean=True):
+        input_ids, attention_mask = self.encode(texts, clean=clean)
+        with torch.inference_mode():
+            return self.module(input_ids, attention_mask)
+
+    def predict_proba(self, texts, clean=True):
+        return torch.softmax(self.predict_logits(texts, clean=clean), dim=1)
+
+    def predict(self, texts, clean=True):
+        return self.predict_logits(texts, clean=clean).argmax(dim=1)
@@ -0,0 +1,263 @@
+"""Datasets, samplers and collate functions shared by the training and evaluation code."""
+
+import random
+
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+from cleaning import clean_series
+from tokenization import tokenize_texts
+
+
+# Custom dataset class for PyTorch
+class TextDataset(Dataset):
+    def __init__(self, inputs, labels):
+        self.inputs = inputs
+        # Stored once as a tensor instead of building a new tensor per item
+        self.labels = torch.as_tensor(labels, dtype=torch.long)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        # as_tensor widens compact int16/int8 rows (tokenize_sharded) and leaves int64 ones untouched
+        return {
+            'input_ids': torch.as_tensor(self.inputs['input_ids'][idx], dtype=torch.long),
+            'attention_mask': torch.as_tensor(self.inputs['attention_mask'][idx], dtype=torch.long),
+            'labels': self.labels[idx],
+        }
+
+
+# Dataset indexed by a whole batch at once: dataset[slice] returns views of the
+# pre-tokenized tensors, dataset[list_or_tensor] one index_select gather per field.
+# Padding columns beyond the longest row of the batch are trimmed off (as a view).
+# Use it with DataLoader(dataset, sampler=<batch sampler>, batch_size=None).
+class BatchSliceDataset(Dataset):
+    def __init__(self, inputs, labels, trim_padding=True, stats=None):
+        self.input_ids = torch.as_tensor(inputs['input_ids'])
+        self.attention_mask = torch.as_tensor(inputs['attention_mask'])
+        self.labels = torch.as_tensor(labels, dtype=torch.long)
+        self.lengths = self.attention_mask.sum(dim=1)
+        self.trim_padding = trim_padding
+        self.stats = stats
+
+    def __len__(self):
+        return len(self.labels)
+
+    # Move the tensors to shared memory so worker processes read them without copies
+    def share_memory(self):
+        for tensor in (self.input_ids, self.attention_mask, self.labels, self.lengths):
+            tensor.share_memory_()
+        return self
+
+    def __getitem__(self, indices):
+        if isinstance(indices, slice):
+            input_ids, attention_mask = self.input_ids[indices], self.attention_mask[indices]
+            labels, lengths = self.labels[indices], self.lengths[indices]
+        else:
+            indices = torch.as_tensor(indices, dtype=torch.long)
+            input_ids = self.input_ids.index_select(0, indices)
+            attention_mask = self.attention_mask.index_select(0, indices)
+            labels, lengths = self.labels.index_select(0, indices), self.lengths.index_select(0, indices)
+
+        longest = max(int(lengths.max()), 1) if len(lengths) else 1
+        if self.stats is not None:
+            self.stats.update(int(lengths.sum()), len(lengths), longest)
+        if self.trim_padding:
+            input_ids, attention_mask = input_ids[:, :longest], attention_mask[:, :longest]
+        # Compact int16/int8 columns from tokenize_sharded are widened per batch (a no-op for int64)
+        return {'input_ids': input_ids.long(), 'attention_mask': attention_mask.long(), 'labels': labels}
+
+
+# Batch sampler yielding contiguous slices when not shuffling and index tensors when shuffling
+class BatchIndexSampler(Sampler):
+    def __init__(self, size, batch_size=16, shuffle=True, drop_last=False, seed=42):
+        self.size = size
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+        self.start_batch = 0
+
+    # `start_batch` skips the first batches of that epoch once, to resume mid-epoch
+    def set_epoch(self, epoch, start_batch=0):
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def __len__(self):
+        if self.drop_last:
+            return self.size // self.batch_size
+        return (self.size + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        if self.shuffle:
+            order = torch.randperm(self.size, generator=torch.Generator().manual_seed(self.seed + self.epoch))
+        start_batch, self.start_batch = self.start_batch, 0
+        for batch in range(start_batch, len(self)):
+            start, end = batch * self.batch_size, min((batch + 1) * self.batch_size, self.size)
+            yield order[start:end] if self.shuffle else slice(start, end)
+        self.epoch += 1
+
+
+# DataLoader over a BatchSliceDataset; worker processes share the tensors instead of copying them
+def make_batch_loader(dataset, sampler, num_workers=0, pin_memory=False):
+    if num_workers > 0:
+        dataset.share_memory()
+    return DataLoader(dataset, sampler=sampler, batch_size=None, num_workers=num_workers,
+                      pin_memory=pin_memory, persistent_workers=num_workers > 0)
+
+
+# Read, clean and tokenize a labeled CSV (Class Index/Title/Description) into a TextDataset.
+# `label_offset` is subtracted from every label; pass 1 to turn the 1-based Class Index of
+# AG News into the 0-based class indices the model predicts. With label_column=None only the
+# text column is read (an unlabeled CSV) and every label is 0.
+def load_csv_dataset(file_path, tokenizer, max_length=128, text_column='Description', label_column='Class Index',
+                     cache=None, label_offset=0):
+    df = pd.read_csv(file_path, usecols=[text_column] if label_column is None else None)
+    texts = clean_series(df[text_column]).tolist()
+    inputs = tokenize_texts(tokenizer, texts, max_length=max_length, padding='max_length', cache=cache)
+    if label_column is None:
+        return TextDataset(inputs, [0] * len(df))
+    return TextDataset(inputs, (df[label_column] - label_offset).tolist())
+
+
+# Number of real (non-padding) tokens in every row of a tokenized batch
+def sequence_lengths(inputs):
+    mask = inputs['attention_mask']
+    if isinstance(mask, torch.Tensor):
+        return mask.sum(dim=1).tolist()
+    return [int(sum(row)) for row in mask]
+
+
+# Batch sampler that groups rows of similar length so each batch needs little padding.
+# A batch is closed when it reaches `batch_size` rows or when padding it to its longest
+# row would exceed `max_tokens` (rows * longest length).
+class LengthBucketSampler(Sampler):
+    def __init__(self, lengths, batch_size=16, max_tokens=None, shuffle=True,
+                 bucket_size_multiplier=50, drop_last=False, seed=42):
+        self.lengths = list(lengths)
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        self.bucket_size = batch_size * bucket_size_multiplier
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+        self.start_batch = 0
+        self._batches = None
+
+    # `start_batch` skips the first batches of that epoch once, to resume mid-epoch
+    def set_epoch(self, epoch, start_batch=0):
+        self.epoch = epoch
+        self.start_batch = start_batch
+        self._batches = None
+
+    def _build_batches(self):
+        indices = list(range(len(self.lengths)))
+        rng = random.Random(self.seed + self.epoch)
+        if self.shuffle:
+            rng.shuffle(indices)
+            # Sort only inside large buckets so batches stay random across the epoch
+            buckets = [indices[i:i + self.bucket_size] for i in range(0, len(indices), self.bucket_size)]
+            indices = [idx for bucket in buckets for idx in sorted(bucket, key=self.lengths.__getitem__)]
+        else:
+            indices.sort(key=self.lengths.__getitem__)
+
+        batches, batch, longest = [], [], 0
+        for idx in indices:
+            new_longest = max(longest, self.lengths[idx])
+            over_budget = self.max_tokens is not None and new_longest * (len(batch) + 1) > self.max_tokens
+            if batch and (len(batch) == self.batch_size or over_budget):
+                batches.append(batch)
+                batch, new_longest = [], self.lengths[idx]
+            batch.append(idx)
+            longest = new_longest
+        if batch and not (self.drop_last and len(batch) < self.batch_size):
+            batches.append(batch)
+
+        if self.shuffle:
+            rng.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        self._batches = self._build_batches()
+        start_batch, self.start_batch = self.start_batch, 0
+        yield from self._batches[start_batch:]
+        self.epoch += 1
+
+    def __len__(self):
+        if self._batches is None:
+            self._batches = self._build_batches()
+        return len(self._batches)
+
+
+# Running count of real vs padded tokens, to report the padding saved by per-batch padding.
+# Counts made inside DataLoader worker processes stay in those processes.
+class PaddingStats:
+    def __init__(self, max_length=128):
+        self.max_length = max_length
+        self.reset()
+
+    def reset(self):
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.fixed_tokens = 0
+
+    def update(self, real_tokens, rows, longest):
+        self.real_tokens += real_tokens
+        self.padded_tokens += rows * longest
+        self.fixed_tokens += rows * self.max_length
+
+    def report(self):
+        if self.padded_tokens == 0:
+            return {'real_tokens': 0, 'padded_tokens': 0, 'fixed_tokens': 0,
+                    'dynamic_waste_ratio': 0.0, 'fixed_waste_ratio': 0.0, 'tokens_saved_ratio': 0.0}
+        return {
+            'real_tokens': self.real_tokens,
+            'padded_tokens': self.padded_tokens,
+            'fixed_tokens': self.fixed_tokens,
+            # Share of processed positions that are padding, with and without bucketing
+            'dynamic_waste_ratio': 1 - self.real_tokens / self.padded_tokens,
+            'fixed_waste_ratio': 1 - self.real_tokens / self.fixed_tokens,
+            # Share of encoder positions avoided compared to padding='max_length'
+            'tokens_saved_ratio': 1 - self.padded_tokens / self.fixed_tokens,
+        }
+
+
+# Collate function that pads every batch only up to its own longest row.
+# Works with both pre-padded tensors (extra padding is trimmed) and unpadded token lists,
+# and keeps running counters so the saved padding can be reported.
+class DynamicPaddingCollator:
+    def __init__(self, pad_token_id=0, max_length=128, stats=None):
+        self.pad_token_id = pad_token_id
+        self.max_length = max_length
+        self.stats = stats or PaddingStats(max_length)
+
+    def reset_stats(self):
+        self.stats.reset()
+
+    def __call__(self, items):
+        lengths = []
+        for item in items:
+            mask = item['attention_mask']
+            lengths.append(int(mask.sum()) if isinstance(mask, torch.Tensor) else int(sum(mask)))
+        longest = max(max(lengths), 1)
+
+        input_ids = torch.full((len(items), longest), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(items), longest), dtype=torch.long)
+        for row, (item, length) in enumerate(zip(items, lengths)):
+            input_ids[row, :length] = torch.as_tensor(item['input_ids'][:length], dtype=torch.long)
+            attention_mask[row, :length] = 1
+
+        self.stats.update(sum(lengths), len(items), longest)
+
+        return {
+            'input_ids': input_ids,
+            'attention_mask': attention_mask,
+            'labels': torch.stack([torch.as_tensor(item['labels'], dtype=torch.long) for item in items]),
+        }
+
+    def padding_report(self):
+        return self.stats.report()
@@ -0,0 +1,290 @@
+"""Knowledge distillation into a smaller HybridClassifier for CPU serving.
+
+The student keeps BERT's architecture with fewer encoder layers, initialized
+from an evenly spaced subset of the teacher's layers (plus its embeddings,
+pooler and heads), and is trained on the teacher's temperature-softened logits
+mixed with the hard labels. Teacher logits are cached per input, so they are
+computed once rather than every epoch. Rows pseudo-labeled by
+`pseudo_labeling` can be added as extra training data. `compare_models`
+reports latency, memory and `evaluate_model` accuracy for student and teacher.
+
+    python distillation.py --teacher hybrid_classifier_model.pt --train-csv "/content/train.csv" \\
+        --test-csv "/content/test (1).csv" --layers 4 --output student.pt --report distillation_report.json
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+from transformers import AutoTokenizer, BertConfig
+
+from data import DynamicPaddingCollator, LengthBucketSampler, load_csv_dataset, sequence_lengths
+from evaluation import evaluate_model
+from model import HybridClassifier, get_logits, load_hybrid_classifier, state_fingerprint
+from prediction_cache import PredictionCache, batch_logits
+from pseudo_labels import pseudo_labeling
+from training import autocast, peak_memory_mb, reset_peak_memory
+
+
+# `count` evenly spaced layer indices out of `total`, always keeping the last layer
+def select_layers(total, count):
+    if not 0 < count <= total:
+        raise ValueError(f"cannot pick {count} of {total} layers")
+    return [round((index + 1) * total / count) - 1 for index in range(count)]
+
+
+# Student HybridClassifier with `num_layers` encoder layers copied from the teacher.
+# With a `hidden_size` different from the teacher's nothing can be copied and the student starts
+# from random weights (and `num_heads` attention heads).
+def make_student(teacher, num_classes, num_layers=4, hidden_size=None, num_heads=None, layers=None):
+    teacher_bert = teacher.bert
+    config = copy.deepcopy(teacher_bert.config)
+    layers = layers or select_layers(config.num_hidden_layers, num_layers)
+    config.num_hidden_layers = len(layers)
+    if hidden_size is not None and hidden_size != config.hidden_size:
+        config.hidden_size = hidden_size
+        config.intermediate_size = hidden_size * 4
+        config.num_attention_heads = num_heads or max(1, hidden_size // 64)
+        return HybridClassifier(num_classes, config=config)
+
+    student = HybridClassifier(num_classes, config=config)
+    student.bert.embeddings.load_state_dict(teacher_bert.embeddings.state_dict())
+    for student_index, teacher_index in enumerate(layers):
+        student.bert.encoder.layer[student_index].load_state_dict(teacher_bert.encoder.layer[teacher_index].state_dict())
+    if teacher_bert.pooler is not None:
+        student.bert.pooler.load_state_dict(teacher_bert.pooler.state_dict())
+    if isinstance(teacher, HybridClassifier):
+        student.flat_classifier.load_state_dict(teacher.flat_classifier.state_dict())
+        student.hierarchical_classifier.load_state_dict(teacher.hierarchical_classifier.state_dict())
+    return student
+
+
+# KL divergence to the teacher's softened distribution (scaled by T^2) mixed with cross-entropy on the labels.
+# Rows without a usable label (-100 or outside the class range) only get the soft-target term.
+def distillation_loss(student_logits, teacher_logits, labels=None, temperature=2.0, alpha=0.5):
+    soft_loss = F.kl_div(F.log_softmax(student_logits / temperature, dim=1),
+                         F.softmax(teacher_logits / temperature, dim=1), reduction='batchmean') * temperature ** 2
+    if labels is None or alpha >= 1:
+        return soft_loss
+    num_classes = student_logits.size(1)
+    labels = torch.where((labels >= 0) & (labels < num_classes), labels, torch.full_like(labels, -100))
+    if not (labels >= 0).any():
+        return soft_loss
+    hard_loss = F.cross_entropy(student_logits, labels, ignore_index=-100)
+    return alpha * soft_loss + (1 - alpha) * hard_loss
+
+
+# Train the student on the teacher's logits. Batches of `extra_loader` (e.g. a DataLoader over the
+# PseudoLabelStore returned by pseudo_labeling) are interleaved with the labeled ones.
+def train_student(student, teacher, train_loader, device, epochs=3, lr=5e-5, temperature=2.0, alpha=0.5,
+                  extra_loader=None, precision='fp32', teacher_cache=None):
+    teacher.to(device).eval()
+    student.to(device)
+    teacher_cache = teacher_cache if teacher_cache is not None else PredictionCache(capacity=10_000_000)
+    teacher_hash = state_fingerprint(teacher)
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr)
+
+    history = []
+    for epoch in range(epochs):
+        student.train()
+        batches = train_loader
+        if extra_loader is not None:
+            batches = (batch for pair in itertools.zip_longest(train_loader, extra_loader) for batch in pair
+                       if batch is not None)
+        total_loss = torch.zeros((), device=device)
+        num_batches = 0
+        start = time.perf_counter()
+        for batch in tqdm(batches, desc=f"Distilling (epoch {epoch + 1}/{epochs})"):
+            input_ids = batch['input_ids'].to(device)
+            attention_mask = batch['attention_mask'].to(device)
+            labels = batch['labels'].to(device)
+            with torch.no_grad():
+                teacher_logits = batch_logits(teacher, batch['input_ids'], batch['attention_mask'], device,
+                                              cache=teacher_cache, model_hash=teacher_hash).float()
+
+            with autocast(device, precision):
+                student_logits = get_logits(student(input_ids=input_ids, attention_mask=attention_mask))
+            loss = distillation_loss(student_logits.float(), teacher_logits, labels, temperature, alpha)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.detach()
+            num_batches += 1
+
+        epoch_stats = {'epoch': epoch + 1, 'loss': total_loss.item() / max(num_batches, 1),
+                       'seconds': time.perf_counter() - start, **teacher_cache.stats()}
+        print(f"Distillation loss: {epoch_stats['loss']:.4f} | Teacher cache hit rate: "
+              f"{epoch_stats['cache_hit_rate']:.1%}")
+        history.append(epoch_stats)
+    return history
+
+
+def weights_mb(model):
+    return sum(tensor.numel() * tensor.element_size() for tensor in model.state_dict().values()) / 2 ** 20
+
+
+# Per-batch latency over the first `max_batches` batches and single-row latency over `single_rows` rows
+def measure_latency(model, loader, device, max_batches=50, single_rows=50, warmup=3):
+    model.to(device).eval()
+    latencies, rows = [], 0
+    first_batch = None
+    with torch.inference_mode():
+        for index, batch in enumerate(itertools.islice(loader, max_batches + warmup)):
+            if first_batch is None:
+                first_batch = batch
+            input_ids, attention_mask = batch['input_ids'].to(device), batch['attention_mask'].to(device)
+            start = time.perf_counter()
+            model(input_ids=input_ids, attention_mask=attention_mask)
+            if index >= warmup:
+                latencies.append(time.perf_counter() - start)
+                rows += input_ids.size(0)
+
+        single = []
+        for row in range(min(single_rows, first_batch['input_ids'].size(0)) if first_batch else 0):
+            length = max(int(first_batch['attention_mask'][row].sum()), 1)
+            input_ids = first_batch['input_ids'][row:row + 1, :length].to(device)
+            attention_mask = first_batch['attention_mask'][row:row + 1, :length].to(device)
+            start = time.perf_counter()
+            model(input_ids=input_ids, attention_mask=attention_mask)
+            single.append(time.perf_counter() - start)
+
+    return {
+        'rows_per_second': rows / sum(latencies) if latencies else 0.0,
+        'batch_latency_p50_ms': float(np.percentile(latencies, 50) * 1000) if latencies else 0.0,
+        'batch_latency_p99_ms': float(np.percentile(latencies, 99) * 1000) if latencies else 0.0,
+        'single_latency_p50_ms': float(np.percentile(single, 50) * 1000) if single else 0.0,
+    }
+
+
+# Peak memory of `model` running `batches`. On CPU the peak RSS of a process can only grow, so
+# this runs in a freshly spawned process that holds nothing but this one model.
+def _inference_peak_memory(model, batches, device):
+    model.to(device).eval()
+    reset_peak_memory(device)
+    with torch.inference_mode():
+        for batch in batches:
+            model(input_ids=batch['input_ids'].to(device), attention_mask=batch['attention_mask'].to(device))
+    return peak_memory_mb(device)
+
+
+def isolated_peak_memory(model, test_loader, device, max_batches=20):
+    batches = list(itertools.islice(test_loader, max_batches))
+    if torch.device(device).type == 'cuda':
+        return _inference_peak_memory(model, batches, device)
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_inference_peak_memory, model.cpu(), batches, 'cpu').result()
+
+
+# Latency, memory and accuracy of every model in `models` ({name: model}).
+# Peak memory is measured per model: on CUDA after resetting the allocator's peak, on CPU in a
+# separate process (see isolated_peak_memory), so one model's memory never counts for another.
+def compare_models(models, test_loader, device):
+    report = {}
+    for name, model in models.items():
+        peak_memory = isolated_peak_memory(model, test_loader, device)
+        result = {
+            'parameters': sum(param.numel() for param in model.parameters()),
+            'weights_mb': weights_mb(model),
+            **measure_latency(model, test_loader, device),
+        }
+        metrics = evaluate_model(model, test_loader, device, verbose=False)
+        result.update({key: metrics[key] for key in ('accuracy', 'f1_weighted', 'f1_macro')})
+        result['peak_memory_mb'] = peak_memory
+        report[name] = result
+        print(f"{name:<8} {result['parameters'] / 1e6:6.1f}M params  {result['weights_mb']:6.0f} MB  "
+              f"{result['rows_per_second']:8.1f} rows/s  single p50 {result['single_latency_p50_ms']:6.1f} ms  "
+              f"peak {result['peak_memory_mb']:6.0f} MB  acc {result['accuracy']:.4f}")
+    return report
+
+
+# Save a student together with its (reduced) BERT config, so it can be rebuilt without the teacher
+def save_student(student, path):
+    torch.save({
+        'state_dict': student.state_dict(),
+        'num_classes': student.flat_classifier.out_features,
+        'bert_config': student.bert.config.to_dict(),
+    }, path)
+
+
+def load_student(path, device='cpu'):
+    artifact = torch.load(path, map_location=device, weights_only=False)
+    model = HybridClassifier(artifact['num_classes'], config=BertConfig.from_dict(artifact['bert_config']))
+    model.load_state_dict(artifact['state_dict'])
+    return model.to(device).eval()
+
+
+def make_loader(dataset, tokenizer, batch_size, max_length, shuffle):
+    sampler = LengthBucketSampler(sequence_lengths(dataset.inputs), batch_size=batch_size, shuffle=shuffle)
+    return DataLoader(dataset, batch_sampler=sampler, collate_fn=DynamicPaddingCollator(tokenizer.pad_token_id, max_length))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--teacher', default='hybrid_classifier_model.pt', help="HybridClassifier state dict")
+    parser.add_argument('--train-csv', required=True)
+    parser.add_argument('--test-csv', required=True)
+    parser.add_argument('--unlabeled-csv', default=None, help="extra rows, pseudo-labeled by the teacher")
+    parser.add_argument('--num-classes', type=int, default=4)
+    parser.add_argument('--bert-model', default='bert-base-uncased')
+    parser.add_argument('--layers', type=int, default=4, help="student encoder layers")
+    parser.add_argument('--hidden-size', type=int, default=None, help="student hidden size (random init if changed)")
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--lr', type=float, default=5e-5)
+    parser.add_argument('--temperature', type=float, default=2.0)
+    parser.add_argument('--alpha', type=float, default=0.5, help="weight of the soft-target loss")
+    parser.add_argument('--confidence-threshold', type=float, default=0.9)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-length', type=int, default=128)
+    parser.add_argument('--precision', default='fp32', choices=('fp32', 'bf16', 'fp16'))
+    parser.add_argument('--output', default='student.pt')
+    parser.add_argument('--report', default=None, help="optional JSON file for the comparison")
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    tokenizer = AutoTokenizer.from_pretrained(args.bert_model)
+    teacher = load_hybrid_classifier(args.teacher, args.num_classes, bert_model_name=args.bert_model, device=device)
+    student = make_student(teacher, args.num_classes, num_layers=args.layers, hidden_size=args.hidden_size)
+
+    # Class Index is 1..4; the student, the teacher and the pseudo-labels all use 0..3
+    train_loader = make_loader(load_csv_dataset(args.train_csv, tokenizer, args.max_length, label_offset=1),
+                               tokenizer, args.batch_size, args.max_length, shuffle=True)
+    test_loader = make_loader(load_csv_dataset(args.test_csv, tokenizer, args.max_length, label_offset=1),
+                              tokenizer, args.batch_size, args.max_length, shuffle=False)
+    extra_loader = None
+    if args.unlabeled_csv:
+        # Only the text column is read; the labels come from the teacher
+        unlabeled = make_loader(load_csv_dataset(args.unlabeled_csv, tokenizer, args.max_length, label_column=None),
+                                tokenizer, args.batch_size, args.max_length, shuffle=False)
+        store = pseudo_labeling(teacher, unlabeled, device, confidence_threshold=args.confidence_threshold,
+                                max_length=args.max_length)
+        print(f"{len(store)} pseudo-labeled rows added")
+        extra_loader = DataLoader(store, batch_size=args.batch_size, shuffle=True)
+
+    history = train_student(student, teacher, train_loader, device, epochs=args.epochs, lr=args.lr,
+                            temperature=args.temperature, alpha=args.alpha, extra_loader=extra_loader,
+                            precision=args.precision)
+    save_student(student, args.output)
+    print(f"Student saved to {args.output}")
+
+    report = {'student_layers': student.bert.config.num_hidden_layers, 'history': history,
+              **compare_models({'student': student, 'teacher': teacher}, test_loader, device)}
+    report['speedup'] = (report['student']['rows_per_second'] / report['teacher']['rows_per_second']
+                         if report['teacher']['rows_per_second'] else 0.0)
+    report['accuracy_delta'] = report['student']['accuracy'] - report['teacher']['accuracy']
+    print(f"Speedup: {report['speedup']:.2f}x | Accuracy delta: {report['accuracy_delta']:+.4f}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
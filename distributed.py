@@ -0,0 +1,134 @@
+"""Multi-process data-parallel CPU training.
+
+`launch` starts `world_size` local processes that join a gloo process group;
+`train_worker` runs `train_model` in each of them on a DistributedDataParallel
+HybridClassifier, with every rank reading its own shard of the data through a
+DistributedSampler. The cores are split between the ranks so intra-op threads
+do not oversubscribe the machine. Metrics are all-reduced by `train_model` and
+checkpoints are written by rank 0 only.
+
+    from distributed import launch, train_worker
+    history = launch(train_worker, 4, args=(train_dataset, val_dataset, num_classes))
+"""
+
+import os
+import socket
+import sys
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, DistributedSampler, Subset
+
+from checkpoint import CheckpointManager
+from model import HybridClassifier
+from telemetry import TrainingTelemetry
+from training import train_model
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Intra-op threads per rank so that all ranks together use each core once
+def threads_per_rank(world_size):
+    return max(1, available_cpus() // world_size)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def init_process(rank, world_size, master_port, threads=None, master_addr='127.0.0.1', backend='gloo'):
+    os.environ['MASTER_ADDR'] = master_addr
+    os.environ['MASTER_PORT'] = str(master_port)
+    torch.set_num_threads(threads or threads_per_rank(world_size))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Already set, or parallel work already ran in this process
+    dist.init_process_group(backend, rank=rank, world_size=world_size)
+
+
+# DistributedSampler that moves to the next epoch after each pass, like the other samplers in data.py,
+# so the shuffle changes every epoch without the training loop calling set_epoch
+class EpochDistributedSampler(DistributedSampler):
+    def __iter__(self):
+        yield from super().__iter__()
+        self.epoch += 1
+
+
+def distributed_loader(dataset, batch_size=16, shuffle=True, seed=42, num_workers=0):
+    sampler = EpochDistributedSampler(dataset, shuffle=shuffle, seed=seed)
+    return DataLoader(dataset, batch_size=batch_size, sampler=sampler, num_workers=num_workers)
+
+
+# Every rank evaluates rows rank, rank + world_size, ... of the dataset. Unlike DistributedSampler
+# nothing is padded, so each row is counted exactly once in the all-reduced metrics.
+def validation_loader(dataset, batch_size=16, num_workers=0):
+    shard = Subset(dataset, range(dist.get_rank(), len(dataset), dist.get_world_size()))
+    return DataLoader(shard, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+
+
+def _entry(rank, fn, world_size, master_port, threads, args, kwargs, results):
+    init_process(rank, world_size, master_port, threads)
+    if rank != 0:
+        # Only rank 0 prints progress
+        os.environ['TQDM_DISABLE'] = '1'
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        result = fn(rank, world_size, *args, **kwargs)
+        if rank == 0:
+            results.put(result)
+    finally:
+        dist.destroy_process_group()
+
+
+# Run fn(rank, world_size, *args, **kwargs) in `world_size` local processes and return rank 0's result.
+# Arguments are pickled into every process; tensors in them are shared rather than copied.
+def launch(fn, world_size, args=(), kwargs=None, threads=None):
+    results = mp.get_context('spawn').SimpleQueue()
+    context = mp.spawn(_entry, args=(fn, world_size, free_port(), threads, args, kwargs or {}, results),
+                       nprocs=world_size, join=False)
+    # Read the result while the ranks run: a result larger than the pipe buffer blocks rank 0
+    # in put() until it is read, so joining first could wait forever. join() raises if a rank failed.
+    result = None
+    while True:
+        if not results.empty():
+            result = results.get()
+        if context.join(timeout=0.1):
+            break
+    if not results.empty():
+        result = results.get()
+    return result
+
+
+# One rank of data-parallel training: builds the model, wraps it in DDP and runs train_model.
+# `config` builds a randomly initialized BERT instead of downloading `bert_model_name`.
+# Rank 0 saves the unwrapped state dict to `save_path` at the end.
+def train_worker(rank, world_size, train_dataset, val_dataset, num_classes, bert_model_name='bert-base-uncased',
+                 config=None, epochs=3, batch_size=16, lr=5e-5, seed=42, checkpoint_dir=None,
+                 checkpoint_every=500, resume=False, save_path=None, **train_kwargs):
+    torch.manual_seed(seed)
+    model = HybridClassifier(num_classes, bert_model_name=bert_model_name, config=config)
+    model = DistributedDataParallel(model)
+
+    train_loader = distributed_loader(train_dataset, batch_size=batch_size, shuffle=True, seed=seed)
+    val_loader = validation_loader(val_dataset, batch_size=batch_size)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=lr)
+    criterion = torch.nn.CrossEntropyLoss()
+    checkpoints = CheckpointManager(checkpoint_dir, every_steps=checkpoint_every) if checkpoint_dir else None
+
+    history = train_model(model, train_loader, val_loader, criterion, optimizer, 'cpu', epochs=epochs,
+                          telemetry=TrainingTelemetry('cpu', flush_every=0), checkpoints=checkpoints,
+                          resume=resume, **train_kwargs)
+    if save_path and rank == 0:
+        torch.save(model.module.state_dict(), save_path)
+    for report in history:
+        report['threads_per_rank'] = torch.get_num_threads()
+    return history
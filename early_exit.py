@@ -0,0 +1,174 @@
+"""Confidence-based early exit for HybridClassifier.
+
+Small exit heads read the [CLS] hidden state after some intermediate encoder
+layers. At inference a row leaves the batch as soon as an exit head's softmax
+confidence reaches `threshold`, and the remaining layers only run on the rows
+that are still undecided. Rows that never pass the threshold go through all
+layers and the original pooler + heads.
+
+    early_exit_model = EarlyExitClassifier(model, exit_layers=(3, 6, 9))
+    train_exit_heads(early_exit_model, train_loader, device)
+    report = early_exit_report(early_exit_model, test_loader, device, thresholds=(0.9, 0.95, 0.99))
+"""
+
+import time
+
+import torch
+import torch.nn as nn
+from tqdm import tqdm
+
+from evaluation import evaluate_model
+from freezing import frozen
+
+
+class EarlyExitClassifier(nn.Module):
+    def __init__(self, base, exit_layers=(3, 6, 9), threshold=0.9, dropout=0.1):
+        super(EarlyExitClassifier, self).__init__()
+        self.base = base  # A HybridClassifier; its weights are not changed by the exit heads
+        self.num_layers = base.bert.config.num_hidden_layers
+        self.exit_layers = sorted(layer for layer in exit_layers if 0 < layer < self.num_layers)
+        hidden_size = base.bert.config.hidden_size
+        num_classes = base.flat_classifier.out_features
+        self.exit_heads = nn.ModuleDict({
+            str(layer): nn.Sequential(nn.Dropout(dropout), nn.Linear(hidden_size, num_classes))
+            for layer in self.exit_layers
+        })
+        # None runs every row through all layers
+        self.threshold = threshold
+        self.reset_exit_stats()
+
+    def reset_exit_stats(self):
+        self.rows = 0
+        self.layers_executed = 0
+        self.exit_counts = {layer: 0 for layer in self.exit_layers + [self.num_layers]}
+
+    def exit_stats(self):
+        return {
+            'rows': self.rows,
+            'average_layers': self.layers_executed / self.rows if self.rows else 0.0,
+            'exit_counts': dict(self.exit_counts),
+        }
+
+    # Logits of every exit head plus the final classifier, from one full encoder pass
+    def exit_logits(self, input_ids, attention_mask):
+        outputs = self.base.bert(input_ids=input_ids, attention_mask=attention_mask, output_hidden_states=True)
+        logits = [self.exit_heads[str(layer)](outputs.hidden_states[layer][:, 0]) for layer in self.exit_layers]
+        return logits + [self.base.classify(outputs.pooler_output)]
+
+    def forward(self, input_ids, attention_mask):
+        if self.training or self.threshold is None:
+            logits = self.base(input_ids=input_ids, attention_mask=attention_mask)
+            layers = torch.full((input_ids.size(0),), self.num_layers, dtype=torch.long)
+        else:
+            logits, layers = self.early_exit(input_ids, attention_mask)
+        if not self.training:
+            self.rows += layers.numel()
+            self.layers_executed += int(layers.sum())
+            for layer, count in zip(*torch.unique(layers.cpu(), return_counts=True)):
+                self.exit_counts[int(layer)] += int(count)
+        return logits
+
+    @staticmethod
+    def _run_layer(layer, hidden, extended_mask):
+        outputs = layer(hidden, attention_mask=extended_mask)
+        return outputs[0] if isinstance(outputs, tuple) else outputs
+
+    # Per-row early exit: returns the logits and the number of encoder layers each row went through
+    def early_exit(self, input_ids, attention_mask):
+        bert = self.base.bert
+        batch_size = input_ids.size(0)
+        active = torch.arange(batch_size, device=input_ids.device)  # Original positions of the rows still running
+        layers = torch.full((batch_size,), self.num_layers, dtype=torch.long, device=input_ids.device)
+        logits = None
+
+        hidden = bert.embeddings(input_ids=input_ids)
+        extended_mask = bert.get_extended_attention_mask(attention_mask, input_ids.shape)
+        for index, layer in enumerate(bert.encoder.layer, start=1):
+            hidden = self._run_layer(layer, hidden, extended_mask)
+            if str(index) not in self.exit_heads:
+                continue
+            head_logits = self.exit_heads[str(index)](hidden[:, 0])
+            if logits is None:
+                logits = head_logits.new_zeros(batch_size, head_logits.size(1))
+            confident = torch.softmax(head_logits.float(), dim=1).max(dim=1).values >= self.threshold
+            if not confident.any():
+                continue
+            exited = active[confident]
+            logits[exited] = head_logits[confident]
+            layers[exited] = index
+            # Drop the decided rows so the next layers only run on the rest
+            keep = ~confident
+            active, hidden, extended_mask = active[keep], hidden[keep], extended_mask[keep]
+            if len(active) == 0:
+                return logits, layers
+
+        final_logits = self.base.classify(bert.pooler(hidden))
+        if logits is None:
+            logits = final_logits.new_zeros(batch_size, final_logits.size(1))
+        logits[active] = final_logits.to(logits.dtype)
+        return logits, layers
+
+
+# Train only the exit heads on the labeled loader; the encoder and the final heads stay frozen
+# while it runs and get their requires_grad flags back afterwards
+def train_exit_heads(model, train_loader, device, epochs=2, lr=1e-3):
+    with frozen(model.base):
+        model.to(device)
+        model.base.eval()  # Frozen encoder without dropout, so the heads see the hidden states used at inference
+        optimizer = torch.optim.AdamW(model.exit_heads.parameters(), lr=lr)
+        criterion = nn.CrossEntropyLoss()
+
+        for epoch in range(epochs):
+            model.exit_heads.train()
+            total_loss = torch.zeros((), device=device)
+            correct = torch.zeros(len(model.exit_layers), dtype=torch.long, device=device)
+            samples, num_batches = 0, 0
+            for batch in tqdm(train_loader, desc=f"Training exit heads (epoch {epoch + 1}/{epochs})"):
+                input_ids = batch['input_ids'].to(device)
+                attention_mask = batch['attention_mask'].to(device)
+                labels = batch['labels'].to(device)
+                with torch.no_grad():
+                    outputs = model.base.bert(input_ids=input_ids, attention_mask=attention_mask,
+                                              output_hidden_states=True)
+                loss = 0
+                for position, layer in enumerate(model.exit_layers):
+                    head_logits = model.exit_heads[str(layer)](outputs.hidden_states[layer][:, 0])
+                    loss = loss + criterion(head_logits, labels)
+                    correct[position] += (head_logits.argmax(dim=1) == labels).sum()
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+                total_loss += loss.detach()
+                samples += labels.size(0)
+                num_batches += 1
+
+            accuracies = (correct.float() / max(samples, 1)).tolist()
+            print(f"Exit head loss: {total_loss.item() / max(num_batches, 1):.4f} | Accuracy per exit: " +
+                  ", ".join(f"layer {layer} {accuracy:.4f}" for layer, accuracy in zip(model.exit_layers, accuracies)))
+    model.eval()
+    return model
+
+
+# Average layers executed, speedup and accuracy cost of each threshold against running all layers
+def early_exit_report(model, test_loader, device, thresholds=(0.9, 0.95, 0.99)):
+    model.to(device).eval()
+    results = []
+    for threshold in (None,) + tuple(thresholds):
+        model.threshold = threshold
+        model.reset_exit_stats()
+        start = time.perf_counter()
+        metrics = evaluate_model(model, test_loader, device, verbose=False)
+        seconds = time.perf_counter() - start
+        results.append({'threshold': threshold, 'seconds': seconds, 'accuracy': metrics['accuracy'],
+                        'f1_weighted': metrics['f1_weighted'], **model.exit_stats()})
+
+    baseline = results[0]
+    print(f"{'threshold':>9} {'avg layers':>10} {'speedup':>8} {'accuracy':>9} {'delta':>8}")
+    for result in results:
+        result['speedup'] = baseline['seconds'] / result['seconds'] if result['seconds'] else 0.0
+        result['accuracy_delta'] = result['accuracy'] - baseline['accuracy']
+        label = 'all' if result['threshold'] is None else f"{result['threshold']:.2f}"
+        print(f"{label:>9} {result['average_layers']:>10.2f} {result['speedup']:>7.2f}x "
+              f"{result['accuracy']:>9.4f} {result['accuracy_delta']:>+8.4f}")
+    model.threshold = thresholds[0] if thresholds else None
+    return results
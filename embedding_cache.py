@@ -0,0 +1,206 @@
+"""Frozen-encoder embedding cache for head-only training.
+
+With `self.bert` frozen, the pooled output of every example never changes, so
+it is computed once and stored in a memory-mapped file. The heads
+(`flat_classifier`, `hierarchical_classifier`) then train for many epochs on
+the cached vectors. Entries are keyed by a hash of the tokenized input and the
+cache lives in a directory named after the encoder's weight fingerprint, so
+changing the encoder weights switches to a fresh cache and removes the old one.
+Training reads the vectors batch by batch from the memory map, so the pool is
+never loaded into memory as a whole.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from tqdm import tqdm
+
+from data import BatchIndexSampler, make_batch_loader
+from freezing import frozen
+from model import state_fingerprint
+
+# Written into every fingerprint directory, so only directories made by EmbeddingCache are ever removed
+MARKER = '.embedding_cache'
+FINGERPRINT_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+# Hash of one tokenized row, ignoring the padding after its last real token
+def input_key(input_ids, attention_mask):
+    length = int(attention_mask.sum())
+    return hashlib.blake2b(input_ids[:length].to(torch.int64).cpu().numpy().tobytes(), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir, encoder, capacity=1024):
+        self.cache_dir = cache_dir
+        self.encoder = encoder
+        self.hidden_size = encoder.config.hidden_size
+        self.initial_capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._open(state_fingerprint(encoder))
+
+    def _open(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.directory = os.path.join(self.cache_dir, fingerprint)
+        os.makedirs(self.directory, exist_ok=True)
+        open(os.path.join(self.directory, MARKER), 'a').close()
+        # Caches built for other encoder weights can never be hit again
+        for entry in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, entry)
+            if (entry != fingerprint and FINGERPRINT_PATTERN.fullmatch(entry)
+                    and os.path.exists(os.path.join(path, MARKER))):
+                shutil.rmtree(path, ignore_errors=True)
+
+        self.keys_path = os.path.join(self.directory, 'keys.txt')
+        self.vectors_path = os.path.join(self.directory, 'embeddings.f32')
+        self.index = {}
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path) as f:
+                for row, key in enumerate(f.read().split()):
+                    self.index[key] = row
+        self.size = len(self.index)
+        self.capacity = 0
+        self._grow(max(self.initial_capacity, self.size))
+
+    def _grow(self, capacity):
+        # Growing the file in place keeps the existing vectors where they are
+        with open(self.vectors_path, 'ab') as f:
+            f.truncate(capacity * self.hidden_size * 4)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.hidden_size))
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.size
+
+    # Re-fingerprint the encoder and start over if its weights changed since the cache was opened
+    def ensure_current(self):
+        fingerprint = state_fingerprint(self.encoder)
+        if fingerprint != self.fingerprint:
+            self._open(fingerprint)
+        return self
+
+    def lookup(self, keys):
+        return [self.index.get(key, -1) for key in keys]
+
+    def add(self, keys, vectors):
+        vectors = vectors.detach().float().cpu().numpy()
+        if self.size + len(keys) > self.capacity:
+            capacity = self.capacity
+            while capacity < self.size + len(keys):
+                capacity *= 2
+            self._grow(capacity)
+        rows = list(range(self.size, self.size + len(keys)))
+        self.vectors[self.size:self.size + len(keys)] = vectors
+        with open(self.keys_path, 'a') as f:
+            f.write("".join(f"{key}\n" for key in keys))
+        for key, row in zip(keys, rows):
+            self.index[key] = row
+        self.size += len(keys)
+        return rows
+
+    def flush(self):
+        self.vectors.flush()
+
+    def get(self, rows):
+        return torch.from_numpy(np.asarray(self.vectors[rows]))
+
+
+# Cached vectors and labels of a loader's rows, indexed a whole batch at a time like
+# data.BatchSliceDataset. Only the rows of the requested batch are read from the memory map.
+class CachedEmbeddingDataset(Dataset):
+    def __init__(self, cache, rows, labels):
+        self.cache = cache
+        self.rows = torch.as_tensor(rows, dtype=torch.long)
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, indices):
+        return self.cache.get(self.rows[indices].numpy()), self.labels[indices]
+
+
+# Pooled vectors for every row of `loader`, encoding only rows missing from the cache.
+# Returns a CachedEmbeddingDataset in loader order.
+def cached_embeddings(cache, loader, device, desc="Caching embeddings"):
+    cache.ensure_current()
+    encoder = cache.encoder
+    encoder.eval()
+    rows, labels = [], []
+    with torch.no_grad():
+        for batch in tqdm(loader, desc=desc):
+            keys = [input_key(ids, mask) for ids, mask in zip(batch['input_ids'], batch['attention_mask'])]
+            found = cache.lookup(keys)
+            missing = [index for index, row in enumerate(found) if row < 0]
+            cache.hits += len(keys) - len(missing)
+            cache.misses += len(missing)
+            if missing:
+                # Rows repeated inside one batch are encoded once
+                unique = {}
+                for index in missing:
+                    unique.setdefault(keys[index], index)
+                positions = torch.tensor(list(unique.values()))
+                outputs = encoder(input_ids=batch['input_ids'][positions].to(device),
+                                  attention_mask=batch['attention_mask'][positions].to(device))
+                new_rows = dict(zip(unique, cache.add(list(unique), outputs.pooler_output)))
+                found = [row if row >= 0 else new_rows[key] for key, row in zip(keys, found)]
+            rows.extend(found)
+            labels.append(torch.as_tensor(batch['labels']).cpu())
+    cache.flush()
+    return CachedEmbeddingDataset(cache, rows, torch.cat(labels))
+
+
+# Train only the heads of a HybridClassifier on cached pooled outputs.
+# self.bert is frozen (requires_grad=False) while it runs, and only for rows not yet cached;
+# its requires_grad flags are restored afterwards.
+def train_heads(model, train_loader, cache, device, epochs=20, lr=1e-3, batch_size=256, val_loader=None):
+    with frozen(model.bert):
+        model.to(device)
+
+        train_dataset = cached_embeddings(cache, train_loader, device)
+        if val_loader is not None:
+            val_dataset = cached_embeddings(cache, val_loader, device, desc="Caching validation embeddings")
+            val_batches = make_batch_loader(val_dataset, BatchIndexSampler(len(val_dataset), batch_size, shuffle=False))
+
+        head_params = list(model.flat_classifier.parameters()) + list(model.hierarchical_classifier.parameters())
+        optimizer = torch.optim.AdamW(head_params, lr=lr)
+        criterion = torch.nn.CrossEntropyLoss()
+        loader = make_batch_loader(train_dataset, BatchIndexSampler(len(train_dataset), batch_size, shuffle=True))
+
+        history = []
+        for epoch in range(epochs):
+            model.train()
+            total_loss = torch.zeros((), device=device)
+            correct = torch.zeros((), dtype=torch.long, device=device)
+            for embeddings, labels in loader:
+                embeddings, labels = embeddings.to(device), labels.to(device)
+                outputs = model.classify(embeddings)
+                loss = criterion(outputs, labels)
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+                total_loss += loss.detach() * labels.size(0)
+                correct += (outputs.argmax(dim=1) == labels).sum()
+            epoch_stats = {'epoch': epoch + 1, 'loss': total_loss.item() / len(train_dataset),
+                           'accuracy': correct.item() / len(train_dataset)}
+
+            if val_loader is not None:
+                model.eval()
+                val_correct = torch.zeros((), dtype=torch.long, device=device)
+                with torch.no_grad():
+                    for embeddings, labels in val_batches:
+                        outputs = model.classify(embeddings.to(device))
+                        val_correct += (outputs.argmax(dim=1) == labels.to(device)).sum()
+                epoch_stats['val_accuracy'] = val_correct.item() / max(len(val_dataset), 1)
+            history.append(epoch_stats)
+            print(" | ".join(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}"
+                             for key, value in epoch_stats.items()))
+
+    print(f"Embedding cache: {cache.hits} hits, {cache.misses} misses, {len(cache)} vectors")
+    return history
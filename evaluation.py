@@ -0,0 +1,99 @@
+"""Evaluation helpers that return metrics instead of only printing them."""
+
+import torch
+from tqdm import tqdm
+
+from metrics import ConfusionMatrixAccumulator, format_report
+from model import state_fingerprint
+from prediction_cache import DedupIndex, batch_logits
+
+
+# Metrics for labels/predictions that are already collected (arrays or tensors)
+def compute_metrics(labels, preds, num_classes=None):
+    labels = torch.as_tensor(labels).long()
+    preds = torch.as_tensor(preds).long()
+    if num_classes is None:
+        num_classes = int(max(labels.max(), preds.max())) + 1 if len(labels) else 1
+    accumulator = ConfusionMatrixAccumulator(num_classes)
+    accumulator.update(preds, labels)
+    return accumulator.compute()
+
+
+def plot_confusion_matrix(matrix, class_names):
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(8, 6))
+    sns.heatmap(matrix, annot=True, fmt='d', cmap='Blues', xticklabels=class_names, yticklabels=class_names)
+    plt.ylabel('Actual')
+    plt.xlabel('Predicted')
+    plt.title('Confusion Matrix')
+    plt.show()
+
+
+# Evaluate the model and calculate all relevant metrics.
+# Predictions go into a confusion matrix on the device, so there is no per-batch host
+# transfer, and every metric comes from that one matrix. The number of classes is
+# taken from the model's output width unless given.
+# With dedup=True duplicate rows in a batch are run through the model once; with `cache` (a
+# PredictionCache, implies dedup) rows already predicted by the same weights, in this or an
+# earlier call, are not run at all.
+# dedup may also be a DedupIndex over the cleaned text column (see prediction_cache.tokenize_unique):
+# test_loader then yields only the index's unique rows, in order, so duplicates are neither tokenized
+# nor scored, and the predictions are scattered back to every row. They are scored against `labels`
+# (one per row) or, without it, against each unique row's label.
+def evaluate_model(model, test_loader, device, class_names=None, num_classes=None, verbose=True, plot=False,
+                   cache=None, dedup=False, labels=None):
+    model.eval()
+    accumulator = None
+    model_hash = state_fingerprint(model) if cache is not None else None
+    text_index = dedup if isinstance(dedup, DedupIndex) else None
+    unique_preds, unique_labels = [], []
+    with torch.no_grad():
+        for batch in tqdm(test_loader, desc="Evaluating"):
+            batch_labels = batch['labels'].to(device)
+
+            # The rows of a text-level index are already unique
+            outputs = batch_logits(model, batch['input_ids'], batch['attention_mask'], device,
+                                   cache=cache, model_hash=model_hash, dedup=text_index is None and dedup)
+            if accumulator is None:
+                accumulator = ConfusionMatrixAccumulator(num_classes or outputs.size(1), device=outputs.device)
+            if text_index is None:
+                accumulator.update_logits(outputs, batch_labels)
+            else:
+                unique_preds.append(outputs.argmax(dim=1))
+                unique_labels.append(batch_labels)
+
+    if accumulator is None:
+        raise ValueError("test_loader produced no batches")
+    if text_index is not None:
+        preds = torch.cat(unique_preds)
+        if len(preds) != len(text_index):
+            raise ValueError(f"test_loader yielded {len(preds)} rows but the dedup index has "
+                             f"{len(text_index)} unique rows")
+        if labels is None:
+            labels = text_index.scatter(torch.cat(unique_labels))
+        accumulator.update(text_index.scatter(preds), torch.as_tensor(labels))
+    # Under torch.distributed each rank saw one shard of the loader
+    metrics = accumulator.all_reduce().compute()
+    class_names = class_names or [f"Class {index + 1}" for index in range(accumulator.num_classes)]
+
+    if verbose:
+        print(f"\nTest Accuracy: {metrics['accuracy']:.4f}")
+        print(f"Precision (weighted): {metrics['precision_weighted']:.4f}")
+        print(f"Recall (weighted): {metrics['recall_weighted']:.4f}")
+        print(f"F1-Score (weighted): {metrics['f1_weighted']:.4f}")
+        if metrics['ignored']:
+            print(f"Warning: {metrics['ignored']} rows had labels outside 0..{accumulator.num_classes - 1} "
+                  f"and were left out of the metrics")
+        print("\nClassification Report:")
+        print(format_report(metrics, class_names))
+        print("\nConfusion Matrix:")
+        print(accumulator.matrix.cpu().numpy())
+        if cache is not None:
+            stats = cache.stats()
+            print(f"\nPrediction cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses "
+                  f"({stats['cache_hit_rate']:.1%} hit rate)")
+    if plot:
+        plot_confusion_matrix(accumulator.matrix.cpu().numpy(), class_names)
+    return metrics
@@ -0,0 +1,68 @@
+"""Export a trained HybridClassifier as a self-contained TorchScript artifact.
+
+The artifact directory holds the frozen, traced model (model.ts), the fast
+tokenizer definition (tokenizer.json) and meta.json. compiled.CompiledClassifier
+loads it with torch + tokenizers only, fully offline.
+
+    python export.py --checkpoint hybrid_classifier_model.pt --output-dir hybrid_classifier_ts
+"""
+
+import argparse
+import json
+import os
+
+import torch
+from transformers import AutoTokenizer
+
+from model import load_hybrid_classifier
+
+
+def export_torchscript(model, tokenizer, output_dir, max_length=128, optimize=True):
+    os.makedirs(output_dir, exist_ok=True)
+    model = model.cpu().eval()
+
+    # Trace on a batch padded to max_length that really contains padding, so the
+    # attention-mask path is recorded in the graph. Inputs are always padded to
+    # max_length at run time, which keeps the traced shapes valid.
+    example = tokenizer(["example text", "a somewhat longer example text for tracing"],
+                        padding='max_length', truncation=True, max_length=max_length, return_tensors='pt')
+    with torch.no_grad():
+        traced = torch.jit.trace(model, (example['input_ids'], example['attention_mask']), strict=False)
+        if optimize:
+            traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        # Make sure the exported graph reproduces the eager model
+        expected = model(input_ids=example['input_ids'], attention_mask=example['attention_mask'])
+        actual = traced(example['input_ids'], example['attention_mask'])
+        torch.testing.assert_close(actual, expected, rtol=1e-3, atol=1e-4)
+
+    torch.jit.save(traced, os.path.join(output_dir, 'model.ts'))
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, 'tokenizer.json'))
+    with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+        json.dump({
+            'max_length': max_length,
+            'num_classes': model.flat_classifier.out_features,
+            'pad_token_id': tokenizer.pad_token_id,
+            'pad_token': tokenizer.pad_token,
+        }, f, indent=2)
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='hybrid_classifier_model.pt')
+    parser.add_argument('--num-classes', type=int, default=4)
+    parser.add_argument('--bert-model', default='bert-base-uncased')
+    parser.add_argument('--max-length', type=int, default=128)
+    parser.add_argument('--output-dir', default='hybrid_classifier_ts')
+    parser.add_argument('--no-optimize', action='store_true', help="skip freezing/optimize_for_inference")
+    args = parser.parse_args()
+
+    model = load_hybrid_classifier(args.checkpoint, args.num_classes, bert_model_name=args.bert_model)
+    # Always the Rust-backed tokenizer, its JSON definition is what the runtime loads
+    tokenizer = AutoTokenizer.from_pretrained(args.bert_model, use_fast=True)
+    export_torchscript(model, tokenizer, args.output_dir, max_length=args.max_length, optimize=not args.no_optimize)
+    print(f"Exported TorchScript artifact to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Activation checkpointing and layer-freezing schedules for HybridClassifier.
+
+Activation checkpointing keeps only the input of every BERT layer during the
+forward pass and recomputes the rest in backward, trading compute for
+activation memory. A `FreezeSchedule` decides per epoch how many of the top
+encoder layers are trained; the others (and the embeddings) get
+requires_grad=False, so autograd does not build a graph through them, and are
+removed from the optimizer together with their AdamW state. The pooler and the
+classification heads are always trained.
+
+    schedule = FreezeSchedule.gradual(start_layers=0, every=1, step=4)  # heads, then 4, 8, all layers
+    train_model(model, train_loader, val_loader, criterion, optimizer, device,
+                activation_checkpointing=True, freeze_schedule=schedule)
+"""
+
+import contextlib
+
+
+def _unwrap(model):
+    return getattr(model, 'module', model)  # DistributedDataParallel
+
+
+# Turn activation checkpointing of the BERT encoder on or off (only active in train mode)
+def set_activation_checkpointing(model, enabled=True):
+    bert = _unwrap(model).bert
+    if enabled:
+        # The non-reentrant variant also works when the embeddings below are frozen
+        bert.gradient_checkpointing_enable(gradient_checkpointing_kwargs={'use_reentrant': False})
+    elif bert.is_gradient_checkpointing:
+        bert.gradient_checkpointing_disable()
+    return model
+
+
+def _set_trainable(module, trainable):
+    for param in module.parameters():
+        param.requires_grad = trainable
+        if not trainable:
+            param.grad = None
+
+
+# requires_grad=False for every parameter of `module` inside the block; the previous flags
+# are restored on exit, also when the block raises
+@contextlib.contextmanager
+def frozen(module):
+    flags = [(param, param.requires_grad) for param in module.parameters()]
+    for param, _ in flags:
+        param.requires_grad = False
+    try:
+        yield module
+    finally:
+        for param, flag in flags:
+            param.requires_grad = flag
+
+
+def trainable_parameter_count(model):
+    return sum(param.numel() for param in model.parameters() if param.requires_grad)
+
+
+# milestones: {epoch: number of top encoder layers to train}, each in effect until the next
+# milestone. None trains every layer and the embeddings. Epochs before the first milestone
+# train everything. DistributedDataParallel fixes its parameter set when it wraps the model,
+# so schedules are meant for single-process training.
+class FreezeSchedule:
+    def __init__(self, milestones):
+        self.milestones = dict(sorted(milestones.items()))
+        self._group_params = None
+
+    # Start with `start_layers` trainable layers and unfreeze `step` more every `every` epochs
+    @classmethod
+    def gradual(cls, start_layers=0, every=1, step=1, num_layers=12):
+        milestones, epoch, layers = {}, 0, start_layers
+        while layers < num_layers:
+            milestones[epoch] = layers
+            epoch, layers = epoch + every, layers + step
+        milestones[epoch] = None
+        return cls(milestones)
+
+    def trainable_layers(self, epoch):
+        layers = None
+        for milestone, value in self.milestones.items():
+            if milestone > epoch:
+                break
+            layers = value
+        return layers
+
+    # Set requires_grad for `epoch` and keep only the trainable parameters in the optimizer.
+    # Returns the number of trainable encoder layers.
+    def apply(self, model, optimizer, epoch):
+        bert = _unwrap(model).bert
+        layers = bert.encoder.layer
+        trainable = self.trainable_layers(epoch)
+        _set_trainable(bert.embeddings, trainable is None)
+        trainable = len(layers) if trainable is None else min(trainable, len(layers))
+        for index, layer in enumerate(layers):
+            _set_trainable(layer, index >= len(layers) - trainable)
+        if optimizer is not None:
+            self._sync_optimizer(optimizer)
+        return trainable
+
+    def _sync_optimizer(self, optimizer):
+        # Every parameter the optimizer was built with, so unfrozen layers can be added back later
+        if self._group_params is None:
+            self._group_params = [list(group['params']) for group in optimizer.param_groups]
+        for group, params in zip(optimizer.param_groups, self._group_params):
+            group['params'] = [param for param in params if param.requires_grad]
+            for param in params:
+                if not param.requires_grad:
+                    # Frozen parameters give their AdamW moments back; they restart from zero when unfrozen
+                    optimizer.state.pop(param, None)
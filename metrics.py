@@ -0,0 +1,115 @@
+"""Streaming classification metrics computed from a single confusion matrix."""
+
+import torch
+import torch.distributed as dist
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+# Rank 0 under torch.distributed, otherwise the only process
+def is_main_process():
+    return not is_distributed() or dist.get_rank() == 0
+
+
+# Sum each tensor in place over all processes; a no-op outside torch.distributed
+def all_reduce_sum(*tensors):
+    if is_distributed():
+        for tensor in tensors:
+            dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensors
+
+
+# Confusion matrix that is updated on the model's device without any host sync.
+# Rows are true labels, columns predictions. Labels or predictions outside
+# [0, num_classes) are counted separately in `ignored` instead of raising.
+class ConfusionMatrixAccumulator:
+    def __init__(self, num_classes, device='cpu'):
+        self.num_classes = num_classes
+        self.device = torch.device(device)
+        # One extra bin at the end collects out-of-range rows
+        self.counts = torch.zeros(num_classes * num_classes + 1, dtype=torch.long, device=self.device)
+
+    def reset(self):
+        self.counts.zero_()
+
+    def update(self, preds, labels):
+        preds = preds.to(self.device, non_blocking=True).long().flatten()
+        labels = labels.to(self.device, non_blocking=True).long().flatten()
+        size = self.num_classes
+        valid = (labels >= 0) & (labels < size) & (preds >= 0) & (preds < size)
+        index = torch.where(valid, labels * size + preds, torch.full_like(labels, size * size))
+        # index_add_ instead of bincount, which has to read the max back to the host on CUDA
+        self.counts.index_add_(0, index, torch.ones_like(index))
+
+    def update_logits(self, logits, labels):
+        self.update(logits.argmax(dim=1), labels)
+
+    # Merge another accumulator (e.g. from another process) into this one
+    def merge(self, other):
+        self.counts += other.counts.to(self.device)
+
+    # Sum the matrices of all processes, so every rank computes the global metrics
+    def all_reduce(self):
+        all_reduce_sum(self.counts)
+        return self
+
+    @property
+    def matrix(self):
+        return self.counts[:-1].view(self.num_classes, self.num_classes)
+
+    @property
+    def ignored(self):
+        return int(self.counts[-1])
+
+    # Accuracy, per-class and weighted precision/recall/F1 in one pass over the matrix
+    def compute(self):
+        matrix = self.matrix.double().cpu()
+        true_positives = matrix.diag()
+        support = matrix.sum(dim=1)
+        predicted = matrix.sum(dim=0)
+        total = support.sum()
+
+        # Classes that never occur (as label or prediction) score 0, like zero_division=0 in sklearn
+        precision = torch.where(predicted > 0, true_positives / predicted.clamp(min=1), torch.zeros_like(predicted))
+        recall = torch.where(support > 0, true_positives / support.clamp(min=1), torch.zeros_like(support))
+        denominator = precision + recall
+        f1 = torch.where(denominator > 0, 2 * precision * recall / denominator.clamp(min=1e-12),
+                         torch.zeros_like(denominator))
+        weights = support / total if total > 0 else torch.zeros_like(support)
+
+        return {
+            'accuracy': float(true_positives.sum() / total) if total > 0 else 0.0,
+            'precision_weighted': float((precision * weights).sum()),
+            'recall_weighted': float((recall * weights).sum()),
+            'f1_weighted': float((f1 * weights).sum()),
+            'precision_macro': float(precision.mean()),
+            'recall_macro': float(recall.mean()),
+            'f1_macro': float(f1.mean()),
+            'precision_per_class': precision.tolist(),
+            'recall_per_class': recall.tolist(),
+            'f1_per_class': f1.tolist(),
+            'support_per_class': support.long().tolist(),
+            'confusion_matrix': matrix.long().tolist(),
+            'samples': int(total),
+            'ignored': self.ignored,
+        }
+
+
+# Text table in the layout of sklearn's classification_report
+def format_report(metrics, class_names=None):
+    num_classes = len(metrics['support_per_class'])
+    class_names = class_names or [f"Class {index + 1}" for index in range(num_classes)]
+    width = max(len(name) for name in list(class_names) + ['weighted avg'])
+    lines = [f"{'':>{width}}  precision    recall  f1-score   support", ""]
+    for index, name in enumerate(class_names):
+        lines.append(f"{name:>{width}}  {metrics['precision_per_class'][index]:9.4f} "
+                     f"{metrics['recall_per_class'][index]:9.4f} {metrics['f1_per_class'][index]:9.4f} "
+                     f"{metrics['support_per_class'][index]:9d}")
+    lines.append("")
+    lines.append(f"{'accuracy':>{width}}  {'':9} {'':9} {metrics['accuracy']:9.4f} {metrics['samples']:9d}")
+    for average in ('macro', 'weighted'):
+        lines.append(f"{average + ' avg':>{width}}  {metrics['precision_' + average]:9.4f} "
+                     f"{metrics['recall_' + average]:9.4f} {metrics['f1_' + average]:9.4f} {metrics['samples']:9d}")
+    return "\n".join(lines)
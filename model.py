@@ -0,0 +1,90 @@
+"""Hybrid classification model."""
+
+import hashlib
+
+import torch
+import torch.nn as nn
+from transformers import BertModel
+
+
+# Define the Hybrid Classification Model
+class HybridClassifier(nn.Module):
+    def __init__(self, num_classes, bert_model_name='bert-base-uncased', config=None):
+        super(HybridClassifier, self).__init__()
+        if config is not None:
+            self.bert = BertModel(config)  # Randomly initialized, weights are loaded from a checkpoint afterwards
+        else:
+            self.bert = BertModel.from_pretrained(bert_model_name)  # Load pre-trained BERT
+        self.dropout = nn.Dropout(0.3)  # Dropout for regularization
+        self.flat_classifier = nn.Linear(self.bert.config.hidden_size, num_classes)  # Flat classification
+        self.hierarchical_classifier = nn.Linear(self.bert.config.hidden_size, num_classes)  # Hierarchical layer
+
+    # Either token ids or precomputed (e.g. perturbed) word embeddings, as in BertModel
+    def forward(self, input_ids=None, attention_mask=None, inputs_embeds=None):
+        # Pass data through BERT
+        outputs = self.bert(input_ids=input_ids, attention_mask=attention_mask, inputs_embeds=inputs_embeds)
+        pooled_output = outputs.pooler_output  # CLS token representation
+        return self.classify(pooled_output)
+
+    def get_input_embeddings(self):
+        return self.bert.get_input_embeddings()
+
+    # Heads only, on top of a (possibly cached) pooled BERT output
+    def classify(self, pooled_output):
+        # Apply dropout
+        pooled_output = self.dropout(pooled_output)
+
+        # Flat and hierarchical classification
+        flat_output = self.flat_classifier(pooled_output)
+        hierarchical_output = self.hierarchical_classifier(pooled_output)
+
+        # Combine outputs (you can customize this combination logic)
+        combined_output = flat_output + hierarchical_output
+
+        return combined_output
+
+
+def _update_fingerprint(digest, name, value):
+    if isinstance(value, torch.Tensor):
+        if value.is_quantized:
+            # The integer values alone miss requantization with a new scale or zero point
+            scheme = value.qscheme()
+            digest.update(f"{name}|{scheme}".encode())
+            if scheme in (torch.per_channel_affine, torch.per_channel_symmetric,
+                          torch.per_channel_affine_float_qparams):
+                digest.update(f"{name}|axis={value.q_per_channel_axis()}".encode())
+                _update_fingerprint(digest, f"{name}.scales", value.q_per_channel_scales())
+                _update_fingerprint(digest, f"{name}.zero_points", value.q_per_channel_zero_points())
+            else:
+                digest.update(f"{name}|scale={value.q_scale()!r}|zero_point={value.q_zero_point()}".encode())
+            value = value.int_repr()
+        value = value.detach().cpu().contiguous().reshape(-1)
+        digest.update(f"{name}|{value.dtype}|{tuple(value.shape)}".encode())
+        digest.update(value.view(torch.uint8).numpy().tobytes())
+    elif isinstance(value, (tuple, list)):
+        for index, item in enumerate(value):
+            _update_fingerprint(digest, f"{name}.{index}", item)
+    else:
+        digest.update(f"{name}|{value!r}".encode())
+
+
+# Hash of a module's weights; changes whenever any parameter or buffer changes
+def state_fingerprint(module):
+    digest = hashlib.blake2b(digest_size=16)
+    for name, value in module.state_dict().items():
+        _update_fingerprint(digest, name, value)
+    return digest.hexdigest()
+
+
+# Logits from either a HuggingFace output (`.logits`) or a model returning raw logits
+def get_logits(outputs):
+    return getattr(outputs, 'logits', outputs)
+
+
+# Build a HybridClassifier and load trained weights from a state dict checkpoint
+def load_hybrid_classifier(checkpoint_path, num_classes, bert_model_name='bert-base-uncased', device='cpu'):
+    model = HybridClassifier(num_classes, bert_model_name=bert_model_name)
+    model.load_state_dict(torch.load(checkpoint_path, map_location=device))
+    model.to(device)
+    model.eval()
+    return model
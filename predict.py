@@ -0,0 +1,284 @@
+"""Bulk batch prediction for a CSV of any size.
+
+The input is read in chunks by a reader thread. Cleaning and tokenization of
+each chunk run in a thread or process pool, the main thread runs the
+HybridClassifier forward, and a writer thread appends every chunk's
+predictions and probabilities to the output. Bounded queues between the stages
+keep memory flat. After every chunk the number of rows written is saved next to
+the output, so `--resume` continues from that row offset after a crash.
+
+    python predict.py --input "/content/test (1).csv" --output predictions.parquet --checkpoint hybrid_classifier_model.pt
+    python predict.py --input big.csv --output predictions.csv --workers 4 --resume
+
+A .parquet output (needs pyarrow) is a directory of one part file per chunk,
+readable with pd.read_parquet; a .csv output is a single appended file.
+"""
+
+import argparse
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+import torch
+from transformers import AutoTokenizer
+
+from cleaning import clean_series
+from model import get_logits, load_hybrid_classifier
+from quantize import load_quantized
+from streaming import iter_csv_chunks
+
+STAGES = ('read', 'preprocess', 'forward', 'write')
+
+_local = threading.local()
+
+
+# One tokenizer per worker thread or process; fast tokenizers must not be shared between threads
+def _worker_tokenizer(name):
+    tokenizer = getattr(_local, 'tokenizer', None)
+    if tokenizer is None:
+        tokenizer = _local.tokenizer = AutoTokenizer.from_pretrained(name)
+    return tokenizer
+
+
+# Clean and tokenize one chunk into padded batches of rows with similar length.
+# Runs in the worker pool; `positions` map every batch row back to its row in the chunk.
+def prepare_chunk(texts, tokenizer_name, batch_size, max_length):
+    start = time.perf_counter()
+    tokenizer = _worker_tokenizer(tokenizer_name)
+    cleaned = clean_series(texts).tolist()
+    encoded = tokenizer(cleaned, truncation=True, max_length=max_length)['input_ids']
+    order = sorted(range(len(encoded)), key=lambda row: len(encoded[row]))
+    batches = []
+    for offset in range(0, len(order), batch_size):
+        positions = order[offset:offset + batch_size]
+        padded = tokenizer.pad({'input_ids': [encoded[row] for row in positions]}, return_tensors='pt')
+        batches.append((torch.tensor(positions), padded['input_ids'], padded['attention_mask']))
+    return batches, time.perf_counter() - start
+
+
+# Appends prediction chunks to a CSV file or a directory of Parquet parts and records the row offset
+class PredictionWriter:
+    def __init__(self, path, output_format=None, resume=False):
+        self.path = path.rstrip('/')
+        self.format = output_format or ('parquet' if self.path.endswith('.parquet') else 'csv')
+        self.progress_path = self.path + '.progress.json'
+        self.rows_done, self.output_bytes = 0, 0
+        if resume and os.path.exists(self.progress_path):
+            with open(self.progress_path) as f:
+                progress = json.load(f)
+            self.rows_done, self.output_bytes = progress['rows_done'], progress['output_bytes']
+
+        if self.format == 'csv':
+            if os.path.exists(self.path):
+                # Drop anything written after the last recorded chunk (e.g. a half-written one)
+                with open(self.path, 'r+b') as f:
+                    f.truncate(self.output_bytes)
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            for part in glob.glob(os.path.join(self.path, 'part-*.parquet')):
+                if int(os.path.basename(part)[5:-8]) >= self.rows_done:
+                    os.remove(part)
+
+    def write(self, frame, start_row):
+        if self.format == 'csv':
+            frame.to_csv(self.path, mode='a', header=self.output_bytes == 0, index=False)
+            self.output_bytes = os.path.getsize(self.path)
+        else:
+            frame.to_parquet(os.path.join(self.path, f"part-{start_row:012d}.parquet"), index=False)
+        self.rows_done = start_row + len(frame)
+        tmp_path = self.progress_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'rows_done': self.rows_done, 'output_bytes': self.output_bytes}, f)
+        os.replace(tmp_path, self.progress_path)
+
+
+# Busy seconds and rows per stage; preprocess seconds are summed over the pool workers
+class StageStats:
+    def __init__(self):
+        self.seconds = {stage: 0.0 for stage in STAGES}
+        self.rows = {stage: 0 for stage in STAGES}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds, rows):
+        self.seconds[stage] += seconds
+        self.rows[stage] += rows
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'rows': self.rows['write'],
+            'seconds': elapsed,
+            'rows_per_second': self.rows['write'] / elapsed if elapsed else 0.0,
+            'stage_rows_per_second': {stage: self.rows[stage] / self.seconds[stage] if self.seconds[stage] else 0.0
+                                      for stage in STAGES},
+            'stage_seconds': dict(self.seconds),
+        }
+
+    def print_report(self):
+        report = self.report()
+        print(f"{report['rows']} rows in {report['seconds']:.1f}s ({report['rows_per_second']:.1f} rows/s) | " +
+              ", ".join(f"{stage} {rate:.0f} rows/s" for stage, rate in report['stage_rows_per_second'].items()))
+        return report
+
+
+def predict_batches(model, batches, rows, device):
+    probabilities = None
+    with torch.inference_mode():
+        for positions, input_ids, attention_mask in batches:
+            outputs = get_logits(model(input_ids=input_ids.to(device), attention_mask=attention_mask.to(device)))
+            batch_probabilities = torch.softmax(outputs.float(), dim=1).cpu()
+            if probabilities is None:
+                probabilities = torch.empty(rows, batch_probabilities.size(1))
+            probabilities[positions] = batch_probabilities
+    return probabilities
+
+
+def output_frame(chunk, start_row, probabilities, keep_columns, class_names):
+    confidences, predictions = probabilities.max(dim=1)
+    frame = pd.DataFrame({'row': range(start_row, start_row + len(chunk))})
+    for column in keep_columns:
+        frame[column] = chunk[column].to_numpy()
+    frame['prediction'] = predictions.numpy()
+    if class_names:
+        frame['label'] = [class_names[index] for index in predictions.tolist()]
+    frame['confidence'] = confidences.numpy()
+    for index in range(probabilities.size(1)):
+        frame[f'prob_{index}'] = probabilities[:, index].numpy()
+    return frame
+
+
+def run(args):
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device('cuda' if torch.cuda.is_available() and not args.cpu else 'cpu')
+    if args.quantized_artifact:
+        device = torch.device('cpu')
+        model = load_quantized(args.quantized_artifact)
+    else:
+        model = load_hybrid_classifier(args.checkpoint, args.num_classes, bert_model_name=args.bert_model,
+                                       device=device)
+
+    writer = PredictionWriter(args.output, output_format=args.format, resume=args.resume)
+    start_row = writer.rows_done
+    if start_row:
+        print(f"Resuming after row {start_row}")
+    stats = StageStats()
+    pool_class = ProcessPoolExecutor if args.pool == 'process' else ThreadPoolExecutor
+    # Both queues are bounded, so a fast reader or slow writer cannot pile up chunks in memory
+    prepared = queue.Queue(maxsize=args.queue_size)
+    finished = queue.Queue(maxsize=args.queue_size)
+    errors = []
+
+    def read(pool):
+        try:
+            row = start_row
+            usecols = [args.text_column] + list(args.keep_columns)
+            chunks = iter_csv_chunks(args.input, chunksize=args.chunksize, usecols=usecols, skip_rows=start_row)
+            while True:
+                read_start = time.perf_counter()
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                stats.add('read', time.perf_counter() - read_start, len(chunk))
+                future = pool.submit(prepare_chunk, chunk[args.text_column], args.bert_model, args.batch_size,
+                                     args.max_length)
+                prepared.put((row, chunk, future))
+                row += len(chunk)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            prepared.put(None)
+
+    def write():
+        try:
+            while True:
+                item = finished.get()
+                if item is None:
+                    break
+                row, frame = item
+                write_start = time.perf_counter()
+                writer.write(frame, row)
+                stats.add('write', time.perf_counter() - write_start, len(frame))
+        except Exception as error:
+            errors.append(error)
+            # Keep draining so the forward loop is never blocked on a full queue
+            while finished.get() is not None:
+                pass
+
+    with pool_class(max_workers=args.workers) as pool:
+        reader = threading.Thread(target=read, args=(pool,), daemon=True)
+        writer_thread = threading.Thread(target=write, daemon=True)
+        reader.start()
+        writer_thread.start()
+        chunks_done = 0
+        try:
+            while not errors:
+                item = prepared.get()
+                if item is None:
+                    break
+                row, chunk, future = item
+                batches, preprocess_seconds = future.result()
+                stats.add('preprocess', preprocess_seconds, len(chunk))
+
+                forward_start = time.perf_counter()
+                probabilities = predict_batches(model, batches, len(chunk), device)
+                stats.add('forward', time.perf_counter() - forward_start, len(chunk))
+                finished.put((row, output_frame(chunk, row, probabilities, args.keep_columns, args.class_names)))
+                chunks_done += 1
+                if chunks_done % args.report_every == 0:
+                    stats.print_report()
+        finally:
+            finished.put(None)
+            writer_thread.join()
+            # Unblock the reader if the loop stopped early
+            while reader.is_alive():
+                try:
+                    prepared.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+    if errors:
+        raise errors[0]
+
+    report = stats.print_report()
+    report['start_row'] = start_row
+    report['rows_done'] = writer.rows_done
+    if args.stats:
+        with open(args.stats, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"Predictions written to {args.output}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', required=True)
+    parser.add_argument('--output', required=True, help="*.csv file or *.parquet directory")
+    parser.add_argument('--format', choices=('csv', 'parquet'), default=None, help="default: from the output name")
+    parser.add_argument('--checkpoint', default='hybrid_classifier_model.pt')
+    parser.add_argument('--quantized-artifact', default=None, help="load a model saved by quantize.save_quantized")
+    parser.add_argument('--num-classes', type=int, default=4)
+    parser.add_argument('--bert-model', default='bert-base-uncased')
+    parser.add_argument('--text-column', default='Description')
+    parser.add_argument('--keep-columns', nargs='*', default=[], help="input columns copied to the output")
+    parser.add_argument('--class-names', nargs='*', default=None)
+    parser.add_argument('--chunksize', type=int, default=10_000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-length', type=int, default=128)
+    parser.add_argument('--workers', type=int, default=2, help="cleaning/tokenization workers")
+    parser.add_argument('--pool', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--queue-size', type=int, default=4, help="chunks buffered between stages")
+    parser.add_argument('--threads', type=int, default=None, help="torch intra-op threads for the forward pass")
+    parser.add_argument('--cpu', action='store_true', help="run on CPU even if CUDA is available")
+    parser.add_argument('--resume', action='store_true', help="continue after the last row written")
+    parser.add_argument('--report-every', type=int, default=10, help="print stage throughput every N chunks")
+    parser.add_argument('--stats', default=None, help="optional JSON file for the throughput report")
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Duplicate collapsing and an LRU cache of predictions.
+
+`DedupIndex` maps rows to unique keys (a hash of the text after `clean_text`,
+or of the token ids for already tokenized batches) so every distinct input is
+tokenized and run through the model once, and results are scattered back to
+the original rows. `PredictionCache` keeps logits across calls, keyed by the
+input key and a fingerprint of the model weights, so retraining the model
+never serves stale predictions.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import pandas as pd
+import torch
+
+from cleaning import clean_series
+from embedding_cache import input_key
+from model import get_logits, state_fingerprint
+from tokenization import tokenize_texts
+
+
+# Hash of one cleaned text
+def text_key(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# Unique keys of a sequence of rows and the row -> unique position mapping
+class DedupIndex:
+    def __init__(self, keys):
+        positions, inverse, first_rows = {}, [], []
+        for row, key in enumerate(keys):
+            if key not in positions:
+                positions[key] = len(positions)
+                first_rows.append(row)  # The row that stands in for every duplicate of this key
+            inverse.append(positions[key])
+        self.keys = list(positions)
+        self.inverse = torch.tensor(inverse, dtype=torch.long)
+        self.first_rows = torch.tensor(first_rows, dtype=torch.long)
+
+    # Texts are cleaned first, so rows that differ only in case, punctuation or spacing collapse
+    @classmethod
+    def from_texts(cls, texts):
+        cleaned = clean_series(pd.Series(list(texts), dtype=object)).tolist()
+        index = cls([text_key(text) for text in cleaned])
+        index.texts = [cleaned[row] for row in index.first_rows.tolist()]
+        return index
+
+    # Rows of a tokenized batch, keyed by their ids up to the last real token
+    @classmethod
+    def from_batch(cls, input_ids, attention_mask):
+        return cls([input_key(ids, mask) for ids, mask in zip(input_ids.cpu(), attention_mask.cpu())])
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def num_rows(self):
+        return len(self.inverse)
+
+    @property
+    def duplicates(self):
+        return self.num_rows - len(self.keys)
+
+    # Per-unique-key values (tensor with one row per key) expanded back to one row per original row
+    def scatter(self, values):
+        return values[self.inverse.to(values.device)]
+
+
+# Cleans `texts`, collapses duplicates and tokenizes only the unique rows. Returns their inputs
+# and the DedupIndex that maps every row to one of them; batch the inputs in order and pass the
+# index as `dedup` to evaluate_model or pseudo_labeling.
+def tokenize_unique(tokenizer, texts, max_length=128, cache=None):
+    index = DedupIndex.from_texts(texts)
+    return tokenize_texts(tokenizer, index.texts, max_length=max_length, cache=cache), index
+
+
+# Bounded LRU mapping (model fingerprint, input key) -> logits on the CPU
+class PredictionCache:
+    def __init__(self, capacity=100_000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, model_hash, key):
+        entry = self.entries.get((model_hash, key))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end((model_hash, key))
+        self.hits += 1
+        return entry
+
+    def put(self, model_hash, key, logits):
+        if self.capacity <= 0:
+            return
+        self.entries[(model_hash, key)] = logits
+        self.entries.move_to_end((model_hash, key))
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'cache_size': len(self.entries),
+            'cache_capacity': self.capacity,
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'cache_evictions': self.evictions,
+            'cache_hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    # Logits for unique `keys`; compute(positions) is called once with the positions that are not cached
+    # and must return their logits in that order
+    def logits(self, model_hash, keys, compute):
+        found = [self.get(model_hash, key) for key in keys]
+        missing = [position for position, logits in enumerate(found) if logits is None]
+        if missing:
+            computed = compute(missing).float().cpu()
+            for position, logits in zip(missing, computed):
+                found[position] = logits
+                self.put(model_hash, keys[position], logits)
+        return torch.stack(found)
+
+
+def _forward(model, input_ids, attention_mask, device):
+    return get_logits(model(input_ids=input_ids.to(device), attention_mask=attention_mask.to(device)))
+
+
+# Logits for one tokenized batch. With a cache or dedup=True duplicate rows are run once and, with a
+# cache, rows seen before not at all; otherwise the batch goes straight to the model, without the
+# host copy and per-row hashing that deduplication needs.
+# `model_hash` should be state_fingerprint(model), computed once per call site.
+def batch_logits(model, input_ids, attention_mask, device, cache=None, model_hash=None, dedup=False):
+    if cache is None and not dedup:
+        return _forward(model, input_ids, attention_mask, device)
+    index = DedupIndex.from_batch(input_ids, attention_mask)
+    if cache is not None and model_hash is None:
+        model_hash = state_fingerprint(model)
+
+    def compute(positions):
+        rows = index.first_rows[positions]
+        return _forward(model, input_ids[rows.to(input_ids.device)], attention_mask[rows.to(attention_mask.device)],
+                        device)
+
+    if cache is None:
+        unique = compute(list(range(len(index))))
+    else:
+        unique = cache.logits(model_hash, index.keys, compute).to(device)
+    return index.scatter(unique)
+
+
+# Logits for raw texts: cleaned once, duplicates collapsed before tokenization, cached rows skipped.
+# Returns a (len(texts), num_classes) CPU tensor in the order of `texts`.
+def predict_texts(model, tokenizer, texts, device, cache=None, model_hash=None, max_length=128, batch_size=64):
+    index = DedupIndex.from_texts(texts)
+    if cache is not None and model_hash is None:
+        model_hash = state_fingerprint(model)
+
+    def compute(positions):
+        outputs = []
+        with torch.inference_mode():
+            for start in range(0, len(positions), batch_size):
+                chunk = [index.texts[position] for position in positions[start:start + batch_size]]
+                inputs = tokenizer(chunk, padding=True, truncation=True, max_length=max_length, return_tensors='pt')
+                outputs.append(_forward(model, inputs['input_ids'], inputs['attention_mask'], device).float().cpu())
+        return torch.cat(outputs)
+
+    if cache is None:
+        unique = compute(list(range(len(index))))
+    else:
+        unique = cache.logits(model_hash, index.keys, compute)
+    return index.scatter(unique)
@@ -8,629 +8,364 @@ Original file is located at
 """
 
 import pandas as pd
-import re
-
-file_path = '/content/Sample Data - Sheet1 (1).csv'
-df = pd.read_csv(file_path)
-
-print("Initial Dataset:")
-print(df.head())
-
-missing_values = df.isnull().sum()
-print("\nMissing Values:")
-print(missing_values)
-
-# Class distribution
-class_distribution = df['Class Index'].value_counts()
-print("\nClass Distribution:")
-print(class_distribution)
-
-# Cleaning text data
-def clean_text(text):
-    text = re.sub(r"[^a-zA-Z\s]", "", text)  # Removing special characters and numbers
-    text = re.sub(r"\s+", " ", text).strip()  # Removing extra whitespaces
-    return text.lower()
-
-# Apply text cleaning to the Title and Description columns
-df['Cleaned Title'] = df['Title'].apply(clean_text)
-df['Cleaned Description'] = df['Description'].apply(clean_text)
-
-print("\nCleaned Dataset:")
-print(df[['Class Index', 'Cleaned Title', 'Cleaned Description']].head())
-
-from sklearn.model_selection import train_test_split
-
-# Splitting the dataset into training and validation sets
-train_data, val_data = train_test_split(
-    df[['Class Index', 'Cleaned Title', 'Cleaned Description']],
-    test_size=0.2,
-    random_state=42,
-    stratify=df['Class Index']  # Ensures class distribution remains balanced
-)
-
-# Display the number of samples in each set
-print(f"Training Set Size: {len(train_data)}")
-print(f"Validation Set Size: {len(val_data)}")
-
-# Display a sample of the training data
-print("\nSample Training Data:")
-print(train_data.head())
-
-# Display a sample of the validation data
-print("\nSample Validation Data:")
-print(val_data.head())
-
-"""BERT"""
-
-from transformers import BertTokenizer
-
-# Loading the BERT tokenizer
-tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
-
-# Function to tokenize text for BERT
-def tokenize_data(texts, labels, max_length=128):
-    inputs = tokenizer(
-        texts,
-        padding='max_length',
-        truncation=True,
-        max_length=max_length,
-        return_tensors='pt'
+from cleaning import clean_series
+
+# Everything below runs only when this file is executed as a script. Worker processes started
+# under the spawn or forkserver start method (tokenize_sharded, launch) import this module again,
+# and must not re-run the pipeline.
+if __name__ == '__main__':
+    file_path = '/content/Sample Data - Sheet1 (1).csv'
+    df = pd.read_csv(file_path)
+
+    print("Initial Dataset:")
+    print(df.head())
+
+    missing_values = df.isnull().sum()
+    print("\nMissing Values:")
+    print(missing_values)
+
+    # Class distribution
+    class_distribution = df['Class Index'].value_counts()
+    print("\nClass Distribution:")
+    print(class_distribution)
+
+    # Apply text cleaning to the Title and Description columns (vectorized, see cleaning.py)
+    df['Cleaned Title'] = clean_series(df['Title'])
+    df['Cleaned Description'] = clean_series(df['Description'])
+
+    print("\nCleaned Dataset:")
+    print(df[['Class Index', 'Cleaned Title', 'Cleaned Description']].head())
+
+    from sklearn.model_selection import train_test_split
+
+    # Splitting the dataset into training and validation sets
+    train_data, val_data = train_test_split(
+        df[['Class Index', 'Cleaned Title', 'Cleaned Description']],
+        test_size=0.2,
+        random_state=42,
+        stratify=df['Class Index']  # Ensures class distribution remains balanced
     )
-    return inputs, labels
-
-# Prepare the training and validation data
-train_texts = train_data['Cleaned Description'].tolist()
-train_labels = train_data['Class Index'].tolist()
-
-val_texts = val_data['Cleaned Description'].tolist()
-val_labels = val_data['Class Index'].tolist()
-
-# Tokenize the training and validation datasets
-train_inputs, train_labels = tokenize_data(train_texts, train_labels)
-val_inputs, val_labels = tokenize_data(val_texts, val_labels)
-
-# Display sample tokenized data
-print("\nSample Tokenized Training Data:")
-print(train_inputs)
-
-"""HYBRID CLASSIFICATION"""
-
-import torch
-import torch.nn as nn
-from transformers import BertModel
-
-# Define the Hybrid Classification Model
-class HybridClassifier(nn.Module):
-    def __init__(self, num_classes, bert_model_name='bert-base-uncased'):
-        super(HybridClassifier, self).__init__()
-        self.bert = BertModel.from_pretrained(bert_model_name)  # Load pre-trained BERT
-        self.dropout = nn.Dropout(0.3)  # Dropout for regularization
-        self.flat_classifier = nn.Linear(self.bert.config.hidden_size, num_classes)  # Flat classification
-        self.hierarchical_classifier = nn.Linear(self.bert.config.hidden_size, num_classes)  # Hierarchical layer
-
-    def forward(self, input_ids, attention_mask):
-        # Pass data through BERT
-        outputs = self.bert(input_ids=input_ids, attention_mask=attention_mask)
-        pooled_output = outputs.pooler_output  # CLS token representation
-
-        # Apply dropout
-        pooled_output = self.dropout(pooled_output)
-
-        # Flat and hierarchical classification
-        flat_output = self.flat_classifier(pooled_output)
-        hierarchical_output = self.hierarchical_classifier(pooled_output)
-
-        # Combine outputs (you can customize this combination logic)
-        combined_output = flat_output + hierarchical_output
-
-        return combined_output
-
-"""Training"""
-
-from torch.utils.data import DataLoader, Dataset
-from transformers import AdamW
 
-# Custom dataset class for PyTorch
-class TextDataset(Dataset):
-    def __init__(self, inputs, labels):
-        self.inputs = inputs
-        self.labels = labels
+    # Display the number of samples in each set
+    print(f"Training Set Size: {len(train_data)}")
+    print(f"Validation Set Size: {len(val_data)}")
 
-    def __len__(self):
-        return len(self.labels)
+    # Display a sample of the training data
+    print("\nSample Training Data:")
+    print(train_data.head())
 
-    def __getitem__(self, idx):
-        return {
-            'input_ids': self.inputs['input_ids'][idx],
-            'attention_mask': self.inputs['attention_mask'][idx],
-            'labels': torch.tensor(self.labels[idx], dtype=torch.long),
-        }
+    # Display a sample of the validation data
+    print("\nSample Validation Data:")
+    print(val_data.head())
 
-# Create datasets
-train_dataset = TextDataset(train_inputs, train_labels)
-val_dataset = TextDataset(val_inputs, val_labels)
+    """BERT"""
 
-# Create dataloaders
-train_loader = DataLoader(train_dataset, batch_size=16, shuffle=True)
-val_loader = DataLoader(val_dataset, batch_size=16)
+    from tokenization import TokenizationCache, load_fast_tokenizer, tokenize_sharded, tokenize_texts
 
-# Initialize the model, loss function, and optimizer
-num_classes = len(class_distribution)  # Number of unique classes
-model = HybridClassifier(num_classes)
+    # Loading the fast (Rust) BERT tokenizer, the same one the test and serving paths use
+    tokenizer = load_fast_tokenizer('bert-base-uncased')
 
-criterion = nn.CrossEntropyLoss()
-optimizer = AdamW(model.parameters(), lr=5e-5)
+    # Tokenized columns are cached on disk, keyed by text, tokenizer and max_length
+    token_cache = TokenizationCache('.token_cache')
 
-# Move model to GPU if available
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-model.to(device)
+    # Function to tokenize text for BERT. Shards of the column are tokenized in parallel
+    # processes into compact int16/int8 arrays (see tokenization.tokenize_sharded).
+    def tokenize_data(texts, labels, max_length=128):
+        inputs = tokenize_sharded(tokenizer, texts, max_length=max_length, cache=token_cache)
+        return inputs, labels
 
-import torch
-from tqdm import tqdm
+    # Long texts can instead be split into overlapping windows; each row's text is in
+    # inputs['overflow_to_sample_mapping']:
+    # inputs = tokenize_sharded(tokenizer, texts, max_length=128, stride=32, cache=token_cache)
 
-# Function to calculate accuracy
-def calculate_accuracy(predictions, labels):
-    _, preds = torch.max(predictions, dim=1)
-    return (preds == labels).sum().item() / labels.size(0)
+    # Prepare the training and validation data
+    train_texts = train_data['Cleaned Description'].tolist()
+    train_labels = train_data['Class Index'].tolist()
+
+    val_texts = val_data['Cleaned Description'].tolist()
+    val_labels = val_data['Class Index'].tolist()
+
+    # Tokenize the training and validation datasets
+    train_inputs, train_labels = tokenize_data(train_texts, train_labels)
+    val_inputs, val_labels = tokenize_data(val_texts, val_labels)
+
+    # Display sample tokenized data
+    print("\nSample Tokenized Training Data:")
+    print(train_inputs)
+
+    """HYBRID CLASSIFICATION"""
+
+    import torch
+    import torch.nn as nn
+    from model import HybridClassifier
+
+    """Training"""
+
+    from transformers import AdamW
+    from data import (TextDataset, BatchSliceDataset, LengthBucketSampler, PaddingStats, make_batch_loader,
+                      sequence_lengths)
+
+    # Create datasets. Batches are gathered straight from the tokenized tensors
+    # (one index_select per field) and trimmed to their longest row.
+    padding_stats = PaddingStats(max_length=128)
+    train_dataset = BatchSliceDataset(train_inputs, train_labels, stats=padding_stats)
+    val_dataset = BatchSliceDataset(val_inputs, val_labels, stats=padding_stats)
+
+    # Group descriptions of similar length so each batch needs little padding.
+    # max_tokens caps rows * padded length so batches of short texts can hold more rows.
+    batch_size = 16
+    max_tokens_per_batch = batch_size * 128
+    train_sampler = LengthBucketSampler(sequence_lengths(train_inputs), batch_size=batch_size,
+                                        max_tokens=max_tokens_per_batch, shuffle=True)
+    val_sampler = LengthBucketSampler(sequence_lengths(val_inputs), batch_size=batch_size,
+                                      max_tokens=max_tokens_per_batch, shuffle=False)
+
+    # Create dataloaders
+    train_loader = make_batch_loader(train_dataset, train_sampler)
+    val_loader = make_batch_loader(val_dataset, val_sampler)
+
+    # For CSVs larger than memory, stream chunks instead of loading the whole frame
+    # (stratified split with per-class quotas in every chunk, bounded memory, see streaming.py):
+    # from streaming import make_streaming_loaders
+    # train_loader, val_loader = make_streaming_loaders(file_path, tokenizer, batch_size=16, chunksize=10_000)
+
+    # Initialize the model, loss function, and optimizer
+    num_classes = len(class_distribution)  # Number of unique classes
+    model = HybridClassifier(num_classes)
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = AdamW(model.parameters(), lr=5e-5)
+
+    # Move model to GPU if available
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model.to(device)
+
+    from training import train_model
+    from telemetry import TrainingTelemetry, PrintHook
+
+    # Per-stage timing and device-side loss/accuracy, flushed every 50 steps with a JSON report per epoch.
+    # Pass profile_steps=(10, 5) to capture a torch.profiler trace of steps 10-14.
+    telemetry = TrainingTelemetry(device, flush_every=50, hooks=[PrintHook()], report_dir='telemetry')
+
+    from checkpoint import CheckpointManager
+
+    # Checkpoint every 500 optimizer steps in the background, keeping the last 3.
+    # resume=True continues an interrupted run from the latest checkpoint at the exact batch.
+    checkpoints = CheckpointManager('checkpoints', every_steps=500, keep_last=3)
+
+    # Train the model (precision='bf16', accumulation_steps and max_grad_norm trade speed for memory)
+    train_model(model, train_loader, val_loader, criterion, optimizer, device, epochs=3, telemetry=telemetry,
+                checkpoints=checkpoints, resume=True)
+
+    # To fit larger batches, recompute BERT activations in backward and train only the top layers,
+    # unfreezing 4 more per epoch; frozen layers leave the optimizer and autograd. Each epoch's report
+    # has the peak memory and step time (compare batch sizes with benchmarks/bench_memory.py):
+    # from freezing import FreezeSchedule
+    # train_model(model, train_loader, val_loader, criterion, optimizer, device, epochs=3,
+    #             activation_checkpointing=True, freeze_schedule=FreezeSchedule.gradual(start_layers=4, step=4))
+
+    # On a many-core CPU box, train with several data-parallel processes instead (gloo backend,
+    # cores split between the ranks, checkpoints from rank 0 only, see distributed.py):
+    # from distributed import launch, train_worker
+    # history = launch(train_worker, 4, args=(TextDataset(train_inputs, train_labels),
+    #                                         TextDataset(val_inputs, val_labels), num_classes),
+    #                   kwargs={'save_path': 'hybrid_classifier_model.pt'})
+
+    # Report how much padding the length-bucketed batches avoided
+    padding_stats = padding_stats.report()
+    print(f"Padding waste: {padding_stats['dynamic_waste_ratio']:.2%} with dynamic padding "
+          f"vs {padding_stats['fixed_waste_ratio']:.2%} with max_length padding "
+          f"({padding_stats['tokens_saved_ratio']:.2%} of encoder tokens saved)")
 
-# Training loop
-def train_model(model, train_loader, val_loader, criterion, optimizer, device, epochs=3):
-    for epoch in range(epochs):
-        print(f"\nEpoch {epoch + 1}/{epochs}")
-        print("-" * 30)
+    # To refit only the heads, freeze the encoder and train on cached pooled outputs.
+    # The cache is keyed by tokenized input and invalidated when the encoder weights change:
+    # from embedding_cache import EmbeddingCache, train_heads
+    # embedding_cache = EmbeddingCache('.embedding_cache', model.bert)
+    # train_heads(model, train_loader, embedding_cache, device, epochs=20, val_loader=val_loader)
+
+    # For CPU serving, distill into a 4-layer student started from every third teacher layer
+    # and compare latency, memory and accuracy (see distillation.py):
+    # from distillation import compare_models, make_student, train_student
+    # student = make_student(model, num_classes, num_layers=4)
+    # train_student(student, model, train_loader, device, epochs=3)
+    # compare_models({'student': student, 'teacher': model}, val_loader, device)
+
+    # Early exit: rows whose intermediate exit head is confident skip the remaining encoder layers
+    # (see early_exit.py). The report shows average layers executed, speedup and accuracy cost per threshold:
+    # from early_exit import EarlyExitClassifier, early_exit_report, train_exit_heads
+    # early_exit_model = EarlyExitClassifier(model, exit_layers=(3, 6, 9))
+    # train_exit_heads(early_exit_model, train_loader, device)
+    # early_exit_report(early_exit_model, val_loader, device, thresholds=(0.9, 0.95, 0.99))
 
-        # Training phase
-        model.train()
-        train_loss, train_acc = 0, 0
-        for batch in tqdm(train_loader, desc="Training"):
-            input_ids = batch['input_ids'].to(device)
-            attention_mask = batch['attention_mask'].to(device)
-            labels = batch['labels'].to(device)
+    # Cheap-first cascade: a hashed n-gram TF-IDF model over title + description answers confident rows
+    # and only the rest go to BERT. The threshold is calibrated on val_data (see cascade.py):
+    # from cascade import CascadeClassifier, FirstStageModel, calibrate_threshold, cascade_report
+    # first_stage = FirstStageModel(num_classes).fit(train_data['Cleaned Title'], train_data['Cleaned Description'],
+    #                                                train_data['Class Index'] - 1)
+    # cascade = CascadeClassifier(first_stage, model, tokenizer, device)
+    # calibrate_threshold(cascade, val_data['Cleaned Title'], val_data['Cleaned Description'],
+    #                     val_data['Class Index'] - 1)
+    # cascade_report(cascade, val_data['Cleaned Title'], val_data['Cleaned Description'], val_data['Class Index'] - 1)
 
-            # Forward pass
-            optimizer.zero_grad()
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask)
+    # Save the trained model
+    model_save_path = "hybrid_classifier_model.pt"
+    torch.save(model.state_dict(), model_save_path)
+    print(f"Model saved to {model_save_path}")
 
-            # Compute loss
-            loss = criterion(outputs, labels)
-            train_loss += loss.item()
+    # Load the model for evaluation or reuse
+    model.load_state_dict(torch.load(model_save_path))
+    model.eval()  # Set to evaluation mode
 
-            # Backward pass
-            loss.backward()
-            optimizer.step()
+    import pandas as pd
 
-            # Calculate accuracy
-            train_acc += calculate_accuracy(outputs, labels)
+    # Load the test dataset (update the file path as necessary)
+    file_path = '/content/test (1).csv'
+    test_df = pd.read_csv(file_path)
 
-        train_loss /= len(train_loader)
-        train_acc /= len(train_loader)
+    # Display the first few rows to confirm the data structure
+    print(test_df.head())
 
-        print(f"Training Loss: {train_loss:.4f} | Training Accuracy: {train_acc:.4f}")
+    # Check column names
+    print(test_df.columns)
 
-        # Validation phase
-        model.eval()
-        val_loss, val_acc = 0, 0
-        with torch.no_grad():
-            for batch in tqdm(val_loader, desc="Validation"):
-                input_ids = batch['input_ids'].to(device)
-                attention_mask = batch['attention_mask'].to(device)
-                labels = batch['labels'].to(device)
+    # Clean the text in the 'Description' column if necessary
+    test_df['Cleaned Description'] = clean_series(test_df['Description'])
 
-                # Forward pass
-                outputs = model(input_ids=input_ids, attention_mask=attention_mask)
+    # Check if the column 'Class Index' exists and contains valid labels
+    print(test_df['Class Index'].unique())
 
-                # Compute loss
-                loss = criterion(outputs, labels)
-                val_loss += loss.item()
+    import pandas as pd
+    import torch
+    from transformers import AutoTokenizer
 
-                # Calculate accuracy
-                val_acc += calculate_accuracy(outputs, labels)
+    # Load the test dataset
+    file_path = '/content/test (1).csv'
+    test_df = pd.read_csv(file_path)
 
-        val_loss /= len(val_loader)
-        val_acc /= len(val_loader)
+    test_df['Cleaned Description'] = clean_series(test_df['Description'])
 
-        print(f"Validation Loss: {val_loss:.4f} | Validation Accuracy: {val_acc:.4f}")
-
-# Train the model
-train_model(model, train_loader, val_loader, criterion, optimizer, device, epochs=3)
+    # Initialize the tokenizer
+    tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
 
-# Save the trained model
-model_save_path = "hybrid_classifier_model.pt"
-torch.save(model.state_dict(), model_save_path)
-print(f"Model saved to {model_save_path}")
+    # Define the tokenize_data function
+    def tokenize_data(texts, labels, max_len=128):
+        inputs = tokenize_texts(tokenizer, texts, max_length=max_len, padding=True, cache=token_cache)
+        return inputs, torch.tensor(labels)
 
-# Load the model for evaluation or reuse
-model.load_state_dict(torch.load(model_save_path))
-model.eval()  # Set to evaluation mode
-
-import pandas as pd
-
-# Load the test dataset (update the file path as necessary)
-file_path = '/content/test (1).csv'
-test_df = pd.read_csv(file_path)
-
-# Display the first few rows to confirm the data structure
-print(test_df.head())
-
-# Check column names
-print(test_df.columns)
-
-# Clean the text in the 'Description' column if necessary
-def clean_text(text):
-    import re
-    text = re.sub(r"[^a-zA-Z\s]", "", text)  # Remove special characters and numbers
-    text = re.sub(r"\s+", " ", text).strip()  # Remove extra whitespace
-    return text.lower()  # Convert to lowercase
-
-test_df['Cleaned Description'] = test_df['Description'].apply(clean_text)
-
-# Check if the column 'Class Index' exists and contains valid labels
-print(test_df['Class Index'].unique())
-
-import pandas as pd
-import torch
-from transformers import AutoTokenizer
-
-# Load the test dataset
-file_path = '/content/test (1).csv'
-test_df = pd.read_csv(file_path)
-
-# Clean the text data
-def clean_text(text):
-    import re
-    text = re.sub(r"[^a-zA-Z\s]", "", text)  # Remove special characters and numbers
-    text = re.sub(r"\s+", " ", text).strip()  # Remove extra whitespace
-    return text.lower()  # Convert to lowercase
-
-test_df['Cleaned Description'] = test_df['Description'].apply(clean_text)
-
-# Initialize the tokenizer
-tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-
-# Define the tokenize_data function
-def tokenize_data(texts, labels, max_len=128):
-    inputs = tokenizer(
-        texts,
-        padding=True,
-        truncation=True,
-        max_length=max_len,
-        return_tensors="pt"
-    )
-    return inputs, torch.tensor(labels)
-
-# Apply tokenization
-test_texts = test_df['Cleaned Description'].tolist()
-test_labels = test_df['Class Index'].tolist()
-test_inputs, test_labels = tokenize_data(test_texts, test_labels)
-
-from torch.utils.data import Dataset
-
-class TextDataset(Dataset):
-    def __init__(self, inputs, labels):
-        self.inputs = inputs
-        self.labels = labels
-
-    def __len__(self):
-        return len(self.labels)
-
-    def __getitem__(self, idx):
-        return {
-            'input_ids': self.inputs['input_ids'][idx],
-            'attention_mask': self.inputs['attention_mask'][idx],
-            'labels': self.labels[idx]
-        }
-
-from torch.utils.data import DataLoader
-
-
-test_dataset = TextDataset(test_inputs, test_labels)
-test_loader = DataLoader(test_dataset, batch_size=16)
-
-import pandas as pd
-import torch
-from transformers import AutoTokenizer
-from torch.utils.data import DataLoader, Dataset
-
-file_path = '/content/test (1).csv'
-test_df = pd.read_csv(file_path)
-
-def clean_text(text):
-    import re
-    text = re.sub(r"[^a-zA-Z\s]", "", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text.lower()
-
-test_df['Cleaned Description'] = test_df['Description'].apply(clean_text)
-
-tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-
-def tokenize_data(texts, labels, max_len=128):
-    inputs = tokenizer(
-        texts,
-        padding=True,
-        truncation=True,
-        max_length=max_len,
-        return_tensors="pt"
-    )
-    return inputs, torch.tensor(labels)
+    # Apply tokenization
+    test_texts = test_df['Cleaned Description'].tolist()
+    test_labels = test_df['Class Index'].tolist()
+    test_inputs, test_labels = tokenize_data(test_texts, test_labels)
 
-test_texts = test_df['Cleaned Description'].tolist()
-test_labels = test_df['Class Index'].tolist()
-test_inputs, test_labels = tokenize_data(test_texts, test_labels)
+    from data import TextDataset
 
-class TextDataset(Dataset):
-    def __init__(self, inputs, labels):
-        self.inputs = inputs
-        self.labels = labels
+    from torch.utils.data import DataLoader
 
-    def __len__(self):
-        return len(self.labels)
 
-    def __getitem__(self, idx):
-        return {
-            'input_ids': self.inputs['input_ids'][idx],
-            'attention_mask': self.inputs['attention_mask'][idx],
-            'labels': self.labels[idx]
-        }
+    test_dataset = TextDataset(test_inputs, test_labels)
+    test_loader = DataLoader(test_dataset, batch_size=16)
 
-test_dataset = TextDataset(test_inputs, test_labels)
-test_loader = DataLoader(test_dataset, batch_size=16)
+    import pandas as pd
+    import torch
+    from transformers import AutoTokenizer
+    from torch.utils.data import DataLoader
 
-test_texts = test_df['Cleaned Description'].apply(clean_text).tolist()
-test_labels = test_df['Class Index'].tolist()
+    file_path = '/content/test (1).csv'
+    test_df = pd.read_csv(file_path)
 
-test_inputs, test_labels = tokenize_data(test_texts, test_labels)
+    test_df['Cleaned Description'] = clean_series(test_df['Description'])
 
-test_dataset = TextDataset(test_inputs, test_labels)
-test_loader = DataLoader(test_dataset, batch_size=16)
+    tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
 
-"""Test"""
+    def tokenize_data(texts, labels, max_len=128):
+        inputs = tokenize_texts(tokenizer, texts, max_length=max_len, padding=True, cache=token_cache)
+        return inputs, torch.tensor(labels)
 
-test_df = pd.read_csv('/content/test (1).csv')
+    test_texts = test_df['Cleaned Description'].tolist()
+    test_labels = test_df['Class Index'].tolist()
+    test_inputs, test_labels = tokenize_data(test_texts, test_labels)
 
-test_df['Cleaned Description'] = test_df['Description'].apply(clean_text)
-test_texts = test_df['Cleaned Description'].tolist()
-test_labels = test_df['Class Index'].tolist()
+    test_dataset = TextDataset(test_inputs, test_labels)
+    test_loader = DataLoader(test_dataset, batch_size=16)
 
-test_inputs, test_labels = tokenize_data(test_texts, test_labels)
+    test_texts = test_df['Cleaned Description'].tolist()  # already cleaned above
+    test_labels = test_df['Class Index'].tolist()
 
+    test_inputs, test_labels = tokenize_data(test_texts, test_labels)
 
-test_dataset = TextDataset(test_inputs, test_labels)
-test_loader = DataLoader(test_dataset, batch_size=16)
+    test_dataset = TextDataset(test_inputs, test_labels)
+    test_loader = DataLoader(test_dataset, batch_size=16)
 
-from sklearn.metrics import classification_report, accuracy_score
-from transformers import AutoModelForSequenceClassification
-import torch
-from tqdm import tqdm
+    """Test"""
 
-model = AutoModelForSequenceClassification.from_pretrained('bert-base-uncased', num_labels=4)
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
+    test_df = pd.read_csv('/content/test (1).csv')
 
+    test_df['Cleaned Description'] = clean_series(test_df['Description'])
+    test_texts = test_df['Cleaned Description'].tolist()
+    test_labels = test_df['Class Index'].tolist()
 
-def evaluate_model(model, test_loader, device):
-    model.eval()
-    all_preds, all_labels = [], []
-    with torch.no_grad():
-        for batch in tqdm(test_loader, desc="Evaluating"):
-            input_ids = batch['input_ids'].to(device)
-            attention_mask = batch['attention_mask'].to(device)
-            labels = batch['labels'].to(device)
+    test_inputs, test_labels = tokenize_data(test_texts, test_labels)
 
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask)
-            _, preds = torch.max(outputs.logits, dim=1)  # Use `.logits` for HuggingFace models
+    # Contiguous batch slices of the tokenized tensors instead of per-row items
+    from data import BatchSliceDataset, BatchIndexSampler, make_batch_loader
 
-            all_preds.extend(preds.cpu().numpy())
-            all_labels.extend(labels.cpu().numpy())
+    test_dataset = BatchSliceDataset(test_inputs, test_labels)
+    test_loader = make_batch_loader(test_dataset, BatchIndexSampler(len(test_dataset), batch_size=16, shuffle=False))
 
-    accuracy = accuracy_score(all_labels, all_preds)
-    report = classification_report(all_labels, all_preds, target_names=["Class 1", "Class 2", "Class 3", "Class 4"])
-    print(f"\nTest Accuracy: {accuracy:.4f}")
-    print("\nClassification Report:")
-    print(report)
+    from transformers import AutoModelForSequenceClassification
+    import torch
+    from evaluation import evaluate_model
+    from prediction_cache import PredictionCache
 
-evaluate_model(model, test_loader, device)
+    # Logits keyed by input and model weights; kept across evaluate_model/pseudo_labeling calls
+    prediction_cache = PredictionCache(capacity=100_000)
 
-from sklearn.metrics import classification_report, accuracy_score, precision_score, recall_score, f1_score
+    model = AutoModelForSequenceClassification.from_pretrained('bert-base-uncased', num_labels=4)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model.to(device)
 
-# Evaluate the model and calculate all relevant metrics
-def evaluate_model(model, test_loader, device):
-    model.eval()
-    all_preds, all_labels = [], []
+    # To score a whole file and keep the predictions, use the bulk prediction CLI instead of these cells:
+    #   python predict.py --input "/content/test (1).csv" --output predictions.parquet --checkpoint hybrid_classifier_model.pt
 
-    with torch.no_grad():
-        for batch in tqdm(test_loader, desc="Evaluating"):
-            input_ids = batch['input_ids'].to(device)
-            attention_mask = batch['attention_mask'].to(device)
-            labels = batch['labels'].to(device)
+    # Evaluate the model on the test data, with accuracy, weighted and class-wise metrics and the confusion matrix
+    evaluate_model(model, test_loader, device, plot=True, cache=prediction_cache)
 
-            # Get the model's output
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask)
-            _, preds = torch.max(outputs.logits, dim=1)  # Use `.logits` for HuggingFace models
+    # Test sets with repeated descriptions can be deduplicated on the cleaned text, so every distinct
+    # text is tokenized and scored once and the predictions are scattered back to all rows:
+    # from prediction_cache import tokenize_unique
+    # unique_inputs, test_index = tokenize_unique(tokenizer, test_df['Cleaned Description'])
+    # unique_dataset = BatchSliceDataset(unique_inputs, test_labels[test_index.first_rows])
+    # unique_sampler = BatchIndexSampler(len(unique_dataset), batch_size=16, shuffle=False)
+    # unique_loader = make_batch_loader(unique_dataset, unique_sampler)
+    # evaluate_model(model, unique_loader, device, dedup=test_index, labels=test_labels)
 
-            # Collect the predictions and true labels
-            all_preds.extend(preds.cpu().numpy())
-            all_labels.extend(labels.cpu().numpy())
+    """Semi-supervised (Pseudo-Labelling)"""
 
-    # Calculate accuracy
-    accuracy = accuracy_score(all_labels, all_preds)
-
-    # Generate classification report (includes precision, recall, F1-score)
-    report = classification_report(all_labels, all_preds, target_names=["Class 1", "Class 2", "Class 3", "Class 4"])
+    from training import train_with_semi_supervised_learning
 
-    # Calculate precision, recall, and F1-score manually
-    precision = precision_score(all_labels, all_preds, average='weighted')
-    recall = recall_score(all_labels, all_preds, average='weighted')
-    f1 = f1_score(all_labels, all_preds, average='weighted')
+    # Example usage: the returned store keeps ids, masks, labels and confidences together
+    # and can be fed straight to a DataLoader
+    # from pseudo_labels import pseudo_labeling
+    # pseudo_store = pseudo_labeling(model, unlabeled_loader, device, cache=prediction_cache)
+    # pseudo_loader = DataLoader(pseudo_store, batch_size=16, shuffle=True)
 
-    # Print the results
-    print(f"\nTest Accuracy: {accuracy:.4f}")
-    print(f"Precision (weighted): {precision:.4f}")
-    print(f"Recall (weighted): {recall:.4f}")
-    print(f"F1-Score (weighted): {f1:.4f}")
-
-    # Print the full classification report
-    print("\nClassification Report:")
-    print(report)
+    # Initialize the optimizer
+    from transformers import AdamW
+    optimizer = AdamW(model.parameters(), lr=5e-5)
 
-    # Optionally, print class-wise precision, recall, and F1-score
-    print("\nClass-wise Metrics:")
-    for i, class_name in enumerate(["Class 1", "Class 2", "Class 3", "Class 4"]):
-        class_precision = precision_score(all_labels, all_preds, average=None)[i]
-        class_recall = recall_score(all_labels, all_preds, average=None)[i]
-        class_f1 = f1_score(all_labels, all_preds, average=None)[i]
-
-        print(f"{class_name} - Precision: {class_precision:.4f}, Recall: {class_recall:.4f}, F1-Score: {class_f1:.4f}")
-
-    # Optionally, print confusion matrix
-    from sklearn.metrics import confusion_matrix
-    cm = confusion_matrix(all_labels, all_preds)
-    print("\nConfusion Matrix:")
-    print(cm)
-
-    # You can also visualize the confusion matrix if needed:
-    import seaborn as sns
-    import matplotlib.pyplot as plt
-
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', xticklabels=["Class 1", "Class 2", "Class 3", "Class 4"],
-                yticklabels=["Class 1", "Class 2", "Class 3", "Class 4"])
-    plt.ylabel('Actual')
-    plt.xlabel('Predicted')
-    plt.title('Confusion Matrix')
-    plt.show()
-
-# Evaluate the model on the test data
-evaluate_model(model, test_loader, device)
-
-"""Semi-supervised (Pseudo-Labelling)"""
-
-import torch
-from tqdm import tqdm
-import numpy as np
-
-# Function to generate pseudo-labels
-def pseudo_labeling(model, unlabeled_loader, device, confidence_threshold=0.9):
-    model.eval()
-    pseudo_inputs, pseudo_labels = [], []
-
-    with torch.no_grad():
-        for batch in tqdm(unlabeled_loader, desc="Generating Pseudo-Labels"):
-            input_ids = batch['input_ids'].to(device)
-            attention_mask = batch['attention_mask'].to(device)
-
-            # Forward pass
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask)
-            probabilities = torch.nn.functional.softmax(outputs.logits, dim=1)
-            confidences, preds = torch.max(probabilities, dim=1)
-
-            # Keep only high-confidence predictions
-            for i, conf in enumerate(confidences):
-                if conf.item() >= confidence_threshold:
-                    pseudo_inputs.append(batch['input_ids'][i].cpu().numpy())
-                    pseudo_labels.append(preds[i].item())
-
-    return np.array(pseudo_inputs), np.array(pseudo_labels)
-
-# Example usage
-# pseudo_inputs, pseudo_labels = pseudo_labeling(model, unlabeled_loader, device)
-
-def consistency_regularization(model, inputs, attention_mask, device, epsilon=0.1):
-    # Add random noise to the inputs for perturbation
-    noise = torch.randn_like(inputs, dtype=torch.float32, device=device) * epsilon
-    noisy_inputs = inputs + noise
-    noisy_inputs = noisy_inputs.clamp(0, 1)  # Keep input values valid
-
-    # Forward pass for original and noisy inputs
-    original_output = model(input_ids=inputs, attention_mask=attention_mask).logits
-    noisy_output = model(input_ids=noisy_inputs, attention_mask=attention_mask).logits
-
-    # Calculate consistency loss (Mean Squared Error)
-    loss = torch.mean((original_output - noisy_output) ** 2)
-    return loss
-
-def train_with_semi_supervised_learning(
-    model, train_loader, unlabeled_loader, val_loader, device, optimizer, num_epochs=10, epsilon=0.1, confidence_threshold=0.9
-):
-    model.train()
-    for epoch in range(num_epochs):
-        print(f"\nEpoch {epoch + 1}/{num_epochs}")
-        print("-" * 30)
-
-        total_loss = 0
-        for batch in tqdm(train_loader, desc="Training on Labeled Data"):
-            input_ids = batch['input_ids'].to(device)
-            attention_mask = batch['attention_mask'].to(device)
-            labels = batch['labels'].to(device)
-
-            # Forward pass on labeled data
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask).logits
-            labeled_loss = torch.nn.CrossEntropyLoss()(outputs, labels)
-
-            # Generate pseudo-labels
-            pseudo_inputs, pseudo_labels = pseudo_labeling(model, unlabeled_loader, device, confidence_threshold)
-            pseudo_inputs = torch.tensor(pseudo_inputs, dtype=torch.long, device=device)
-            pseudo_labels = torch.tensor(pseudo_labels, dtype=torch.long, device=device)
-
-            # Forward pass on pseudo-labeled data
-            pseudo_outputs = model(input_ids=pseudo_inputs, attention_mask=None).logits
-            pseudo_loss = torch.nn.CrossEntropyLoss()(pseudo_outputs, pseudo_labels)
-
-            # Consistency regularization loss
-            regularization_loss = consistency_regularization(model, input_ids, attention_mask, device, epsilon)
-
-            # Combine losses
-            loss = labeled_loss + pseudo_loss + regularization_loss
-            total_loss += loss.item()
-
-            # Backpropagation and optimizer step
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
-
-        print(f"Epoch {epoch + 1} - Loss: {total_loss / len(train_loader):.4f}")
-
-        # Evaluate on validation set
-        evaluate_model(model, val_loader, device)
-
-from sklearn.metrics import classification_report, accuracy_score
-
-def evaluate_model(model, test_loader, device):
-    model.eval()
-    all_preds, all_labels = [], []
-
-    with torch.no_grad():
-        for batch in tqdm(test_loader, desc="Evaluating"):
-            input_ids = batch['input_ids'].to(device)
-            attention_mask = batch['attention_mask'].to(device)
-            labels = batch['labels'].to(device)
-
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask).logits
-            _, preds = torch.max(outputs, dim=1)
-
-            all_preds.extend(preds.cpu().numpy())
-            all_labels.extend(labels.cpu().numpy())
-
-    accuracy = accuracy_score(all_labels, all_preds)
-    report = classification_report(all_labels, all_preds, target_names=["Class 1", "Class 2", "Class 3", "Class 4"])
-
-    print(f"\nValidation/Test Accuracy: {accuracy:.4f}")
-    print("\nClassification Report:")
-    print(report)
-
-# Initialize the optimizer
-from transformers import AdamW
-optimizer = AdamW(model.parameters(), lr=5e-5)
-
-# Train the model with semi-supervised learning
-train_with_semi_supervised_learning(
-    model=model,
-    train_loader=train_loader,
-    unlabeled_loader=unlabeled_loader,
-    val_loader=val_loader,
-    device=device,
-    optimizer=optimizer,
-    num_epochs=10,
-    epsilon=0.1,
-    confidence_threshold=0.9
-)
\ No newline at end of file
+    # Train the model with semi-supervised learning
+    train_with_semi_supervised_learning(
+        model=model,
+        train_loader=train_loader,
+        unlabeled_loader=unlabeled_loader,
+        val_loader=val_loader,
+        device=device,
+        optimizer=optimizer,
+        num_epochs=10,
+        epsilon=0.1,
+        confidence_threshold=0.9,
+        pseudo_refresh='epoch',
+        rescore_margin=0.1,
+        checkpoints=CheckpointManager('checkpoints_ssl', every_steps=500, keep_last=3),
+        resume=True
+    )
\ No newline at end of file
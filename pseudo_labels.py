@@ -0,0 +1,277 @@
+"""Pseudo-label bookkeeping for semi-supervised training."""
+
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset, IterableDataset, Subset, default_convert
+from tqdm import tqdm
+
+from data import BatchSliceDataset
+from model import get_logits, state_fingerprint
+from prediction_cache import DedupIndex, batch_logits
+
+
+# Cache of predictions over the unlabeled pool with a configurable refresh policy.
+#   refresh='epoch'   re-score the pool once at the start of every epoch
+#   refresh='steps'   re-score the pool every `refresh_every` optimizer steps
+#   refresh='rolling' re-score the next `shard_size` rows on every step
+# With `rescore_margin` set, rows already scored far from `confidence_threshold`
+# keep their stored label and only rows within the margin are scored again.
+# A BatchSliceDataset is scored and sampled one gathered batch at a time; any other
+# dataset must be map-style, with rows batched by `collate_fn`.
+class PseudoLabelCache:
+    POLICIES = ('epoch', 'steps', 'rolling')
+
+    def __init__(self, unlabeled_dataset, confidence_threshold=0.9, refresh='epoch', refresh_every=100,
+                 shard_size=256, rescore_margin=None, batch_size=64, collate_fn=None, seed=42):
+        if refresh not in self.POLICIES:
+            raise ValueError(f"refresh must be one of {self.POLICIES}, got {refresh!r}")
+        if isinstance(unlabeled_dataset, IterableDataset) or not hasattr(unlabeled_dataset, '__len__'):
+            raise TypeError("PseudoLabelCache needs an indexable unlabeled dataset with a length (a BatchSliceDataset "
+                            f"or an item-level dataset such as TextDataset), got {type(unlabeled_dataset).__name__}")
+        self.dataset = unlabeled_dataset
+        self.confidence_threshold = confidence_threshold
+        self.refresh = refresh
+        self.refresh_every = refresh_every
+        self.shard_size = shard_size
+        self.rescore_margin = rescore_margin
+        self.batch_size = batch_size
+        self.batched = isinstance(unlabeled_dataset, BatchSliceDataset)
+        # Loaders with batch_size=None only convert items, they do not stack them
+        self.collate_fn = None if collate_fn is default_convert else collate_fn
+        self.generator = torch.Generator().manual_seed(seed)
+
+        size = len(unlabeled_dataset)
+        self.confidences = torch.full((size,), -1.0)  # -1 marks rows that were never scored
+        self.labels = torch.zeros(size, dtype=torch.long)
+        self.cursor = 0
+        self.rows_scored = 0
+
+    def __len__(self):
+        return int(self.selected_mask().sum())
+
+    # Scores, refresh cursor and sampling RNG, for resuming a run with the same pseudo-labels
+    def state_dict(self):
+        return {
+            'confidences': self.confidences,
+            'labels': self.labels,
+            'cursor': self.cursor,
+            'rows_scored': self.rows_scored,
+            'generator': self.generator.get_state(),
+        }
+
+    def load_state_dict(self, state):
+        self.confidences = state['confidences'].clone()
+        self.labels = state['labels'].clone()
+        self.cursor = state['cursor']
+        self.rows_scored = state['rows_scored']
+        self.generator.set_state(state['generator'])
+
+    def selected_mask(self):
+        return self.confidences >= self.confidence_threshold
+
+    # Rows that should be (re-)scored on the next refresh
+    def candidate_mask(self):
+        unscored = self.confidences < 0
+        if self.rescore_margin is None:
+            return torch.ones_like(unscored)
+        near_threshold = (self.confidences - self.confidence_threshold).abs() <= self.rescore_margin
+        return unscored | near_threshold
+
+    def score(self, model, device, indices):
+        if len(indices) == 0:
+            return
+        was_training = model.training
+        model.eval()
+        confidences, labels = [], []
+        with torch.no_grad():
+            for batch in self._batches(indices):
+                input_ids = batch['input_ids'].to(device)
+                attention_mask = batch['attention_mask'].to(device)
+                outputs = get_logits(model(input_ids=input_ids, attention_mask=attention_mask))
+                batch_confidences, batch_labels = torch.softmax(outputs, dim=1).max(dim=1)
+                confidences.append(batch_confidences)
+                labels.append(batch_labels)
+        # One host transfer per refresh instead of one per row
+        self.confidences[indices] = torch.cat(confidences).float().cpu()
+        self.labels[indices] = torch.cat(labels).cpu()
+        self.rows_scored += len(indices)
+        model.train(was_training)
+
+    def _batches(self, indices):
+        if self.batched:
+            for start in range(0, len(indices), self.batch_size):
+                yield self.dataset[indices[start:start + self.batch_size]]
+        else:
+            yield from DataLoader(Subset(self.dataset, indices.tolist()), batch_size=self.batch_size,
+                                  collate_fn=self.collate_fn)
+
+    def refresh_all(self, model, device):
+        self.score(model, device, self.candidate_mask().nonzero().flatten())
+
+    def refresh_shard(self, model, device):
+        size = len(self.confidences)
+        order = torch.roll(torch.arange(size), -self.cursor)
+        picked = order[self.candidate_mask()[order]][:self.shard_size]
+        if len(picked):
+            self.cursor = (int(picked[-1]) + 1) % size
+        self.score(model, device, picked)
+
+    def on_epoch_start(self, model, device):
+        if self.refresh == 'epoch':
+            self.refresh_all(model, device)
+
+    def on_step(self, model, device, step):
+        if self.refresh == 'steps' and step % self.refresh_every == 0:
+            self.refresh_all(model, device)
+        elif self.refresh == 'rolling':
+            self.refresh_shard(model, device)
+
+    # Random batch of confidently pseudo-labeled rows, or None if nothing passed the threshold yet
+    def sample_batch(self, batch_size, device):
+        selected = self.selected_mask().nonzero().flatten()
+        if len(selected) == 0:
+            return None
+        picks = selected[torch.randint(len(selected), (min(batch_size, len(selected)),), generator=self.generator)]
+        if self.batched:
+            batch = self.dataset[picks]
+        elif self.collate_fn is not None:
+            batch = self.collate_fn([self.dataset[i] for i in picks.tolist()])
+        else:
+            items = [self.dataset[i] for i in picks.tolist()]
+            batch = {
+                'input_ids': torch.stack([torch.as_tensor(item['input_ids']) for item in items]),
+                'attention_mask': torch.stack([torch.as_tensor(item['attention_mask']) for item in items]),
+            }
+        return {
+            'input_ids': batch['input_ids'].to(device),
+            'attention_mask': batch['attention_mask'].to(device),
+            'labels': self.labels[picks].to(device),
+        }
+
+
+# Growable store of selected pseudo-labeled rows. Ids, attention masks, labels and
+# confidences live in preallocated tensors (optionally memory-mapped files under
+# `storage_dir`) that double in capacity when full. Rows are returned as views,
+# so sampling from the store does not copy the underlying data.
+class PseudoLabelStore(Dataset):
+    FIELDS = {
+        'input_ids': (np.int64, torch.int64),
+        'attention_mask': (np.int8, torch.int8),
+        'labels': (np.int64, torch.int64),
+        'confidences': (np.float32, torch.float32),
+    }
+
+    def __init__(self, max_length=128, capacity=1024, storage_dir=None, pad_token_id=0):
+        self.max_length = max_length
+        self.storage_dir = storage_dir
+        self.pad_token_id = pad_token_id
+        self.size = 0
+        self.capacity = 0
+        self._arrays = {}
+        self._tensors = {}
+        if storage_dir is not None:
+            os.makedirs(storage_dir, exist_ok=True)
+        self._allocate(capacity)
+
+    def _shape(self, name, capacity):
+        return (capacity, self.max_length) if name in ('input_ids', 'attention_mask') else (capacity,)
+
+    def _allocate(self, capacity):
+        for name, (np_dtype, torch_dtype) in self.FIELDS.items():
+            shape = self._shape(name, capacity)
+            if self.storage_dir is None:
+                grown = torch.empty(shape, dtype=torch_dtype)
+                if self.size:
+                    grown[:self.size] = self._tensors[name][:self.size]
+                self._tensors[name] = grown
+            else:
+                # Extending the file keeps existing rows in place, so growth needs no copy
+                path = os.path.join(self.storage_dir, f"{name}.bin")
+                with open(path, 'ab') as f:
+                    f.truncate(int(np.prod(shape)) * np.dtype(np_dtype).itemsize)
+                self._arrays[name] = np.memmap(path, dtype=np_dtype, mode='r+', shape=shape)
+                self._tensors[name] = torch.from_numpy(self._arrays[name])
+        self.capacity = capacity
+
+    def add(self, input_ids, attention_mask, labels, confidences):
+        count = labels.size(0)
+        if count == 0:
+            return
+        width = input_ids.size(1)
+        if width > self.max_length:
+            raise ValueError(f"rows have {width} tokens but the store holds at most {self.max_length}")
+        if self.size + count > self.capacity:
+            capacity = self.capacity
+            while capacity < self.size + count:
+                capacity *= 2
+            self._allocate(capacity)
+
+        rows = slice(self.size, self.size + count)
+        self._tensors['input_ids'][rows, :width] = input_ids.cpu()
+        self._tensors['input_ids'][rows, width:] = self.pad_token_id
+        self._tensors['attention_mask'][rows, :width] = attention_mask.cpu()
+        self._tensors['attention_mask'][rows, width:] = 0
+        self._tensors['labels'][rows] = labels.cpu()
+        self._tensors['confidences'][rows] = confidences.float().cpu()
+        self.size += count
+
+    # Views over the filled part of every field
+    def tensors(self):
+        return {name: tensor[:self.size] for name, tensor in self._tensors.items()}
+
+    def flush(self):
+        for array in self._arrays.values():
+            array.flush()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.size
+        if not 0 <= idx < self.size:
+            raise IndexError(idx)
+        return {name: tensor[idx] for name, tensor in self._tensors.items()}
+
+
+# Function to generate pseudo-labels.
+# Selection happens with a boolean mask on the device and the kept rows, together
+# with their attention masks, are appended to a PseudoLabelStore batch by batch.
+# With dedup=True duplicate rows are scored once per batch, and with `cache` (a PredictionCache)
+# once per model weights. dedup may also be a DedupIndex over the cleaned texts (see
+# prediction_cache.tokenize_unique) whose unique rows the loader yields in order; each text is then
+# tokenized and scored once and a kept row is stored once for every duplicate.
+def pseudo_labeling(model, unlabeled_loader, device, confidence_threshold=0.9, store=None,
+                    max_length=128, storage_dir=None, cache=None, dedup=False):
+    model.eval()
+    if store is None:
+        store = PseudoLabelStore(max_length=max_length, storage_dir=storage_dir)
+    model_hash = state_fingerprint(model) if cache is not None else None
+    # A text-level index: the loader yields its unique rows in order, each stored once per duplicate
+    text_index = dedup if isinstance(dedup, DedupIndex) else None
+    if text_index is not None:
+        counts = torch.bincount(text_index.inverse, minlength=len(text_index))
+    offset = 0
+
+    with torch.no_grad():
+        for batch in tqdm(unlabeled_loader, desc="Generating Pseudo-Labels"):
+            input_ids = batch['input_ids'].to(device)
+            attention_mask = batch['attention_mask'].to(device)
+
+            # Forward pass
+            outputs = batch_logits(model, batch['input_ids'], batch['attention_mask'], device,
+                                   cache=cache, model_hash=model_hash, dedup=text_index is None and dedup)
+            confidences, preds = torch.softmax(outputs, dim=1).max(dim=1)
+
+            # Keep only high-confidence predictions
+            keep = confidences >= confidence_threshold
+            if text_index is not None:
+                repeats = counts[offset:offset + len(keep)].to(device)
+                offset += len(keep)
+                keep = torch.repeat_interleave(keep.nonzero().flatten(), repeats[keep])
+            store.add(input_ids[keep], attention_mask[keep], preds[keep], confidences[keep])
+
+    store.flush()
+    return store
@@ -0,0 +1,31 @@
+"""Dynamic int8 quantization for CPU inference."""
+
+import torch
+import torch.nn as nn
+from transformers import BertConfig
+
+from model import HybridClassifier
+
+
+# Quantize every nn.Linear (BERT attention/FFN layers, pooler and both heads) to int8.
+# Weights are quantized ahead of time, activations per batch at run time.
+def quantize_model(model, dtype=torch.qint8):
+    model = model.cpu().eval()
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=dtype)
+
+
+# Save a quantized model together with what is needed to rebuild it without downloading BERT
+def save_quantized(quantized_model, path):
+    torch.save({
+        'state_dict': quantized_model.state_dict(),
+        'num_classes': quantized_model.flat_classifier.out_features,
+        'bert_config': quantized_model.bert.config.to_dict(),
+    }, path)
+
+
+def load_quantized(path):
+    artifact = torch.load(path, map_location='cpu', weights_only=False)
+    model = HybridClassifier(artifact['num_classes'], config=BertConfig.from_dict(artifact['bert_config']))
+    model = quantize_model(model)
+    model.load_state_dict(artifact['state_dict'])
+    return model.eval()
@@ -0,0 +1,282 @@
+"""Local prediction service for a trained HybridClassifier.
+
+Concurrent requests are merged into micro-batches: the batcher waits at most
+`max_wait_ms` after the first queued text (or until `max_batch_size` texts are
+queued) and then runs clean -> tokenize -> forward once for the whole batch.
+
+    python serve.py --checkpoint hybrid_classifier_model.pt --num-classes 4 --port 8080
+    curl -s localhost:8080/predict -d '{"texts": ["stocks rally as oil prices fall"]}'
+    curl -s localhost:8080/metrics
+
+Endpoints: POST /predict, GET /metrics, GET /health.
+For latency benchmarks with benchmarks/loadgen.py, pass --cache-size 0 so repeated
+texts are not answered from the prediction cache.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from transformers import AutoTokenizer
+
+from model import load_hybrid_classifier, state_fingerprint
+from prediction_cache import PredictionCache, predict_texts
+from quantize import load_quantized, quantize_model
+
+
+# Runs the clean -> tokenize -> forward path for one batch of raw texts.
+# Texts that are equal after cleaning are run once per batch, and with `cache`
+# (a PredictionCache) texts predicted earlier are answered without the model.
+class Predictor:
+    def __init__(self, model, tokenizer, device='cpu', max_length=128, cache=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_length = max_length
+        self.cache = cache
+        # The weights do not change while serving, so they are fingerprinted once
+        self.model_hash = state_fingerprint(model) if cache is not None else None
+
+    def predict(self, texts):
+        outputs = predict_texts(self.model, self.tokenizer, texts, self.device, cache=self.cache,
+                                model_hash=self.model_hash, max_length=self.max_length, batch_size=len(texts))
+        return torch.softmax(outputs.float(), dim=1).tolist()
+
+
+# Latency percentiles over a sliding window plus throughput counters
+class ServiceStats:
+    def __init__(self, window=10_000):
+        self.latencies = deque(maxlen=window)
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.errors = 0
+
+    def record_request(self, latency, num_texts):
+        self.latencies.append(latency)
+        self.requests += 1
+        self.texts += num_texts
+
+    def record_batch(self, num_texts):
+        self.batches += 1
+        self.batched_texts += num_texts
+
+    def percentile(self, q):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self):
+        uptime = time.perf_counter() - self.started
+        return {
+            'uptime_seconds': uptime,
+            'requests': self.requests,
+            'texts': self.texts,
+            'errors': self.errors,
+            'batches': self.batches,
+            'mean_batch_size': self.batched_texts / self.batches if self.batches else 0.0,
+            'latency_p50_ms': self.percentile(0.50) * 1000,
+            'latency_p99_ms': self.percentile(0.99) * 1000,
+            'requests_per_second': self.requests / uptime if uptime else 0.0,
+            'texts_per_second': self.texts / uptime if uptime else 0.0,
+        }
+
+
+# Collects queued texts into dynamic micro-batches and runs them on one worker thread
+class MicroBatcher:
+    def __init__(self, predictor, stats, max_batch_size=32, max_wait_ms=5.0):
+        self.predictor = predictor
+        self.stats = stats
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        # A single thread keeps forward passes serialized; torch uses intra-op threads inside it
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def _collect(self):
+        pending = [await self.queue.get()]
+        size = len(pending[0][0])
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = await self._collect()
+            texts = [text for request_texts, _ in pending for text in request_texts]
+            try:
+                probabilities = await loop.run_in_executor(self.executor, self.predictor.predict, texts)
+            except Exception as error:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.stats.record_batch(len(texts))
+            offset = 0
+            for request_texts, future in pending:
+                if not future.done():
+                    future.set_result(probabilities[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+
+# Minimal HTTP/1.1 front end with keep-alive, so no web framework is needed
+class PredictionServer:
+    def __init__(self, batcher, stats, class_names=None):
+        self.batcher = batcher
+        self.stats = stats
+        self.class_names = class_names
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self.route(method, path, body)
+                data = json.dumps(payload).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return '200 OK', {'status': 'ok'}
+        if method == 'GET' and path == '/metrics':
+            metrics = self.stats.snapshot()
+            if self.batcher.predictor.cache is not None:
+                metrics.update(self.batcher.predictor.cache.stats())
+            return '200 OK', metrics
+        if method == 'POST' and path == '/predict':
+            try:
+                texts = json.loads(body)['texts']
+                if isinstance(texts, str):
+                    texts = [texts]
+            except (ValueError, KeyError, TypeError):
+                return '400 Bad Request', {'error': 'expected a JSON body like {"texts": ["..."]}'}
+            if not texts:
+                return '200 OK', {'probabilities': [], 'predictions': []}
+            start = time.perf_counter()
+            try:
+                probabilities = await self.batcher.submit(texts)
+            except Exception as error:
+                self.stats.errors += 1
+                return '500 Internal Server Error', {'error': str(error)}
+            self.stats.record_request(time.perf_counter() - start, len(texts))
+            predictions = [max(range(len(row)), key=row.__getitem__) for row in probabilities]
+            response = {'probabilities': probabilities, 'predictions': predictions}
+            if self.class_names:
+                response['labels'] = [self.class_names[index] for index in predictions]
+            return '200 OK', response
+        return '404 Not Found', {'error': f'no route for {method} {path}'}
+
+
+async def serve(predictor, host='127.0.0.1', port=8080, unix_socket=None, max_batch_size=32, max_wait_ms=5.0,
+                class_names=None):
+    stats = ServiceStats()
+    batcher = MicroBatcher(predictor, stats, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    batcher.start()
+    server = PredictionServer(batcher, stats, class_names=class_names)
+    if unix_socket:
+        listener = await asyncio.start_unix_server(server.handle_connection, path=unix_socket)
+        print(f"Serving on unix:{unix_socket}")
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host=host, port=port)
+        print(f"Serving on http://{host}:{port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='hybrid_classifier_model.pt')
+    parser.add_argument('--num-classes', type=int, default=4)
+    parser.add_argument('--bert-model', default='bert-base-uncased')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', default=None, help="listen on a Unix socket instead of TCP")
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--max-length', type=int, default=128)
+    parser.add_argument('--threads', type=int, default=None, help="torch intra-op threads")
+    parser.add_argument('--quantize', action='store_true', help="apply dynamic int8 quantization (CPU)")
+    parser.add_argument('--quantized-artifact', default=None, help="load a model saved by quantize.save_quantized")
+    parser.add_argument('--class-names', nargs='*', default=None)
+    parser.add_argument('--cache-size', type=int, default=100_000, help="LRU prediction cache entries, 0 disables it")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    # The model is loaded once and shared by every request
+    if args.quantized_artifact:
+        device = torch.device('cpu')
+        model = load_quantized(args.quantized_artifact)
+    else:
+        model = load_hybrid_classifier(args.checkpoint, args.num_classes, bert_model_name=args.bert_model, device=device)
+        if args.quantize:
+            device = torch.device('cpu')
+            model = quantize_model(model)
+    tokenizer = AutoTokenizer.from_pretrained(args.bert_model)
+    cache = PredictionCache(args.cache_size) if args.cache_size > 0 else None
+    predictor = Predictor(model, tokenizer, device=device, max_length=args.max_length, cache=cache)
+
+    asyncio.run(serve(predictor, host=args.host, port=args.port, unix_socket=args.unix_socket,
+                      max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                      class_names=args.class_names))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Chunked CSV ingestion for corpora that do not fit in memory.
+
+Rows flow read -> clean -> split -> tokenize -> batch one chunk at a time, so
+memory stays bounded by `chunksize` regardless of the file size.
+"""
+
+import hashlib
+import io
+import math
+import os
+
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+from cleaning import clean_series
+from data import DynamicPaddingCollator
+
+
+# Read a CSV lazily in chunks of `chunksize` rows, optionally starting after the first `skip_rows` data rows.
+# The header is read on its own so those rows are skipped by count; a range of row numbers would be
+# turned into a set that grows with skip_rows.
+def iter_csv_chunks(file_path, chunksize=10_000, usecols=None, skip_rows=0):
+    options = {}
+    if skip_rows:
+        names = pd.read_csv(file_path, nrows=0).columns.tolist()
+        options = {'skiprows': skip_rows + 1, 'header': None, 'names': names}
+    try:
+        reader = pd.read_csv(file_path, chunksize=chunksize, usecols=usecols, **options)
+    except pd.errors.EmptyDataError:
+        return  # Every data row was skipped
+    with reader:
+        yield from reader
+
+
+# Byte ranges of about `block_bytes` covering the data rows of a CSV, plus its header line.
+# Blocks are cut at line boundaries when read (see read_csv_block), so rows must not contain
+# line breaks inside quoted fields.
+def csv_blocks(file_path, block_bytes=64 * 2 ** 20):
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+    return header, [(start, min(start + block_bytes, size)) for start in range(data_start, size, block_bytes)]
+
+
+# Raw bytes of the rows that start inside [start, end); a row crossing `end` is read to its end,
+# and the row crossing `start` belongs to the previous block
+def read_csv_block(file_path, start, end):
+    with open(file_path, 'rb') as f:
+        f.seek(max(start - 1, 0))
+        f.readline()  # Ends at `start` when the previous block ended on a line break
+        data = f.read(max(end - f.tell(), 0))
+        if data and not data.endswith(b'\n'):
+            data += f.readline()
+    return data
+
+
+def _hash_fraction(key):
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') / 2 ** 64
+
+
+# Stratified train/val assignment of one chunk: True marks validation rows.
+# Within the chunk every class gets a quota of floor(n * val_fraction + phase) of its n rows,
+# taken at evenly spaced positions of that class, so each class is within one row of
+# val_fraction in every chunk and the split never needs the whole file. The phase is a hash of
+# (seed, chunk, label), which spreads the rounding over chunks, so a class with fewer rows per
+# chunk than 1 / val_fraction still gets its share of validation rows over the file.
+# Depends only on the chunk's labels and position, so the train and val datasets agree.
+def validation_mask(labels, chunk_index, val_fraction=0.2, seed=42):
+    seen, phases, mask = {}, {}, []
+    for label in labels:
+        if label not in phases:
+            phases[label] = _hash_fraction(f"{seed}|{chunk_index}|{label}")
+        count, phase = seen.get(label, 0), phases[label]
+        mask.append(math.floor((count + 1) * val_fraction + phase) > math.floor(count * val_fraction + phase))
+        seen[label] = count + 1
+    return mask
+
+
+# Streams ready-made batches for one side of the stratified split.
+# Use it with DataLoader(dataset, batch_size=None). The file is cut into byte blocks of
+# `block_bytes` and every DataLoader worker reads and parses only its own blocks, in chunks of
+# `chunksize` rows. Chunks are numbered by block, so the split and the shuffle do not depend on
+# the number of workers.
+class StreamingTextDataset(IterableDataset):
+    def __init__(self, file_path, tokenizer, split='train', val_fraction=0.2, seed=42,
+                 text_column='Description', label_column='Class Index', chunksize=10_000,
+                 batch_size=16, max_length=128, shuffle=None, block_bytes=64 * 2 ** 20):
+        if split not in ('train', 'val', 'all'):
+            raise ValueError(f"split must be 'train', 'val' or 'all', got {split!r}")
+        self.file_path = file_path
+        self.tokenizer = tokenizer
+        self.split = split
+        self.val_fraction = val_fraction
+        self.seed = seed
+        self.text_column = text_column
+        self.label_column = label_column
+        self.chunksize = chunksize
+        self.block_bytes = block_bytes
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.shuffle = split == 'train' if shuffle is None else shuffle
+        self.epoch = 0
+        self.collator = DynamicPaddingCollator(pad_token_id=tokenizer.pad_token_id or 0, max_length=max_length)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _split_mask(self, labels, chunk_index):
+        if self.split == 'all':
+            return [True] * len(labels)
+        want_val = self.split == 'val'
+        return [is_val == want_val for is_val in validation_mask(labels, chunk_index, self.val_fraction, self.seed)]
+
+    def _iter_chunks(self):
+        worker = get_worker_info()
+        header, blocks = csv_blocks(self.file_path, self.block_bytes)
+        for block_index, (start, end) in enumerate(blocks):
+            if worker is not None and block_index % worker.num_workers != worker.id:
+                continue
+            data = read_csv_block(self.file_path, start, end)
+            if not data:
+                continue
+            with pd.read_csv(io.BytesIO(header + data), chunksize=self.chunksize,
+                             usecols=[self.text_column, self.label_column]) as reader:
+                for sub_index, chunk in enumerate(reader):
+                    yield block_index * 1_000_000 + sub_index, chunk
+
+    def __iter__(self):
+        for chunk_index, chunk in self._iter_chunks():
+            texts = clean_series(chunk[self.text_column]).tolist()
+            labels = chunk[self.label_column].tolist()
+            keep = self._split_mask(labels, chunk_index)
+            texts = [text for text, kept in zip(texts, keep) if kept]
+            labels = [label for label, kept in zip(labels, keep) if kept]
+            if not texts:
+                continue
+
+            # Tokenize the whole chunk unpadded; each batch is padded to its own longest row
+            encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+            order = list(range(len(texts)))
+            if self.shuffle:
+                generator = torch.Generator().manual_seed(self.seed + self.epoch * 1_000_003 + chunk_index)
+                order = torch.randperm(len(texts), generator=generator).tolist()
+
+            for start in range(0, len(order), self.batch_size):
+                items = [{
+                    'input_ids': encoded['input_ids'][idx],
+                    'attention_mask': encoded['attention_mask'][idx],
+                    'labels': labels[idx],
+                } for idx in order[start:start + self.batch_size]]
+                yield self.collator(items)
+        self.epoch += 1
+
+
+# Train and validation loaders over a CSV of any size
+def make_streaming_loaders(file_path, tokenizer, batch_size=16, max_length=128, chunksize=10_000,
+                           val_fraction=0.2, seed=42, num_workers=0):
+    loaders = []
+    for split in ('train', 'val'):
+        dataset = StreamingTextDataset(file_path, tokenizer, split=split, val_fraction=val_fraction, seed=seed,
+                                       chunksize=chunksize, batch_size=batch_size, max_length=max_length)
+        loaders.append(DataLoader(dataset, batch_size=None, num_workers=num_workers,
+                                  persistent_workers=num_workers > 0))
+    return tuple(loaders)
@@ -0,0 +1,212 @@
+"""Low-overhead training telemetry.
+
+Loss and accuracy are summed on the device and only read back every
+`flush_every` steps. Stages (data wait, H2D copy, forward, backward, optimizer)
+are timed with CUDA events on GPU and perf_counter on CPU, and an optional
+torch.profiler trace can be captured for a window of steps. A JSON report is
+written per epoch and hooks can observe steps, flushes and epoch ends.
+"""
+
+import contextlib
+import json
+import os
+import time
+
+import torch
+
+from metrics import all_reduce_sum, is_distributed, is_main_process
+
+STAGES = ('data_wait', 'h2d', 'forward', 'backward', 'optimizer')
+
+
+# Base class for telemetry hooks; override any of the callbacks
+class TelemetryHook:
+    def on_step(self, telemetry):
+        pass
+
+    def on_flush(self, telemetry, stats):
+        pass
+
+    def on_epoch_end(self, telemetry, report):
+        pass
+
+
+# Prints running loss/accuracy at every flush
+class PrintHook(TelemetryHook):
+    def on_flush(self, telemetry, stats):
+        print(f"step {stats['step']}: loss {stats['loss']:.4f} | accuracy {stats['accuracy']:.4f} | "
+              f"{stats['samples_per_second']:.1f} samples/s")
+
+
+class TrainingTelemetry:
+    def __init__(self, device, flush_every=50, hooks=(), report_dir=None, profile_steps=None, profile_dir='profiles'):
+        self.device = torch.device(device)
+        self.flush_every = flush_every
+        self.hooks = list(hooks)
+        self.report_dir = report_dir
+        # (first_step, num_steps) of the window to trace with torch.profiler, counted from the start of training
+        self.profile_steps = profile_steps
+        self.profile_dir = profile_dir
+        self.use_cuda_events = self.device.type == 'cuda'
+        self.global_step = 0
+        self.epoch = 0
+        self._profiler = None
+        self._reset_epoch()
+
+    def _reset_epoch(self):
+        self.steps_in_epoch = 0
+        self.stage_seconds = {stage: 0.0 for stage in STAGES}
+        self._pending_events = []
+        self._loss_sum = torch.zeros((), device=self.device)
+        self._correct = torch.zeros((), dtype=torch.long, device=self.device)
+        self._samples = 0
+        self._window_loss = torch.zeros((), device=self.device)
+        self._window_correct = torch.zeros((), dtype=torch.long, device=self.device)
+        self._window_samples = 0
+        self._window_steps = 0
+        self._window_start = time.perf_counter()
+        self._epoch_start = time.perf_counter()
+        self.flushes = []
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def start_epoch(self, epoch):
+        self.epoch = epoch
+        self._reset_epoch()
+        if self.profile_steps is not None and self._profiler is None and epoch == 0:
+            self._start_profiler()
+
+    def _start_profiler(self):
+        first_step, num_steps = self.profile_steps
+        os.makedirs(self.profile_dir, exist_ok=True)
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self.use_cuda_events:
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._profiler = torch.profiler.profile(
+            activities=activities,
+            schedule=torch.profiler.schedule(wait=max(first_step - 1, 0), warmup=min(first_step, 1),
+                                             active=num_steps, repeat=1),
+            on_trace_ready=lambda profiler: profiler.export_chrome_trace(
+                os.path.join(self.profile_dir, f"trace_step{first_step}-{first_step + num_steps}.json")),
+            record_shapes=True,
+        )
+        self._profiler.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.use_cuda_events:
+            start, end = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+            start.record()
+            with torch.profiler.record_function(name):
+                yield
+            end.record()
+            # Resolved at the next flush, so timing adds no sync of its own
+            self._pending_events.append((name, start, end))
+        else:
+            start = time.perf_counter()
+            with torch.profiler.record_function(name):
+                yield
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - start
+
+    # Wraps a loader so the time spent waiting for each batch is recorded as 'data_wait'
+    def iter_batches(self, loader):
+        iterator = iter(loader)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self.stage_seconds['data_wait'] += time.perf_counter() - start
+            yield batch
+
+    # Accumulate loss and correct predictions on the device
+    def record_step(self, loss, outputs, labels):
+        loss = loss.detach().float()
+        correct = (outputs.detach().argmax(dim=1) == labels).sum()
+        self._loss_sum += loss
+        self._window_loss += loss
+        self._correct += correct
+        self._window_correct += correct
+        self._samples += labels.size(0)
+        self._window_samples += labels.size(0)
+        self._window_steps += 1
+        self.steps_in_epoch += 1
+
+    def end_step(self):
+        self.global_step += 1
+        if self._profiler is not None:
+            self._profiler.step()
+            first_step, num_steps = self.profile_steps
+            if self.global_step >= first_step + num_steps:
+                self._profiler.stop()
+                self._profiler = None
+                self.profile_steps = None
+        for hook in self.hooks:
+            hook.on_step(self)
+        if self.flush_every and self._window_steps >= self.flush_every:
+            self.flush()
+
+    def _resolve_events(self):
+        if self._pending_events:
+            torch.cuda.synchronize(self.device)
+            for name, start, end in self._pending_events:
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + start.elapsed_time(end) / 1000
+            self._pending_events = []
+
+    # The only point where device values are read back during an epoch
+    def flush(self):
+        if self._window_steps == 0:
+            return None
+        self._resolve_events()
+        elapsed = time.perf_counter() - self._window_start
+        stats = {
+            'epoch': self.epoch,
+            'step': self.global_step,
+            'loss': self._window_loss.item() / self._window_steps,
+            'accuracy': self._window_correct.item() / max(self._window_samples, 1),
+            'samples_per_second': self._window_samples / elapsed if elapsed else 0.0,
+        }
+        self.flushes.append(stats)
+        for hook in self.hooks:
+            hook.on_flush(self, stats)
+        self._window_loss.zero_()
+        self._window_correct.zero_()
+        self._window_samples = 0
+        self._window_steps = 0
+        self._window_start = time.perf_counter()
+        return stats
+
+    # Epoch totals are summed over all processes under torch.distributed; flushes and stage times stay per-rank
+    def end_epoch(self, extra=None):
+        self.flush()
+        self._resolve_events()
+        elapsed = time.perf_counter() - self._epoch_start
+        timed = sum(self.stage_seconds.values())
+        loss_sum, correct = self._loss_sum.clone(), self._correct.clone()
+        counts = torch.tensor([self.steps_in_epoch, self._samples], device=self.device)
+        all_reduce_sum(loss_sum, correct, counts)
+        steps, samples = counts.tolist()
+        report = {
+            'epoch': self.epoch,
+            'steps': steps,
+            'samples': samples,
+            'seconds': elapsed,
+            'samples_per_second': samples / elapsed if elapsed else 0.0,
+            'loss': loss_sum.item() / max(steps, 1),
+            'accuracy': correct.item() / max(samples, 1),
+            'world_size': torch.distributed.get_world_size() if is_distributed() else 1,
+            'stage_seconds': dict(self.stage_seconds),
+            'stage_share': {stage: seconds / timed if timed else 0.0 for stage, seconds in self.stage_seconds.items()},
+            'flushes': self.flushes,
+        }
+        if extra:
+            report.update(extra)
+        if self.report_dir and is_main_process():
+            os.makedirs(self.report_dir, exist_ok=True)
+            with open(os.path.join(self.report_dir, f"epoch_{self.epoch + 1}.json"), 'w') as f:
+                json.dump(report, f, indent=2)
+        for hook in self.hooks:
+            hook.on_epoch_end(self, report)
+        return report
@@ -0,0 +1,20 @@
+"""clean_text and its patterns, without pandas.
+
+Kept apart from cleaning.py so the compiled runtime can clean text without
+importing pandas; cleaning.py re-exports everything defined here.
+"""
+
+import re
+
+# Compiled once instead of on every call
+NON_ALPHA_PATTERN = re.compile(r"[^a-zA-Z\s]")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# Output of clean_text: lowercase words separated by single spaces (or nothing at all)
+CLEANED_PATTERN = re.compile(r"(?:[a-z]+(?: [a-z]+)*)?")
+
+
+# Cleaning text data
+def clean_text(text):
+    text = NON_ALPHA_PATTERN.sub("", text)  # Removing special characters and numbers
+    text = WHITESPACE_PATTERN.sub(" ", text).strip()  # Removing extra whitespaces
+    return text.lower()
@@ -0,0 +1,235 @@
+"""Tokenization helpers, the on-disk tokenization cache and the sharded tokenizer."""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+
+
+# Stable fingerprint of a tokenizer: name, vocabulary and lowercasing
+def tokenizer_fingerprint(tokenizer):
+    digest = hashlib.sha256()
+    digest.update(str(getattr(tokenizer, 'name_or_path', '')).encode())
+    digest.update(str(getattr(tokenizer, 'do_lower_case', tokenizer.init_kwargs.get('do_lower_case'))).encode())
+    for token, token_id in sorted(tokenizer.get_vocab().items(), key=lambda item: item[1]):
+        digest.update(f"{token_id}\t{token}\n".encode())
+    return digest.hexdigest()
+
+
+# Hash of a text column, length-prefixed so different splits of the same characters differ
+def texts_fingerprint(texts):
+    digest = hashlib.sha256()
+    for text in texts:
+        encoded = text.encode()
+        digest.update(len(encoded).to_bytes(8, 'little'))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+# Content-addressed cache of tokenized columns. Each entry is a directory of .npy
+# arrays that are memory-mapped on load, so repeated runs get tensors without
+# calling the tokenizer and without reading the arrays into memory up front.
+class TokenizationCache:
+    def __init__(self, cache_dir='.token_cache'):
+        self.cache_dir = cache_dir
+        self._tokenizer_keys = {}
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, tokenizer, texts, max_length, padding, truncation=True):
+        if id(tokenizer) not in self._tokenizer_keys:
+            self._tokenizer_keys[id(tokenizer)] = tokenizer_fingerprint(tokenizer)
+        parts = [texts_fingerprint(texts), self._tokenizer_keys[id(tokenizer)], str(max_length), str(padding), str(truncation)]
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    def load(self, key):
+        entry = os.path.join(self.cache_dir, key)
+        manifest_path = os.path.join(entry, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            names = json.load(f)['arrays']
+        # mmap_mode='c' maps the file copy-on-write, so the tensors are writable views without a copy
+        return {name: torch.from_numpy(np.load(os.path.join(entry, f"{name}.npy"), mmap_mode='c')) for name in names}
+
+    # Empty directory for writing an entry's .npy files before commit() moves it into place
+    def staging_dir(self):
+        return tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+
+    def commit(self, staging, key, names):
+        entry = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+                json.dump({'arrays': list(names)}, f)
+            os.replace(staging, entry)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.exists(os.path.join(entry, 'manifest.json')):
+                raise
+
+    def store(self, key, arrays):
+        staging = self.staging_dir()
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array))
+        self.commit(staging, key, arrays)
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+
+# Tokenize a list of texts into padded tensors, going through `cache` when given
+def tokenize_texts(tokenizer, texts, max_length=128, padding='max_length', cache=None):
+    texts = list(texts)
+    if cache is None:
+        return dict(tokenizer(texts, padding=padding, truncation=True, max_length=max_length, return_tensors='pt'))
+
+    key = cache.key(tokenizer, texts, max_length, padding)
+    inputs = cache.load(key)
+    if inputs is not None:
+        cache.hits += 1
+        return inputs
+
+    cache.misses += 1
+    encoded = tokenizer(texts, padding=padding, truncation=True, max_length=max_length, return_tensors='np')
+    cache.store(key, dict(encoded))
+    return cache.load(key)
+
+
+# The fast (Rust) tokenizer for a model name or path, or for an already loaded tokenizer.
+# A slow tokenizer is swapped for the fast one of the same name; both produce the same ids.
+def load_fast_tokenizer(tokenizer):
+    if isinstance(tokenizer, str):
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer, use_fast=True)
+    elif not tokenizer.is_fast:
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer.name_or_path, use_fast=True)
+    if not tokenizer.is_fast:
+        raise ValueError(f"No fast tokenizer available for {tokenizer.name_or_path!r}")
+    return tokenizer
+
+
+# Smallest integer dtype holding every token id of the tokenizer (int16 for BERT's 30522 tokens)
+def token_dtype(tokenizer):
+    return np.int16 if len(tokenizer) <= np.iinfo(np.int16).max + 1 else np.int32
+
+
+_shard_tokenizer = None
+
+
+def _init_shard_worker(tokenizer):
+    global _shard_tokenizer
+    _shard_tokenizer = tokenizer
+    # The pool already uses every core; Rust threads inside each worker would only compete with it
+    os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+
+
+def _encode(tokenizer, texts, max_length, stride):
+    return tokenizer(texts, padding='max_length', truncation=True, max_length=max_length,
+                     stride=stride or 0, return_overflowing_tokens=stride is not None,
+                     return_token_type_ids=False, return_tensors='np')
+
+
+# Tokenize one shard and write it into rows start:start+len(texts) of the preallocated arrays
+def _write_shard(paths, start, texts, max_length, tokenizer=None):
+    encoded = _encode(tokenizer or _shard_tokenizer, texts, max_length, None)
+    for name, path in paths.items():
+        array = np.load(path, mmap_mode='r+')
+        array[start:start + len(texts)] = encoded[name]
+        del array
+    return start
+
+
+# With overflow the number of rows of a shard is only known after tokenizing it, so the shard
+# comes back already in the compact dtypes and the parent copies it into place
+def _encode_shard(start, texts, max_length, stride, dtype, tokenizer=None):
+    encoded = _encode(tokenizer or _shard_tokenizer, texts, max_length, stride)
+    return {
+        'input_ids': encoded['input_ids'].astype(dtype),
+        'attention_mask': encoded['attention_mask'].astype(np.int8),
+        'overflow_to_sample_mapping': (encoded['overflow_to_sample_mapping'] + start).astype(np.int32),
+    }
+
+
+def _allocate(directory, name, dtype, shape):
+    path = os.path.join(directory, f"{name}.npy")
+    np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape).flush()
+    return path
+
+
+def _run_shards(fn, shards, workers, tokenizer, *args):
+    if workers <= 1:
+        return [fn(*shard, *args, tokenizer=tokenizer) for shard in shards]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_worker, initargs=(tokenizer,)) as pool:
+        futures = [pool.submit(fn, *shard, *args) for shard in shards]
+        return [future.result() for future in futures]
+
+
+# Tokenize a large text column with the fast tokenizer, `shard_size` texts per task on a pool of
+# `workers` processes. Shards are written straight into preallocated .npy arrays that the returned
+# tensors memory-map: input_ids in token_dtype(tokenizer) (int16 for BERT) and attention_mask in
+# int8, instead of int64 tensors. token_type_ids are left out (all zeros for single texts).
+# With `stride`, texts longer than max_length are split into windows that overlap by `stride`
+# tokens, and 'overflow_to_sample_mapping' gives the text index of every row.
+def tokenize_sharded(tokenizer, texts, max_length=128, workers=None, shard_size=20_000, stride=None, cache=None):
+    tokenizer = load_fast_tokenizer(tokenizer)
+    texts = list(texts)
+    dtype = token_dtype(tokenizer)
+    key = None
+    if cache is not None:
+        key = cache.key(tokenizer, texts, max_length, f"max_length|{np.dtype(dtype).name}|stride={stride}")
+        inputs = cache.load(key)
+        if inputs is not None:
+            cache.hits += 1
+            return inputs
+        cache.misses += 1
+        directory = cache.staging_dir()
+    else:
+        directory = tempfile.mkdtemp(prefix='tokens-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+    shards = [(start, texts[start:start + shard_size]) for start in range(0, len(texts), shard_size)]
+    workers = max(min(workers or os.cpu_count() or 1, len(shards)), 1)
+    try:
+        if stride is None:
+            paths = {'input_ids': _allocate(directory, 'input_ids', dtype, (len(texts), max_length)),
+                     'attention_mask': _allocate(directory, 'attention_mask', np.int8, (len(texts), max_length))}
+            _run_shards(_write_shard, [(paths, start, shard) for start, shard in shards], workers, tokenizer,
+                        max_length)
+            names = list(paths)
+        else:
+            results = _run_shards(_encode_shard, shards, workers, tokenizer, max_length, stride, dtype)
+            rows = sum(len(result['input_ids']) for result in results)
+            names = ['input_ids', 'attention_mask', 'overflow_to_sample_mapping']
+            arrays = {
+                'input_ids': np.lib.format.open_memmap(_allocate(directory, 'input_ids', dtype, (rows, max_length)),
+                                                       mode='r+'),
+                'attention_mask': np.lib.format.open_memmap(
+                    _allocate(directory, 'attention_mask', np.int8, (rows, max_length)), mode='r+'),
+                'overflow_to_sample_mapping': np.lib.format.open_memmap(
+                    _allocate(directory, 'overflow_to_sample_mapping', np.int32, (rows,)), mode='r+'),
+            }
+            row = 0
+            for result in results:
+                for name in names:
+                    arrays[name][row:row + len(result[name])] = result[name]
+                row += len(result['input_ids'])
+            del arrays
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    if cache is not None:
+        cache.commit(directory, key, names)
+        return cache.load(key)
+    inputs = {name: torch.from_numpy(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='c'))
+              for name in names}
+    # The mappings stay valid after the files are unlinked, and the memory is freed with the tensors
+    shutil.rmtree(directory, ignore_errors=True)
+    return inputs
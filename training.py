@@ -0,0 +1,359 @@
+"""Supervised and semi-supervised training loops."""
+
+import contextlib
+import resource
+import sys
+import time
+
+import torch
+from tqdm import tqdm
+
+from checkpoint import (epoch_start_state, restore_rng_state, restore_training_state, resume_iterator,
+                        training_state)
+from evaluation import evaluate_model
+from freezing import set_activation_checkpointing, trainable_parameter_count
+from metrics import all_reduce_sum
+from model import get_logits
+from pseudo_labels import PseudoLabelCache
+from telemetry import TrainingTelemetry
+
+PRECISIONS = ('fp32', 'bf16', 'fp16')
+
+
+# Autocast for the requested precision; bf16 also works on CPU, fp16 needs CUDA
+def autocast(device, precision='fp32'):
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
+    device = torch.device(device)
+    if precision == 'fp32':
+        return contextlib.nullcontext()
+    if precision == 'fp16' and device.type != 'cuda':
+        raise ValueError("fp16 autocast needs a CUDA device, use precision='bf16' on CPU")
+    dtype = torch.bfloat16 if precision == 'bf16' else torch.float16
+    return torch.autocast(device_type=device.type, dtype=dtype)
+
+
+# Loss scaling is only needed (and only enabled) for fp16
+def make_grad_scaler(device, precision='fp32'):
+    return torch.amp.GradScaler('cuda', enabled=precision == 'fp16' and torch.device(device).type == 'cuda')
+
+
+def optimizer_step(model, optimizer, scaler, max_grad_norm=None):
+    if max_grad_norm is not None:
+        scaler.unscale_(optimizer)
+        torch.nn.utils.clip_grad_norm_(model.parameters(), max_grad_norm)
+    scaler.step(optimizer)
+    scaler.update()
+    optimizer.zero_grad()
+
+
+def reset_peak_memory(device):
+    if torch.device(device).type == 'cuda':
+        torch.cuda.reset_peak_memory_stats(device)
+
+
+# Peak allocated memory on CUDA; on CPU the process' peak resident set size so far
+def peak_memory_mb(device):
+    if torch.device(device).type == 'cuda':
+        return torch.cuda.max_memory_allocated(device) / 2 ** 20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+# Function to calculate accuracy
+def calculate_accuracy(predictions, labels):
+    _, preds = torch.max(predictions, dim=1)
+    return (preds == labels).sum().item() / labels.size(0)
+
+
+# Apply the freeze schedule for `epoch` and describe the memory-related configuration for the reports
+def memory_configuration(model, optimizer, epoch, activation_checkpointing, freeze_schedule):
+    trainable_layers = None
+    if freeze_schedule is not None:
+        trainable_layers = freeze_schedule.apply(model, optimizer, epoch)
+    return {
+        'activation_checkpointing': activation_checkpointing,
+        'trainable_layers': trainable_layers,
+        'trainable_parameters': trainable_parameter_count(model),
+    }
+
+
+def print_memory_report(report, batches):
+    layers = 'all' if report['trainable_layers'] is None else report['trainable_layers']
+    print(f"Step time: {report['step_seconds'] * 1000:.1f} ms over {batches} batches | "
+          f"Peak memory: {report['peak_memory_mb']:.0f} MB | Trainable layers: {layers} "
+          f"({report['trainable_parameters'] / 1e6:.1f}M parameters) | "
+          f"Activation checkpointing: {'on' if report['activation_checkpointing'] else 'off'}")
+
+
+# Training loop.
+# precision='bf16' trains under autocast, accumulation_steps > 1 sums gradients over that many
+# micro-batches per optimizer step, and max_grad_norm clips the gradient norm before each step.
+# Loss and accuracy are accumulated on the device by `telemetry` (a TrainingTelemetry), which
+# also times every stage and can write a JSON report per epoch.
+# With `checkpoints` (a CheckpointManager) a checkpoint is written in the background every
+# `checkpoints.every_steps` optimizer steps; resume=True continues from the latest one.
+# activation_checkpointing=True recomputes BERT layer activations in backward instead of keeping
+# them, and `freeze_schedule` (a freezing.FreezeSchedule) chooses the trained layers per epoch.
+# Returns one report per epoch, with peak memory and step time; under torch.distributed the loss
+# and accuracy cover all processes.
+def train_model(model, train_loader, val_loader, criterion, optimizer, device, epochs=3,
+                precision='fp32', accumulation_steps=1, max_grad_norm=None, telemetry=None,
+                checkpoints=None, resume=False, activation_checkpointing=False, freeze_schedule=None):
+    scaler = make_grad_scaler(device, precision)
+    set_activation_checkpointing(model, activation_checkpointing)
+    telemetry = telemetry or TrainingTelemetry(device)
+    non_blocking = torch.device(device).type == 'cuda'
+
+    history = []
+    start_epoch, global_step, resume_state = 0, 0, None
+    if checkpoints is not None and resume:
+        resume_state = checkpoints.load()
+        if resume_state is not None:
+            if freeze_schedule is not None:
+                # The optimizer's parameter groups must match the checkpoint's epoch before its state is loaded
+                freeze_schedule.apply(model, optimizer, resume_state['epoch'])
+            restore_training_state(resume_state, model, optimizer, scaler)
+            start_epoch, global_step = resume_state['epoch'], resume_state['global_step']
+
+    for epoch in range(start_epoch, epochs):
+        print(f"\nEpoch {epoch + 1}/{epochs}")
+        print("-" * 30)
+
+        # Training phase
+        model.train()
+        configuration = memory_configuration(model, optimizer, epoch, activation_checkpointing, freeze_schedule)
+        reset_peak_memory(device)
+        telemetry.start_epoch(epoch)
+        epoch_start = time.perf_counter()
+        optimizer.zero_grad()
+        batches, start_batch = train_loader, 0
+        if resume_state is not None:
+            # Replay the interrupted epoch's batch order from the batch after the checkpoint
+            epoch_state, start_batch = resume_state['epoch_state'], resume_state['step_in_epoch']
+            batches = resume_iterator(train_loader, epoch_state, start_batch)
+            restore_rng_state(resume_state['rng'])
+            resume_state = None
+        else:
+            epoch_state = epoch_start_state(train_loader)
+        for batch in telemetry.iter_batches(tqdm(batches, desc="Training", initial=start_batch)):
+            with telemetry.stage('h2d'):
+                input_ids = batch['input_ids'].to(device, non_blocking=non_blocking)
+                attention_mask = batch['attention_mask'].to(device, non_blocking=non_blocking)
+                labels = batch['labels'].to(device, non_blocking=non_blocking)
+
+            # Forward pass
+            with telemetry.stage('forward'), autocast(device, precision):
+                outputs = model(input_ids=input_ids, attention_mask=attention_mask)
+
+                # Compute loss
+                loss = criterion(outputs, labels)
+
+            # Backward pass, stepping once every accumulation_steps micro-batches
+            with telemetry.stage('backward'):
+                scaler.scale(loss / accumulation_steps).backward()
+            telemetry.record_step(loss, outputs, labels)
+            if telemetry.steps_in_epoch % accumulation_steps == 0:
+                with telemetry.stage('optimizer'):
+                    optimizer_step(model, optimizer, scaler, max_grad_norm)
+                global_step += 1
+                if checkpoints is not None and checkpoints.due(global_step):
+                    checkpoints.save(global_step, training_state(
+                        model, optimizer, scaler, epoch, start_batch + telemetry.steps_in_epoch, global_step,
+                        epoch_state))
+            telemetry.end_step()
+
+        # Apply gradients left over from an incomplete accumulation window
+        if telemetry.steps_in_epoch % accumulation_steps:
+            with telemetry.stage('optimizer'):
+                optimizer_step(model, optimizer, scaler, max_grad_norm)
+            global_step += 1
+
+        # Per batch on this process, including data loading
+        step_seconds = (time.perf_counter() - epoch_start) / max(telemetry.steps_in_epoch, 1)
+        report = telemetry.end_epoch(extra={'peak_memory_mb': peak_memory_mb(device), 'step_seconds': step_seconds,
+                                            **configuration})
+        print(f"Training Loss: {report['loss']:.4f} | Training Accuracy: {report['accuracy']:.4f}")
+        print(f"Throughput: {report['samples_per_second']:.1f} samples/s")
+        print_memory_report(report, telemetry.steps_in_epoch)
+        print("Stage time: " + ", ".join(f"{stage} {share:.0%}" for stage, share in report['stage_share'].items()))
+
+        # Validation phase
+        model.eval()
+        val_loss = torch.zeros((), device=device)
+        val_correct = torch.zeros((), dtype=torch.long, device=device)
+        val_counts = torch.zeros(2, dtype=torch.long, device=device)  # batches, samples
+        with torch.no_grad():
+            for batch in tqdm(val_loader, desc="Validation"):
+                input_ids = batch['input_ids'].to(device, non_blocking=non_blocking)
+                attention_mask = batch['attention_mask'].to(device, non_blocking=non_blocking)
+                labels = batch['labels'].to(device, non_blocking=non_blocking)
+
+                # Forward pass
+                with autocast(device, precision):
+                    outputs = model(input_ids=input_ids, attention_mask=attention_mask)
+
+                    # Compute loss
+                    loss = criterion(outputs, labels)
+
+                # Accumulate on the device, read back once after the loop
+                val_loss += loss.float()
+                val_correct += (outputs.argmax(dim=1) == labels).sum()
+                val_counts[0] += 1
+                val_counts[1] += labels.size(0)
+
+        all_reduce_sum(val_loss, val_correct, val_counts)
+        val_batches, val_samples = val_counts.tolist()
+        val_loss = val_loss.item() / max(val_batches, 1)
+        val_acc = val_correct.item() / max(val_samples, 1)
+
+        print(f"Validation Loss: {val_loss:.4f} | Validation Accuracy: {val_acc:.4f}")
+        history.append({**report, 'val_loss': val_loss, 'val_accuracy': val_acc})
+
+    if checkpoints is not None:
+        checkpoints.wait()
+    return history
+
+
+# Clean logits and the consistency loss from one encoder call.
+# Gaussian noise (std `epsilon`) is added to the word embeddings rather than to the token ids;
+# the clean and noisy views are concatenated into a single double-size batch and the clean half
+# of the logits is returned so the supervised loss can reuse it.
+def consistency_forward(model, input_ids, attention_mask, epsilon=0.1):
+    embedding_layer = getattr(model, 'module', model).get_input_embeddings()  # Unwrap DistributedDataParallel
+    embeddings = embedding_layer(input_ids)
+    noisy_embeddings = embeddings + torch.randn_like(embeddings) * epsilon
+    outputs = get_logits(model(inputs_embeds=torch.cat([embeddings, noisy_embeddings]),
+                               attention_mask=torch.cat([attention_mask, attention_mask])))
+    original_output, noisy_output = outputs.chunk(2)
+
+    # Calculate consistency loss (Mean Squared Error)
+    loss = torch.mean((original_output - noisy_output) ** 2)
+    return original_output, loss
+
+
+# Consistency loss on its own, for callers that do not need the clean logits
+def consistency_regularization(model, inputs, attention_mask, device, epsilon=0.1):
+    return consistency_forward(model, inputs, attention_mask, epsilon)[1]
+
+
+def train_with_semi_supervised_learning(
+    model, train_loader, unlabeled_loader, val_loader, device, optimizer, num_epochs=10, epsilon=0.1, confidence_threshold=0.9,
+    pseudo_refresh='epoch', refresh_every=100, shard_size=256, rescore_margin=None,
+    precision='fp32', accumulation_steps=1, max_grad_norm=None, checkpoints=None, resume=False,
+    activation_checkpointing=False, freeze_schedule=None
+):
+    # Pseudo-labels are cached and refreshed by policy instead of re-scoring the whole pool every step
+    pseudo_cache = PseudoLabelCache(
+        unlabeled_loader.dataset,
+        confidence_threshold=confidence_threshold,
+        refresh=pseudo_refresh,
+        refresh_every=refresh_every,
+        shard_size=shard_size,
+        rescore_margin=rescore_margin,
+        batch_size=unlabeled_loader.batch_size or 16,
+        collate_fn=unlabeled_loader.collate_fn,
+    )
+    scaler = make_grad_scaler(device, precision)
+    set_activation_checkpointing(model, activation_checkpointing)
+
+    history = []
+    # `step` counts labeled batches (drives the pseudo-label refresh), `updates` counts optimizer steps
+    start_epoch, step, updates, resume_state = 0, 0, 0, None
+    if checkpoints is not None and resume:
+        resume_state = checkpoints.load()
+        if resume_state is not None:
+            if freeze_schedule is not None:
+                freeze_schedule.apply(model, optimizer, resume_state['epoch'])
+            restore_training_state(resume_state, model, optimizer, scaler)
+            pseudo_cache.load_state_dict(resume_state['pseudo_cache'])
+            start_epoch, step, updates = resume_state['epoch'], resume_state['step'], resume_state['global_step']
+
+    for epoch in range(start_epoch, num_epochs):
+        print(f"\nEpoch {epoch + 1}/{num_epochs}")
+        print("-" * 30)
+
+        model.train()
+        configuration = memory_configuration(model, optimizer, epoch, activation_checkpointing, freeze_schedule)
+        reset_peak_memory(device)
+        epoch_start = time.perf_counter()
+        total_loss, num_batches, num_samples = 0, 0, 0
+        optimizer.zero_grad()
+        batches, start_batch = train_loader, 0
+        if resume_state is not None:
+            # The restored pseudo-label cache already holds this epoch's refresh
+            epoch_state, start_batch = resume_state['epoch_state'], resume_state['step_in_epoch']
+            batches = resume_iterator(train_loader, epoch_state, start_batch)
+            restore_rng_state(resume_state['rng'])
+            resume_state = None
+        else:
+            pseudo_cache.on_epoch_start(model, device)
+            epoch_state = epoch_start_state(train_loader)
+        for batch in tqdm(batches, desc="Training on Labeled Data", initial=start_batch):
+            num_batches += 1
+            input_ids = batch['input_ids'].to(device)
+            attention_mask = batch['attention_mask'].to(device)
+            labels = batch['labels'].to(device)
+
+            # Refresh pseudo-labels according to the policy and draw a batch of confident ones
+            pseudo_cache.on_step(model, device, step)
+            pseudo_batch = pseudo_cache.sample_batch(input_ids.size(0), device)
+            step += 1
+
+            with autocast(device, precision):
+                # Forward pass on labeled data, together with its perturbed copy for the consistency loss
+                if epsilon > 0:
+                    outputs, regularization_loss = consistency_forward(model, input_ids, attention_mask, epsilon)
+                else:
+                    outputs = get_logits(model(input_ids=input_ids, attention_mask=attention_mask))
+                    regularization_loss = torch.zeros((), device=device)
+                labeled_loss = torch.nn.CrossEntropyLoss()(outputs, labels)
+
+                # Forward pass on pseudo-labeled data
+                if pseudo_batch is not None:
+                    pseudo_outputs = get_logits(model(input_ids=pseudo_batch['input_ids'],
+                                                      attention_mask=pseudo_batch['attention_mask']))
+                    pseudo_loss = torch.nn.CrossEntropyLoss()(pseudo_outputs, pseudo_batch['labels'])
+                else:
+                    pseudo_loss = torch.zeros((), device=device)
+
+                # Combine losses
+                loss = labeled_loss + pseudo_loss + regularization_loss
+            total_loss += loss.item()
+            num_samples += labels.size(0)
+
+            # Backpropagation, stepping once every accumulation_steps micro-batches
+            scaler.scale(loss / accumulation_steps).backward()
+            if num_batches % accumulation_steps == 0:
+                optimizer_step(model, optimizer, scaler, max_grad_norm)
+                updates += 1
+                if checkpoints is not None and checkpoints.due(updates):
+                    checkpoints.save(updates, training_state(
+                        model, optimizer, scaler, epoch, start_batch + num_batches, updates, epoch_state,
+                        step=step, pseudo_cache=pseudo_cache.state_dict()))
+
+        if num_batches % accumulation_steps:
+            optimizer_step(model, optimizer, scaler, max_grad_norm)
+            updates += 1
+        epoch_seconds = time.perf_counter() - epoch_start
+
+        print(f"Epoch {epoch + 1} - Loss: {total_loss / max(num_batches, 1):.4f} | "
+              f"Pseudo-labeled: {len(pseudo_cache)} | Rows scored so far: {pseudo_cache.rows_scored}")
+        report = {
+            'epoch': epoch,
+            'loss': total_loss / max(num_batches, 1),
+            'samples_per_second': num_samples / epoch_seconds if epoch_seconds else 0.0,
+            'step_seconds': epoch_seconds / max(num_batches, 1),
+            'peak_memory_mb': peak_memory_mb(device),
+            **configuration,
+        }
+        print(f"Throughput: {report['samples_per_second']:.1f} samples/s")
+        print_memory_report(report, num_batches)
+
+        # Evaluate on validation set
+        metrics = evaluate_model(model, val_loader, device)
+        history.append({**report, 'val_accuracy': metrics['accuracy']})
+
+    if checkpoints is not None:
+        checkpoints.wait()
+    return history